@@ -1,21 +1,34 @@
 """
 Appointment Service - Handles booking, rescheduling, and cancellation
 """
-from fastapi import FastAPI, HTTPException, Depends, Query, Header
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from datetime import datetime, timedelta
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import or_, select
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
 import structlog
 import httpx
+import asyncio
 import os
 from uuid import uuid4
 
-from database import get_db, init_db
+from database import get_db, get_async_db, init_db, SessionLocal, async_engine
+from http_client import init_clients, get_client, close_clients, pool_stats
+from schedule_index import ScheduleIndex
+from idempotency import IdempotencyStore, request_fingerprint
+from outbox import OutboxDispatcher, enqueue
+import capacity
+from pagination import paginate
+from export import EXPORT_FORMATS, export_table
 from models import (
     Appointment, AppointmentCreate, AppointmentUpdate,
-    AppointmentResponse, AppointmentStatus
+    AppointmentResponse, AppointmentStatus,
+    AppointmentBatchCreate, AppointmentBatchResult, AppointmentBatchResponse
 )
 
 logger = structlog.get_logger()
@@ -35,6 +48,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 PATIENT_SERVICE_URL = os.getenv("PATIENT_SERVICE_URL", "http://localhost:8001")
@@ -47,38 +61,80 @@ MIN_LEAD_TIME_HOURS = 2
 MAX_RESCHEDULES = 2
 RESCHEDULE_CUTOFF_HOURS = 1
 SLOT_DURATION_MINUTES = 30
+MAX_DAILY_APPOINTMENTS = 8
+MAX_BOOKED_SLOTS_DAYS = 92
+MAX_BOOKED_SLOTS_DOCTORS = 100
+
+# In-memory conflict index; the appointments table remains the source of truth
+schedule_index = ScheduleIndex()
+
+# Idempotency-Key records (durable) with an in-process LRU in front
+idempotency_store = IdempotencyStore()
+
+# Delivers billing/notification side effects committed to the outbox
+outbox_dispatcher = OutboxDispatcher()
 
 @app.on_event("startup")
 async def startup():
     init_db()
+    db = SessionLocal()
+    try:
+        schedule_index.build(db)
+        capacity.ensure_built(db)
+    finally:
+        db.close()
+    logger.info("schedule_index_built", **schedule_index.stats())
+    init_clients({
+        "patient": PATIENT_SERVICE_URL,
+        "doctor": DOCTOR_SERVICE_URL,
+        "billing": BILLING_SERVICE_URL,
+        "notification": NOTIFICATION_SERVICE_URL
+    })
+    outbox_dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await outbox_dispatcher.stop()
+    await close_clients()
+    await async_engine.dispose()
 
 async def verify_patient(patient_id: int) -> bool:
     """Verify patient exists"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{PATIENT_SERVICE_URL}/v1/patients/{patient_id}/exists")
-            return response.json().get("exists", False)
-        except:
-            return False
+    try:
+        response = await get_client("patient").get(f"/v1/patients/{patient_id}/exists")
+        return response.json().get("exists", False)
+    except:
+        return False
+
+async def verify_patients(patient_ids: List[int]) -> Dict[int, bool]:
+    """Verify many patients in one call (all False if the check fails)"""
+    if not patient_ids:
+        return {}
+    try:
+        response = await get_client("patient").post("/v1/patients/exists", json={"ids": patient_ids})
+        response.raise_for_status()
+        return {int(patient_id): exists for patient_id, exists in response.json()["exists"].items()}
+    except (httpx.HTTPError, KeyError, ValueError):
+        return {patient_id: False for patient_id in patient_ids}
 
 async def verify_doctor(doctor_id: int, department: Optional[str] = None) -> dict:
     """Verify doctor exists and get department"""
-    async with httpx.AsyncClient() as client:
-        try:
-            if department:
-                # Verify department matches
-                response = await client.get(f"{DOCTOR_SERVICE_URL}/v1/doctors/{doctor_id}/department")
-                dept = response.json().get("department")
-                if dept != department:
-                    raise HTTPException(status_code=400, detail=f"Doctor does not belong to department {department}")
-            else:
-                response = await client.get(f"{DOCTOR_SERVICE_URL}/v1/doctors/{doctor_id}")
-            
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Doctor not found")
-            raise
+    client = get_client("doctor")
+    try:
+        if department:
+            # Verify department matches
+            response = await client.get(f"/v1/doctors/{doctor_id}/department")
+            dept = response.json().get("department")
+            if dept != department:
+                raise HTTPException(status_code=400, detail=f"Doctor does not belong to department {department}")
+        else:
+            response = await client.get(f"/v1/doctors/{doctor_id}")
+        
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        raise
 
 def validate_slot(slot_start: datetime, slot_end: datetime):
     """Validate slot timing"""
@@ -101,112 +157,214 @@ def validate_slot(slot_start: datetime, slot_end: datetime):
     if duration != SLOT_DURATION_MINUTES:
         raise HTTPException(status_code=400, detail=f"Appointment must be exactly {SLOT_DURATION_MINUTES} minutes")
 
-async def notify_service(event_type: str, data: dict):
-    """Send notification to notification service"""
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{NOTIFICATION_SERVICE_URL}/v1/notifications",
-                json={"event_type": event_type, "data": data}
-            )
-        except:
-            logger.warning("notification_service_unavailable", event_type=event_type)
+async def get_doctor_department(doctor_id: int) -> Optional[str]:
+    """Get a doctor's department, or None if the doctor does not exist"""
+    response = await get_client("doctor").get(f"/v1/doctors/{doctor_id}/department")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json().get("department")
+
+async def verify_participants(patient_id: int, doctor_id: int, department: Optional[str] = None) -> dict:
+    """Verify patient and doctor concurrently (one network round trip)"""
+    patient_exists, doctor = await asyncio.gather(
+        verify_patient(patient_id),
+        verify_doctor(doctor_id, department),
+        return_exceptions=True
+    )
+    
+    # Keep error precedence deterministic: patient first, then doctor
+    if patient_exists is not True:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    if isinstance(doctor, BaseException):
+        raise doctor
+    
+    return doctor
+
+def check_booking_conflicts(appointment: AppointmentCreate):
+    """Check doctor/patient overlaps (the daily cap is enforced by `capacity.reserve`)
+    
+    The index includes holds of bookings not committed yet (e.g. earlier items of a batch).
+    """
+    # Check for overlapping appointments for the same doctor
+    if schedule_index.doctor_conflict(
+        appointment.doctor_id, appointment.slot_start, appointment.slot_end,
+        statuses=("SCHEDULED", "COMPLETED")
+    ) is not None:
+        raise HTTPException(status_code=409, detail="Doctor has a conflicting appointment")
+    
+    # Check for patient having overlapping appointments
+    if schedule_index.patient_conflict(
+        appointment.patient_id, appointment.slot_start, appointment.slot_end,
+        statuses=("SCHEDULED",)
+    ) is not None:
+        raise HTTPException(status_code=409, detail="Patient has a conflicting appointment")
+
+async def recheck_booking_conflicts(
+    db: AsyncSession,
+    doctor_id: int,
+    patient_id: Optional[int],
+    slot_start: datetime,
+    slot_end: datetime,
+    doctor_statuses=("SCHEDULED", "COMPLETED"),
+    exclude_id: Optional[int] = None
+):
+    """Repeat the overlap checks against the database inside the write transaction
+    
+    The schedule index only sees this process's bookings; this catches those
+    committed by other replicas sharing the database. Call it after
+    `capacity.reserve` or `capacity.lock`, whose lock on the doctor's day
+    serializes it with other bookings of the doctor; the patient's day is
+    locked here. Pass `patient_id=None` to skip the patient check.
+    """
+    overlaps = (Appointment.slot_start < slot_end, Appointment.slot_end > slot_start)
+    doctor_overlap = select(Appointment.appointment_id).where(
+        Appointment.doctor_id == doctor_id,
+        Appointment.status.in_(doctor_statuses),
+        *overlaps
+    )
+    if exclude_id is not None:
+        doctor_overlap = doctor_overlap.where(Appointment.appointment_id != exclude_id)
+    if (await db.execute(doctor_overlap.limit(1))).first() is not None:
+        raise HTTPException(status_code=409, detail="Doctor has a conflicting appointment")
+    
+    if patient_id is None:
+        return
+    await capacity.lock_patient_day(db, patient_id, slot_start.date())
+    patient_overlap = select(Appointment.appointment_id).where(
+        Appointment.patient_id == patient_id,
+        Appointment.status == "SCHEDULED",
+        *overlaps
+    )
+    if (await db.execute(patient_overlap.limit(1))).first() is not None:
+        raise HTTPException(status_code=409, detail="Patient has a conflicting appointment")
+
+def notify_service(db: AsyncSession, appointment_id: int, event_type: str, data: dict):
+    """Stage a notification in the outbox (sent after the caller commits)"""
+    enqueue(db, appointment_id, "notification", "/v1/notifications", {"event_type": event_type, "data": data})
+
+def request_bill(db: AsyncSession, appointment: Appointment, amount: float):
+    """Stage bill creation in the outbox (sent after the caller commits)"""
+    enqueue(db, appointment.appointment_id, "billing", "/v1/bills", {
+        "patient_id": appointment.patient_id,
+        "appointment_id": appointment.appointment_id,
+        "department": appointment.department,
+        "amount": amount
+    })
+
+def publish_schedule_change(db: AsyncSession, appointment: Appointment):
+    """Stage the appointment's slot and status for doctor-service's availability cache"""
+    enqueue(db, appointment.appointment_id, "doctor", "/v1/events/appointments", {
+        "appointment_id": appointment.appointment_id,
+        "doctor_id": appointment.doctor_id,
+        "slot_start": appointment.slot_start.isoformat(),
+        "slot_end": appointment.slot_end.isoformat(),
+        "status": appointment.status
+    })
 
 @app.post("/v1/appointments", response_model=AppointmentResponse, status_code=201)
 async def book_appointment(
     appointment: AppointmentCreate,
     correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Book a new appointment (idempotent operation)"""
     if not correlation_id:
         correlation_id = str(uuid4())
     
-    # Check idempotency - if idempotency key provided, check for existing appointment
-    if idempotency_key:
-        # In a real system, you'd store idempotency_key in the appointment table
-        # For now, we'll use a combination of patient_id, doctor_id, and slot_start as idempotency
-        existing = db.query(Appointment).filter(
-            and_(
-                Appointment.patient_id == appointment.patient_id,
-                Appointment.doctor_id == appointment.doctor_id,
-                Appointment.slot_start == appointment.slot_start,
-                Appointment.status == "SCHEDULED"
-            )
-        ).first()
-        
-        if existing:
-            logger.info(
-                "appointment_already_exists",
-                appointment_id=existing.appointment_id,
-                idempotency_key=idempotency_key,
-                correlation_id=correlation_id
-            )
-            return existing
-    
-    # Verify patient exists
-    if not await verify_patient(appointment.patient_id):
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
-    # Verify doctor exists and department matches
-    doctor = await verify_doctor(appointment.doctor_id, appointment.department)
+    if not idempotency_key:
+        return await create_appointment(appointment, correlation_id, db)
+    
+    # Replays return the stored response without touching appointments or other services
+    fingerprint = request_fingerprint(jsonable_encoder(appointment))
+    replay = await idempotency_store.begin(db, idempotency_key, fingerprint)
+    if replay:
+        logger.info(
+            "appointment_idempotent_replay",
+            idempotency_key=idempotency_key,
+            correlation_id=correlation_id
+        )
+        return JSONResponse(status_code=replay.status_code, content=replay.body)
     
-    # Validate slot
+    try:
+        return await create_appointment(appointment, correlation_id, db, idempotency_key, fingerprint)
+    except BaseException as e:
+        idempotency_store.fail(idempotency_key, e)
+        raise
+
+async def create_appointment(
+    appointment: AppointmentCreate,
+    correlation_id: str,
+    db: AsyncSession,
+    idempotency_key: Optional[str] = None,
+    fingerprint: Optional[str] = None
+):
+    """Validate and insert an appointment; the idempotency record commits with it"""
+    # Pure-local checks first so bad requests fail without any network calls
     validate_slot(appointment.slot_start, appointment.slot_end)
     
-    # Check for overlapping appointments for the same doctor
-    overlapping = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.status.in_(["SCHEDULED", "COMPLETED"]),
-            Appointment.slot_start < appointment.slot_end,
-            Appointment.slot_end > appointment.slot_start
-        )
-    ).first()
+    # Verify patient exists and doctor/department match concurrently
+    doctor = await verify_participants(appointment.patient_id, appointment.doctor_id, appointment.department)
     
-    if overlapping:
-        raise HTTPException(status_code=409, detail="Doctor has a conflicting appointment")
+    check_booking_conflicts(appointment)
     
-    # Check for patient having overlapping appointments
-    patient_overlap = db.query(Appointment).filter(
-        and_(
-            Appointment.patient_id == appointment.patient_id,
-            Appointment.status == "SCHEDULED",
-            Appointment.slot_start < appointment.slot_end,
-            Appointment.slot_end > appointment.slot_start
+    # Hold the slot in the index so concurrent bookings see it while this one commits
+    hold_id = schedule_index.hold(
+        appointment.patient_id, appointment.doctor_id, appointment.slot_start, appointment.slot_end
+    )
+    try:
+        # Check doctor's daily appointment cap (max 8 appointments/day)
+        if not await capacity.reserve(db, appointment.doctor_id, appointment.slot_start.date(), MAX_DAILY_APPOINTMENTS):
+            raise HTTPException(status_code=400, detail="Doctor has reached maximum daily appointments")
+        await recheck_booking_conflicts(
+            db, appointment.doctor_id, appointment.patient_id, appointment.slot_start, appointment.slot_end
         )
-    ).first()
-    
-    if patient_overlap:
-        raise HTTPException(status_code=409, detail="Patient has a conflicting appointment")
-    
-    # Check doctor's daily appointment cap (max 8 appointments/day)
-    appointment_date = appointment.slot_start.date()
-    doctor_appointments = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.slot_start >= datetime.combine(appointment_date, datetime.min.time()),
-            Appointment.slot_start < datetime.combine(appointment_date + timedelta(days=1), datetime.min.time())
+        
+        # Create appointment
+        db_appointment = Appointment(
+            patient_id=appointment.patient_id,
+            doctor_id=appointment.doctor_id,
+            department=appointment.department,
+            slot_start=appointment.slot_start,
+            slot_end=appointment.slot_end,
+            status="SCHEDULED"
         )
-    ).count()
-    
-    if doctor_appointments >= 8:
-        raise HTTPException(status_code=400, detail="Doctor has reached maximum daily appointments")
-    
-    # Create appointment
-    db_appointment = Appointment(
-        patient_id=appointment.patient_id,
-        doctor_id=appointment.doctor_id,
-        department=appointment.department,
-        slot_start=appointment.slot_start,
-        slot_end=appointment.slot_end,
-        status="SCHEDULED"
-    )
-    
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
+        
+        db.add(db_appointment)
+        await db.flush()
+        notify_service(db, db_appointment.appointment_id, "APPOINTMENT_CONFIRMED", {
+            "appointment_id": db_appointment.appointment_id,
+            "patient_id": appointment.patient_id,
+            "doctor_id": appointment.doctor_id,
+            "slot_start": appointment.slot_start.isoformat()
+        })
+        publish_schedule_change(db, db_appointment)
+        
+        if idempotency_key:
+            await db.refresh(db_appointment)
+            body = jsonable_encoder(AppointmentResponse.model_validate(db_appointment))
+            idempotency_store.stage(db, idempotency_key, fingerprint, 201, body)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # The same key was committed concurrently by another worker
+                await db.rollback()
+                stored = await idempotency_store.load(db, idempotency_key)
+                if stored is None:
+                    raise
+                if stored.fingerprint != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+                idempotency_store.complete(idempotency_key, stored.fingerprint, stored.status_code, stored.body)
+                return JSONResponse(status_code=stored.status_code, content=stored.body)
+            idempotency_store.complete(idempotency_key, fingerprint, 201, body)
+        else:
+            await db.commit()
+            await db.refresh(db_appointment)
+        schedule_index.add(db_appointment)
+        outbox_dispatcher.wake()
+    finally:
+        schedule_index.remove(hold_id)
     
     logger.info(
         "appointment_created",
@@ -216,29 +374,147 @@ async def book_appointment(
         correlation_id=correlation_id
     )
     
-    # Send notification
-    await notify_service("APPOINTMENT_CONFIRMED", {
-        "appointment_id": db_appointment.appointment_id,
-        "patient_id": appointment.patient_id,
-        "doctor_id": appointment.doctor_id,
-        "slot_start": appointment.slot_start.isoformat()
-    })
-    
     return db_appointment
 
+@app.post("/v1/appointments:batch", response_model=AppointmentBatchResponse)
+async def book_appointments_batch(
+    batch: AppointmentBatchCreate,
+    correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Book many appointments in one transaction, with a result per item"""
+    if not correlation_id:
+        correlation_id = str(uuid4())
+    
+    items = batch.items
+    errors = {}
+    
+    # Pure-local checks first
+    for i, item in enumerate(items):
+        try:
+            validate_slot(item.slot_start, item.slot_end)
+        except HTTPException as e:
+            errors[i] = (e.status_code, e.detail)
+    
+    # Verify all patients in one call and each distinct doctor once, concurrently
+    pending = [i for i in range(len(items)) if i not in errors]
+    patient_ids = sorted({items[i].patient_id for i in pending})
+    doctor_ids = sorted({items[i].doctor_id for i in pending})
+    patients, *lookups = await asyncio.gather(
+        verify_patients(patient_ids),
+        *(get_doctor_department(doctor_id) for doctor_id in doctor_ids),
+        return_exceptions=True
+    )
+    departments = dict(zip(doctor_ids, lookups))
+    
+    # Check each item against the index (which holds earlier items of the batch)
+    # and take its slot of the doctor's daily cap before deciding the next one,
+    # so an item rejected for the cap never blocks a later one
+    created = {}
+    holds = []
+    try:
+        for i in pending:
+            item = items[i]
+            department = departments[item.doctor_id]
+            if patients.get(item.patient_id) is not True:
+                errors[i] = (404, "Patient not found")
+            elif isinstance(department, BaseException):
+                errors[i] = (503, "Doctor service unavailable")
+            elif department is None:
+                errors[i] = (404, "Doctor not found")
+            elif department != item.department:
+                errors[i] = (400, f"Doctor does not belong to department {item.department}")
+            else:
+                try:
+                    check_booking_conflicts(item)
+                except HTTPException as e:
+                    errors[i] = (e.status_code, e.detail)
+                    continue
+                # Held before the await below, so concurrent bookings see the slot while this commits
+                hold_id = schedule_index.hold(item.patient_id, item.doctor_id, item.slot_start, item.slot_end)
+                holds.append(hold_id)
+                if not await capacity.reserve(db, item.doctor_id, item.slot_start.date(), MAX_DAILY_APPOINTMENTS):
+                    schedule_index.remove(holds.pop())
+                    errors[i] = (400, "Doctor has reached maximum daily appointments")
+                    continue
+                try:
+                    await recheck_booking_conflicts(db, item.doctor_id, item.patient_id, item.slot_start, item.slot_end)
+                except HTTPException as e:
+                    await capacity.release(db, item.doctor_id, item.slot_start.date())
+                    schedule_index.remove(holds.pop())
+                    errors[i] = (e.status_code, e.detail)
+                    continue
+                created[i] = Appointment(
+                    patient_id=item.patient_id,
+                    doctor_id=item.doctor_id,
+                    department=item.department,
+                    slot_start=item.slot_start,
+                    slot_end=item.slot_end,
+                    status="SCHEDULED"
+                )
+        
+        # Insert all accepted items in one transaction
+        if created:
+            db.add_all(created.values())
+            await db.flush()
+            appointment_ids = []
+            for appointment in created.values():
+                appointment_ids.append(appointment.appointment_id)
+                notify_service(db, appointment.appointment_id, "APPOINTMENT_CONFIRMED", {
+                    "appointment_id": appointment.appointment_id,
+                    "patient_id": appointment.patient_id,
+                    "doctor_id": appointment.doctor_id,
+                    "slot_start": appointment.slot_start.isoformat()
+                })
+                publish_schedule_change(db, appointment)
+            await db.commit()
+            # One query to load server defaults for every created row
+            await db.execute(
+                select(Appointment).where(Appointment.appointment_id.in_(appointment_ids)),
+                execution_options={"populate_existing": True}
+            )
+            for appointment in created.values():
+                schedule_index.add(appointment)
+            outbox_dispatcher.wake()
+    finally:
+        for hold_id in holds:
+            schedule_index.remove(hold_id)
+    
+    logger.info(
+        "appointments_batch_created",
+        requested=len(items),
+        created=len(created),
+        failed=len(errors),
+        correlation_id=correlation_id
+    )
+    
+    results = []
+    for i in range(len(items)):
+        if i in created:
+            results.append(AppointmentBatchResult(
+                index=i,
+                status_code=201,
+                appointment=AppointmentResponse.model_validate(created[i])
+            ))
+        else:
+            status_code, detail = errors[i]
+            results.append(AppointmentBatchResult(index=i, status_code=status_code, detail=detail))
+    
+    return AppointmentBatchResponse(created=len(created), failed=len(errors), results=results)
+
 @app.post("/v1/appointments/{appointment_id}/reschedule")
 async def reschedule_appointment(
     appointment_id: int,
     new_slot_start: datetime = Query(...),
     new_slot_end: datetime = Query(...),
     correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Reschedule an appointment"""
     if not correlation_id:
         correlation_id = str(uuid4())
     
-    appointment = db.query(Appointment).filter(Appointment.appointment_id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -262,26 +538,48 @@ async def reschedule_appointment(
     validate_slot(new_slot_start, new_slot_end)
     
     # Check conflicts
-    overlapping = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.appointment_id != appointment_id,
-            Appointment.status.in_(["SCHEDULED"]),
-            Appointment.slot_start < new_slot_end,
-            Appointment.slot_end > new_slot_start
-        )
-    ).first()
+    overlapping = schedule_index.doctor_conflict(
+        appointment.doctor_id, new_slot_start, new_slot_end,
+        statuses=("SCHEDULED",), exclude_id=appointment_id
+    )
     
-    if overlapping:
+    if overlapping is not None:
         raise HTTPException(status_code=409, detail="Doctor has a conflicting appointment at this time")
     
-    # Update appointment
-    appointment.slot_start = new_slot_start
-    appointment.slot_end = new_slot_end
-    appointment.reschedule_count = appointment.reschedule_count + 1
-    
-    db.commit()
-    db.refresh(appointment)
+    # Hold the new slot in the index while the change commits
+    hold_id = schedule_index.hold(appointment.patient_id, appointment.doctor_id, new_slot_start, new_slot_end)
+    try:
+        # Move the appointment to the new day's counter
+        if new_slot_start.date() != appointment.slot_start.date():
+            if not await capacity.reserve(db, appointment.doctor_id, new_slot_start.date(), MAX_DAILY_APPOINTMENTS):
+                raise HTTPException(status_code=400, detail="Doctor has reached maximum daily appointments")
+            await capacity.release(db, appointment.doctor_id, appointment.slot_start.date())
+        else:
+            await capacity.lock(db, appointment.doctor_id, new_slot_start.date())
+        try:
+            await recheck_booking_conflicts(
+                db, appointment.doctor_id, None, new_slot_start, new_slot_end,
+                doctor_statuses=("SCHEDULED",), exclude_id=appointment_id
+            )
+        except HTTPException:
+            raise HTTPException(status_code=409, detail="Doctor has a conflicting appointment at this time")
+        
+        # Update appointment
+        appointment.slot_start = new_slot_start
+        appointment.slot_end = new_slot_end
+        appointment.reschedule_count = appointment.reschedule_count + 1
+        notify_service(db, appointment_id, "APPOINTMENT_RESCHEDULED", {
+            "appointment_id": appointment_id,
+            "new_slot_start": new_slot_start.isoformat()
+        })
+        publish_schedule_change(db, appointment)
+        
+        await db.commit()
+        await db.refresh(appointment)
+        schedule_index.update(appointment)
+        outbox_dispatcher.wake()
+    finally:
+        schedule_index.remove(hold_id)
     
     logger.info(
         "appointment_rescheduled",
@@ -290,24 +588,19 @@ async def reschedule_appointment(
         correlation_id=correlation_id
     )
     
-    await notify_service("APPOINTMENT_RESCHEDULED", {
-        "appointment_id": appointment_id,
-        "new_slot_start": new_slot_start.isoformat()
-    })
-    
     return appointment
 
 @app.post("/v1/appointments/{appointment_id}/cancel")
 async def cancel_appointment(
     appointment_id: int,
     correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cancel an appointment"""
     if not correlation_id:
         correlation_id = str(uuid4())
     
-    appointment = db.query(Appointment).filter(Appointment.appointment_id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -320,14 +613,7 @@ async def cancel_appointment(
     hours_until_slot = (appointment.slot_start - now).total_seconds() / 3600
     
     appointment.status = "CANCELLED"
-    db.commit()
-    
-    logger.info(
-        "appointment_cancelled",
-        appointment_id=appointment_id,
-        hours_until_slot=hours_until_slot,
-        correlation_id=correlation_id
-    )
+    await capacity.release(db, appointment.doctor_id, appointment.slot_start.date())
     
     # Handle billing
     if hours_until_slot > 2:
@@ -341,10 +627,22 @@ async def cancel_appointment(
         # No-show fee
         pass
     
-    await notify_service("APPOINTMENT_CANCELLED", {
+    notify_service(db, appointment_id, "APPOINTMENT_CANCELLED", {
         "appointment_id": appointment_id,
         "refund_info": "Full refund" if hours_until_slot > 2 else "50% refund"
     })
+    publish_schedule_change(db, appointment)
+    
+    await db.commit()
+    schedule_index.update(appointment)
+    outbox_dispatcher.wake()
+    
+    logger.info(
+        "appointment_cancelled",
+        appointment_id=appointment_id,
+        hours_until_slot=hours_until_slot,
+        correlation_id=correlation_id
+    )
     
     return appointment
 
@@ -352,13 +650,13 @@ async def cancel_appointment(
 async def complete_appointment(
     appointment_id: int,
     correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark appointment as completed"""
     if not correlation_id:
         correlation_id = str(uuid4())
     
-    appointment = db.query(Appointment).filter(Appointment.appointment_id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -367,78 +665,67 @@ async def complete_appointment(
         raise HTTPException(status_code=400, detail="Only scheduled appointments can be completed")
     
     appointment.status = "COMPLETED"
-    db.commit()
-    db.refresh(appointment)
-    
-    logger.info("appointment_completed", appointment_id=appointment_id, correlation_id=correlation_id)
     
     # Create bill
-    async with httpx.AsyncClient() as client:
-        try:
-            bill_response = await client.post(
-                f"{BILLING_SERVICE_URL}/v1/bills",
-                json={
-                    "patient_id": appointment.patient_id,
-                    "appointment_id": appointment_id,
-                    "amount": 500  # Base consultation fee
-                }
-            )
-            logger.info("bill_created", appointment_id=appointment_id, bill_id=bill_response.json().get("bill_id"))
-        except:
-            logger.warning("billing_service_unavailable", appointment_id=appointment_id)
+    request_bill(db, appointment, 500)  # Base consultation fee
     
-    await notify_service("APPOINTMENT_COMPLETED", {
+    notify_service(db, appointment_id, "APPOINTMENT_COMPLETED", {
         "appointment_id": appointment_id,
         "bill_required": True
     })
     
+    await db.commit()
+    await db.refresh(appointment)
+    schedule_index.update(appointment)
+    outbox_dispatcher.wake()
+    
+    logger.info("appointment_completed", appointment_id=appointment_id, correlation_id=correlation_id)
+    
     return appointment
 
 @app.post("/v1/appointments/{appointment_id}/noshow")
 async def mark_no_show(
     appointment_id: int,
     correlation_id: Optional[str] = Header(None, alias="X-Correlation-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark appointment as no-show"""
     if not correlation_id:
         correlation_id = str(uuid4())
     
-    appointment = db.query(Appointment).filter(Appointment.appointment_id == appointment_id).first()
+    appointment = await db.get(Appointment, appointment_id)
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
+    if appointment.status in capacity.ACTIVE_STATUSES:
+        await capacity.release(db, appointment.doctor_id, appointment.slot_start.date())
     appointment.status = "NO_SHOW"
-    db.commit()
-    
-    logger.info("appointment_noshow", appointment_id=appointment_id, correlation_id=correlation_id)
     
     # Create bill for no-show
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{BILLING_SERVICE_URL}/v1/bills",
-                json={
-                    "patient_id": appointment.patient_id,
-                    "appointment_id": appointment_id,
-                    "amount": 250  # 50% no-show fee
-                }
-            )
-        except:
-            pass
+    request_bill(db, appointment, 250)  # 50% no-show fee
     
-    await notify_service("NO_SHOW", {
+    notify_service(db, appointment_id, "NO_SHOW", {
         "appointment_id": appointment_id,
         "rebook_link": f"/appointments/book?doctor_id={appointment.doctor_id}"
     })
+    publish_schedule_change(db, appointment)
+    
+    await db.commit()
+    schedule_index.update(appointment)
+    outbox_dispatcher.wake()
+    
+    logger.info("appointment_noshow", appointment_id=appointment_id, correlation_id=correlation_id)
     
     return appointment
 
 @app.get("/v1/appointments", response_model=List[AppointmentResponse])
 def get_appointments(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor; takes precedence over skip"),
+    include_total: bool = Query(False, description="Return the total match count in X-Total-Count"),
     patient_id: Optional[int] = None,
     doctor_id: Optional[int] = None,
     status: Optional[str] = None,
@@ -456,12 +743,71 @@ def get_appointments(
     if status:
         query = query.filter(Appointment.status == status)
     
-    total = query.count()
-    appointments = query.order_by(Appointment.slot_start.desc()).offset(skip).limit(limit).all()
+    total = query.count() if include_total else None
+    appointments, next_cursor = paginate(
+        query, Appointment.slot_start, Appointment.appointment_id, limit, skip, cursor
+    )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
     
     logger.info("appointments_retrieved", total=total, returned=len(appointments))
     return appointments
 
+@app.get("/v1/booked-slots")
+def get_booked_slots(
+    doctor_id: List[int] = Query(..., description="Repeat for several doctors"),
+    from_date: date = Query(..., alias="from", description="First day (YYYY-MM-DD)"),
+    to_date: date = Query(..., alias="to", description="Last day, inclusive (YYYY-MM-DD)")
+):
+    """Active appointments of one or more doctors in a date range, from the in-memory index"""
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (to_date - from_date).days >= MAX_BOOKED_SLOTS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_BOOKED_SLOTS_DAYS} days")
+    if len(doctor_id) > MAX_BOOKED_SLOTS_DOCTORS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BOOKED_SLOTS_DOCTORS} doctors per request")
+    
+    start = datetime.combine(from_date, datetime.min.time())
+    end = datetime.combine(to_date + timedelta(days=1), datetime.min.time())
+    appointments = []
+    for doctor in dict.fromkeys(doctor_id):
+        for slot_start, appointment_id, slot_end, status in schedule_index.doctor_slots(
+            doctor, start, end, statuses=capacity.ACTIVE_STATUSES
+        ):
+            appointments.append({
+                "appointment_id": appointment_id,
+                "doctor_id": doctor,
+                "slot_start": slot_start,
+                "slot_end": slot_end,
+                "status": status
+            })
+    
+    return {
+        "doctor_ids": list(dict.fromkeys(doctor_id)),
+        "from": from_date,
+        "to": to_date,
+        "daily_cap": MAX_DAILY_APPOINTMENTS,
+        "appointments": appointments
+    }
+
+@app.get("/v1/appointments/export")
+def export_appointments(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    updated_since: Optional[datetime] = Query(None, description="Only rows updated at or after this time (ISO 8601)")
+):
+    """Stream every appointment (or those updated since a time) as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    return StreamingResponse(
+        export_table(Appointment, format, updated_since),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=appointments.{format}"}
+    )
+
 @app.get("/v1/appointments/{appointment_id}", response_model=AppointmentResponse)
 def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
     """Get appointment by ID"""
@@ -476,6 +822,47 @@ def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
 def health_check():
     return {"status": "healthy", "service": "appointment-service"}
 
+@app.get("/v1/metrics/http-pools")
+def get_http_pool_stats():
+    """Connection pool statistics for inter-service clients"""
+    return pool_stats()
+
+@app.get("/v1/metrics/idempotency")
+def get_idempotency_stats():
+    """Idempotency cache statistics"""
+    return idempotency_store.stats()
+
+@app.get("/v1/metrics/outbox")
+def get_outbox_stats(db: Session = Depends(get_db)):
+    """Outbox queue depth, lag and delivery counters"""
+    return outbox_dispatcher.stats(db)
+
+@app.get("/v1/metrics/schedule-index")
+def get_schedule_index_stats():
+    """Size of the in-memory conflict index"""
+    return schedule_index.stats()
+
+@app.post("/v1/admin/schedule-index/check")
+async def check_schedule_index(
+    repair: bool = Query(False, description="Rebuild the index if it is inconsistent"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Compare the in-memory conflict index with the appointments table"""
+    result = await db.run_sync(schedule_index.check)
+    
+    if not result["consistent"]:
+        logger.warning(
+            "schedule_index_inconsistent",
+            missing=len(result["missing"]),
+            unexpected=len(result["unexpected"]),
+            stale=len(result["stale"])
+        )
+        if repair:
+            await db.run_sync(schedule_index.rebuild)
+            result["repaired"] = True
+    
+    return result
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,121 @@
+"""Materialized per-doctor, per-day booking counters (`doctor_day_load`)
+
+Handlers change a counter in the same transaction as the appointment, so the
+daily cap is one conditional UPDATE on an indexed row: it only succeeds while
+the day is below the cap, which also serializes concurrent bookings of the
+same doctor-day. Only active appointments count; `rebuild` recomputes every
+counter from the appointments table.
+
+`lock` and `lock_patient_day` take the same kind of per-day lock without
+booking anything, for the overlap recheck in the write transaction.
+"""
+from datetime import date
+
+import structlog
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Appointment, DoctorDayLoad
+
+logger = structlog.get_logger()
+
+# Statuses that occupy one of the doctor's daily slots
+ACTIVE_STATUSES = ("SCHEDULED", "COMPLETED")
+
+def _insert_first(dialect: str, doctor_id: int, day: date):
+    """INSERT the day's row at 1, doing nothing if it already exists"""
+    values = {"doctor_id": doctor_id, "day": day, "booked": 1}
+    if dialect == "postgresql":
+        return postgresql.insert(DoctorDayLoad).values(**values).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(DoctorDayLoad).values(**values).on_conflict_do_nothing()
+    return insert(DoctorDayLoad).values(**values)
+
+async def reserve(db: AsyncSession, doctor_id: int, day: date, limit: int) -> bool:
+    """Take one of the doctor's slots for the day; False if the day is full"""
+    increment = (
+        update(DoctorDayLoad)
+        .where(
+            DoctorDayLoad.doctor_id == doctor_id,
+            DoctorDayLoad.day == day,
+            DoctorDayLoad.booked < limit
+        )
+        .values(booked=DoctorDayLoad.booked + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if (await db.execute(increment)).rowcount:
+        return True
+
+    # No row yet (first booking of the day) or the day is full
+    if (await db.execute(_insert_first(db.bind.dialect.name, doctor_id, day))).rowcount:
+        return True
+
+    # The row was created by a concurrent booking in between
+    return (await db.execute(increment)).rowcount == 1
+
+async def release(db: AsyncSession, doctor_id: int, day: date):
+    """Give back a slot taken by `reserve`"""
+    await db.execute(
+        update(DoctorDayLoad)
+        .where(
+            DoctorDayLoad.doctor_id == doctor_id,
+            DoctorDayLoad.day == day,
+            DoctorDayLoad.booked > 0
+        )
+        .values(booked=DoctorDayLoad.booked - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+async def lock(db: AsyncSession, doctor_id: int, day: date):
+    """Lock the doctor's day as `reserve` does, without taking a slot"""
+    await db.execute(
+        update(DoctorDayLoad)
+        .where(DoctorDayLoad.doctor_id == doctor_id, DoctorDayLoad.day == day)
+        .values(booked=DoctorDayLoad.booked)
+        .execution_options(synchronize_session=False)
+    )
+
+async def lock_patient_day(db: AsyncSession, patient_id: int, day: date):
+    """Serialize bookings of one patient-day until the transaction ends
+
+    A transaction-scoped advisory lock on PostgreSQL; SQLite already allows one
+    writer at a time, and callers have written (`reserve`) before this.
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(select(func.pg_advisory_xact_lock(patient_id, day.toordinal())))
+
+def rebuild(db: Session) -> int:
+    """Recompute all counters from the appointments table; returns the number of rows"""
+    day = func.date(Appointment.slot_start)
+    counts = db.query(
+        Appointment.doctor_id, day, func.count(Appointment.appointment_id)
+    ).filter(
+        Appointment.status.in_(ACTIVE_STATUSES)
+    ).group_by(Appointment.doctor_id, day).all()
+
+    rows = [
+        {
+            "doctor_id": doctor_id,
+            # SQLite returns date() as text
+            "day": date.fromisoformat(value) if isinstance(value, str) else value,
+            "booked": booked
+        }
+        for doctor_id, value, booked in counts
+    ]
+    db.query(DoctorDayLoad).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(DoctorDayLoad), rows)
+    db.commit()
+
+    logger.info("doctor_day_load_rebuilt", rows=len(rows))
+    return len(rows)
+
+def ensure_built(db: Session):
+    """Fill the counters on first start against an existing appointments table"""
+    if db.query(DoctorDayLoad.doctor_id).first() is not None:
+        return
+    if db.query(Appointment.appointment_id).filter(Appointment.status.in_(ACTIVE_STATUSES)).first() is None:
+        return
+    rebuild(db)
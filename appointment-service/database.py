@@ -1,18 +1,61 @@
 """Database configuration"""
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./appointment.db")
 
+def _async_url(url: str) -> str:
+    """Same database through an async driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith(("postgresql:", "postgres:", "postgresql+psycopg2:")):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Seconds a SQLite writer waits for the database lock
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 30))
+
+# Pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 )
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    # SQLite has a single writer: one connection makes sessions queue on the
+    # pool (without blocking the loop) instead of backing off on the file lock
+    **({
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT}
+    } if "sqlite" in ASYNC_DATABASE_URL else {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True
+    })
+)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects stay loaded after commit: lazy loads are not possible on an async session
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -22,7 +65,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Session for async handlers; queries do not block the event loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
-    from models import Appointment
+    from models import Appointment, IdempotencyKey, OutboxEvent, DoctorDayLoad
+    from migrations import run_migrations
     Base.metadata.create_all(bind=engine)
-
+    run_migrations(engine, Base.metadata)
@@ -0,0 +1,138 @@
+"""Idempotency-key store with a hot LRU layer and in-flight request collapsing"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import IdempotencyKey
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: dict
+
+def request_fingerprint(payload: dict) -> str:
+    """Stable hash of a JSON-serializable request payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class IdempotencyStore:
+    """Durable idempotency keys (idempotency_keys table) fronted by an LRU
+
+    Usage per keyed request:
+      replay = await store.begin(db, key, fingerprint)  # stored response, or None if we own the key
+      store.stage(db, key, fingerprint, status_code, body)  # before the commit that does the work
+      store.complete(key, fingerprint, status_code, body)  # after that commit
+      store.fail(key, exc)  # if the work raised
+    """
+
+    def __init__(self, capacity: int = IDEMPOTENCY_CACHE_SIZE):
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def _remember(self, key: str, stored: StoredResponse):
+        self._cache[key] = stored
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key: str) -> Optional[StoredResponse]:
+        stored = self._cache.get(key)
+        if stored is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return stored
+
+    async def load(self, db: AsyncSession, key: str) -> Optional[StoredResponse]:
+        """Look up a key in the LRU, then in the database"""
+        stored = self._cached(key)
+        if stored is not None:
+            return stored
+
+        record = await db.get(IdempotencyKey, key)
+        if record is None:
+            return None
+        stored = StoredResponse(record.request_fingerprint, record.status_code, json.loads(record.response_body))
+        self._remember(key, stored)
+        self.hits += 1
+        return stored
+
+    @staticmethod
+    def _check(stored: StoredResponse, fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return stored
+
+    async def begin(self, db: AsyncSession, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """Return the stored response for a key, or None if the caller should do the work"""
+        stored = await self.load(db, key)
+        if stored is not None:
+            return self._check(stored, fingerprint)
+
+        # End the lookup's read transaction so no lock is held across awaits
+        await db.rollback()
+
+        # No awaits from here until the key is registered. A request with this
+        # key may have completed during the awaits above, taking its in-flight
+        # entry with it; its response is in the LRU by now
+        stored = self._cached(key)
+        if stored is not None:
+            return self._check(stored, fingerprint)
+
+        # Another request with this key is running: wait for its outcome
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.collapsed += 1
+            in_flight_fingerprint, future = in_flight
+            result = await asyncio.shield(future)
+            return self._check(StoredResponse(in_flight_fingerprint, *result), fingerprint)
+
+        self.misses += 1
+        self._in_flight[key] = (fingerprint, asyncio.get_running_loop().create_future())
+        return None
+
+    def stage(self, db: AsyncSession, key: str, fingerprint: str, status_code: int, body: dict):
+        """Add the key record to the session so it commits with the work itself"""
+        db.add(IdempotencyKey(
+            key=key,
+            request_fingerprint=fingerprint,
+            status_code=status_code,
+            response_body=json.dumps(body)
+        ))
+
+    def complete(self, key: str, fingerprint: str, status_code: int, body: dict):
+        """Cache the committed response and release waiting duplicates"""
+        self._remember(key, StoredResponse(fingerprint, status_code, body))
+        in_flight = self._in_flight.pop(key, None)
+        if in_flight is not None:
+            in_flight[1].set_result((status_code, body))
+
+    def fail(self, key: str, exc: BaseException):
+        """Propagate a failure to waiting duplicates; the key stays unused"""
+        in_flight = self._in_flight.pop(key, None)
+        if in_flight is not None:
+            future = in_flight[1]
+            future.set_exception(exc)
+            # Mark as retrieved so a failure nobody waited for is not logged
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "capacity": self.capacity,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed
+        }
@@ -1,8 +1,8 @@
 """Database models and schemas"""
-from sqlalchemy import Column, Integer, String, DateTime, Integer as SQLInteger
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Index, Integer as SQLInteger
 from sqlalchemy.sql import func
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -18,14 +18,57 @@ class Appointment(Base):
     __tablename__ = "appointments"
     
     appointment_id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, nullable=False, index=True)
-    doctor_id = Column(Integer, nullable=False, index=True)
+    patient_id = Column(Integer, nullable=False)
+    doctor_id = Column(Integer, nullable=False)
     department = Column(String, nullable=False)
     slot_start = Column(DateTime, nullable=False, index=True)
     slot_end = Column(DateTime, nullable=False)
     status = Column(String, nullable=False, default="SCHEDULED")
     reschedule_count = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Client-side SQL default so rows inserted into a migrated table get it too
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
+    
+    # Hot paths filter on doctor/patient (+ status) and a slot range, sorted by slot_start.
+    # The (x_id, slot_start) indexes also serve plain doctor_id/patient_id filters.
+    __table_args__ = (
+        Index("ix_appointments_doctor_status_slot", "doctor_id", "status", "slot_start"),
+        Index("ix_appointments_patient_status_slot", "patient_id", "status", "slot_start"),
+        Index("ix_appointments_doctor_slot", "doctor_id", "slot_start"),
+        Index("ix_appointments_patient_slot", "patient_id", "slot_start"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String, primary_key=True)
+    request_fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    
+    event_id = Column(Integer, primary_key=True, index=True)
+    appointment_id = Column(Integer, nullable=False, index=True)
+    target = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="PENDING", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+class DoctorDayLoad(Base):
+    __tablename__ = "doctor_day_load"
+    
+    # Active (SCHEDULED/COMPLETED) appointments per doctor and day
+    doctor_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    booked = Column(Integer, nullable=False, default=0)
 
 class AppointmentCreate(BaseModel):
     patient_id: int
@@ -53,3 +96,17 @@ class AppointmentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+class AppointmentBatchCreate(BaseModel):
+    items: List[AppointmentCreate] = Field(..., min_length=1, max_length=500)
+
+class AppointmentBatchResult(BaseModel):
+    index: int
+    status_code: int
+    appointment: Optional[AppointmentResponse] = None
+    detail: Optional[str] = None
+
+class AppointmentBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[AppointmentBatchResult]
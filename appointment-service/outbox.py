@@ -0,0 +1,240 @@
+"""Transactional outbox for appointment side effects (bills, notifications)
+
+Handlers stage events with `enqueue` in the same transaction as the status
+change. `OutboxDispatcher` delivers them in the background, in batches, with
+retries and exponential backoff. Events of one appointment are delivered in
+order per target service: a pending or backing-off event blocks the later
+ones for the same target only. Bill requests due in the same batch are sent
+to billing in one `/v1/bills:batch` call.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import structlog
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from http_client import get_client
+from models import OutboxEvent
+
+logger = structlog.get_logger()
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 1.0))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 300.0))
+
+def enqueue(db: AsyncSession, appointment_id: int, target: str, path: str, payload: dict):
+    """Stage an outbound call; it is committed with the caller's transaction"""
+    db.add(OutboxEvent(
+        appointment_id=appointment_id,
+        target=target,
+        path=path,
+        payload=json.dumps(payload),
+        status="PENDING",
+        attempts=0,
+        created_at=datetime.utcnow()
+    ))
+
+class OutboxDispatcher:
+    """Background task delivering pending outbox events"""
+
+    def __init__(self):
+        self._task = None
+        self._wake = asyncio.Event()
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_run_at = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Deliver newly committed events without waiting for the next poll"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("outbox_dispatch_failed", error=str(e))
+                delivered = 0
+
+            # A full batch means there may be more waiting
+            if delivered < OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def _load_batch(self) -> list:
+        """Due events in commit order, grouped into per-appointment, per-target chains"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            # An appointment/target pair with an event still backing off is blocked
+            blocked = select(OutboxEvent.appointment_id, OutboxEvent.target).where(
+                OutboxEvent.status == "PENDING",
+                OutboxEvent.next_attempt_at > now
+            )
+            events = (await db.scalars(
+                select(OutboxEvent).where(
+                    OutboxEvent.status == "PENDING",
+                    tuple_(OutboxEvent.appointment_id, OutboxEvent.target).notin_(blocked)
+                ).order_by(OutboxEvent.event_id).limit(OUTBOX_BATCH_SIZE)
+            )).all()
+
+            chains = {}
+            for event in events:
+                chains.setdefault((event.appointment_id, event.target), []).append({
+                    "event_id": event.event_id,
+                    "appointment_id": event.appointment_id,
+                    "target": event.target,
+                    "path": event.path,
+                    "payload": json.loads(event.payload),
+                    "attempts": event.attempts
+                })
+            return list(chains.values())
+
+    async def _deliver_chain(self, chain: list) -> list:
+        """Deliver one chain's events in order, stopping at the first failure"""
+        outcomes = []
+        for event in chain:
+            try:
+                response = await get_client(event["target"]).post(event["path"], json=event["payload"])
+                if response.status_code < 400:
+                    outcomes.append((event, None, False))
+                    continue
+                # Client errors will not succeed on retry
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                outcomes.append((event, error, response.status_code < 500))
+            except Exception as e:
+                outcomes.append((event, f"{type(e).__name__}: {e}", False))
+            break
+        return outcomes
+
+    async def _deliver_bills(self, chains: list) -> list:
+        """Deliver the bill requests heading `chains` in one batch call, then the rest of each chain"""
+        heads = [chain[0] for chain in chains]
+        try:
+            response = await get_client("billing").post(
+                "/v1/bills:batch", json={"items": [event["payload"] for event in heads]}
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            return [[(event, error, False)] for event in heads]
+        if 400 <= response.status_code < 500:
+            # Rejected as a whole (or not supported): one bad item must not fail the others
+            return await asyncio.gather(*(self._deliver_chain(chain) for chain in chains))
+        if response.status_code >= 500:
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            return [[(event, error, False)] for event in heads]
+
+        outcomes = []
+        for chain, result in zip(chains, response.json()["results"]):
+            # 409: the appointment already has a bill, e.g. created by an earlier attempt
+            # whose response was lost
+            if result["status_code"] < 400 or result["status_code"] == 409:
+                outcomes.append([(chain[0], None, False)])
+            else:
+                error = f"HTTP {result['status_code']}: {result['detail']}"
+                outcomes.append([(chain[0], error, result["status_code"] < 500)])
+        rest = [(i, chain[1:]) for i, chain in enumerate(chains) if len(chain) > 1 and outcomes[i][0][1] is None]
+        for (i, _), more in zip(rest, await asyncio.gather(*(self._deliver_chain(chain) for _, chain in rest))):
+            outcomes[i].extend(more)
+        return outcomes
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch; returns the number of events attempted"""
+        self.last_run_at = datetime.utcnow()
+        batch = await self._load_batch()
+        if not batch:
+            return 0
+
+        bills, others = [], []
+        for chain in batch:
+            (bills if (chain[0]["target"], chain[0]["path"]) == ("billing", "/v1/bills") else others).append(chain)
+        bill_results, *results = await asyncio.gather(
+            self._deliver_bills(bills) if bills else asyncio.sleep(0, []),
+            *(self._deliver_chain(chain) for chain in others)
+        )
+        results = [*bill_results, *results]
+
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            event_ids = [event["event_id"] for outcomes in results for event, _, _ in outcomes]
+            records = {
+                record.event_id: record
+                for record in await db.scalars(select(OutboxEvent).where(OutboxEvent.event_id.in_(event_ids)))
+            }
+            for outcomes in results:
+                for event, error, permanent in outcomes:
+                    record = records[event["event_id"]]
+                    record.attempts = event["attempts"] + 1
+                    if error is None:
+                        record.status = "DELIVERED"
+                        record.delivered_at = now
+                        record.last_error = None
+                        self.delivered += 1
+                    elif permanent or record.attempts >= OUTBOX_MAX_ATTEMPTS:
+                        record.status = "FAILED"
+                        record.last_error = error
+                        self.failed += 1
+                        logger.error(
+                            "outbox_event_failed",
+                            event_id=record.event_id,
+                            appointment_id=record.appointment_id,
+                            target=record.target,
+                            error=error
+                        )
+                    else:
+                        delay = min(OUTBOX_BACKOFF_BASE * 2 ** (record.attempts - 1), OUTBOX_BACKOFF_MAX)
+                        record.next_attempt_at = now + timedelta(seconds=delay)
+                        record.last_error = error
+                        self.retried += 1
+                        logger.warning(
+                            "outbox_event_retry",
+                            event_id=record.event_id,
+                            attempts=record.attempts,
+                            retry_in=delay,
+                            error=error
+                        )
+            await db.commit()
+            return len(event_ids)
+
+    def stats(self, db: Session) -> dict:
+        """Queue depth and lag of the outbox"""
+        pending, oldest = db.query(
+            func.count(OutboxEvent.event_id),
+            func.min(OutboxEvent.created_at)
+        ).filter(OutboxEvent.status == "PENDING").one()
+        failed = db.query(func.count(OutboxEvent.event_id)).filter(OutboxEvent.status == "FAILED").scalar()
+
+        return {
+            "pending": pending,
+            "failed": failed,
+            "lag_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+            "delivered_total": self.delivered,
+            "retried_total": self.retried,
+            "failed_total": self.failed,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None
+        }
@@ -0,0 +1,189 @@
+"""In-memory interval index for appointment conflict detection
+
+The appointments table stays the source of truth. The index is built from it
+at startup and updated by the handlers after every successful commit, so
+conflict checks become in-memory lookups instead of queries.
+The index only sees this process's writes, so with several replicas on one
+database the handlers repeat the overlap checks in the database inside the
+write transaction (`recheck_booking_conflicts`) before committing.
+Bookings that are still committing are indexed as holds (negative ids) so
+concurrent requests cannot pass the same check.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import count
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from models import Appointment
+
+class IntervalSet:
+    """Appointments of one doctor or patient, sorted by slot_start"""
+    __slots__ = ("entries", "max_duration")
+
+    def __init__(self):
+        # (slot_start, appointment_id, slot_end, status)
+        self.entries = []
+        self.max_duration = timedelta(0)
+
+    def add(self, slot_start: datetime, appointment_id: int, slot_end: datetime, status: str):
+        insort(self.entries, (slot_start, appointment_id, slot_end, status))
+        self.max_duration = max(self.max_duration, slot_end - slot_start)
+
+    def remove(self, slot_start: datetime, appointment_id: int):
+        i = bisect_left(self.entries, (slot_start, appointment_id))
+        if i < len(self.entries) and self.entries[i][:2] == (slot_start, appointment_id):
+            del self.entries[i]
+
+    def overlapping(
+        self,
+        slot_start: datetime,
+        slot_end: datetime,
+        statuses: Iterable[str],
+        exclude_id: Optional[int] = None
+    ) -> Optional[int]:
+        """Return the id of an appointment overlapping [slot_start, slot_end)"""
+        # Only entries starting in (slot_start - max_duration, slot_end) can overlap
+        lo = bisect_left(self.entries, (slot_start - self.max_duration,))
+        hi = bisect_left(self.entries, (slot_end,))
+        for start, appointment_id, end, status in self.entries[lo:hi]:
+            if end > slot_start and status in statuses and appointment_id != exclude_id:
+                return appointment_id
+        return None
+
+class ScheduleIndex:
+    """Per-doctor and per-patient interval sets"""
+
+    def __init__(self):
+        self._hold_ids = count(-1, -1)
+        # Changes to committed appointments made while `rebuild` reads the table
+        self._journal = None
+        self._reset()
+
+    def _reset(self):
+        self._records = {}
+        self._by_doctor = defaultdict(IntervalSet)
+        self._by_patient = defaultdict(IntervalSet)
+
+    def build(self, db: Session):
+        """(Re)build the index from the appointments table"""
+        self._reset()
+        rows = db.query(
+            Appointment.appointment_id,
+            Appointment.patient_id,
+            Appointment.doctor_id,
+            Appointment.slot_start,
+            Appointment.slot_end,
+            Appointment.status
+        ).yield_per(10000)
+        for row in rows:
+            self.insert(*row)
+
+    def rebuild(self, db: Session):
+        """Rebuild from the appointments table while the index stays in use
+
+        The table is read into a fresh index; reading yields to other requests,
+        which keep checking and updating this one. Their changes are replayed
+        onto the fresh index, which then replaces this one's contents in one
+        step, keeping the holds of bookings still committing.
+        """
+        fresh = ScheduleIndex()
+        self._journal = []
+        try:
+            fresh.build(db)
+            for appointment_id, record in self._journal:
+                fresh.remove(appointment_id)
+                if record is not None:
+                    fresh.insert(appointment_id, *record)
+        finally:
+            self._journal = None
+        for hold_id, record in self._records.items():
+            if hold_id < 0:
+                fresh.insert(hold_id, *record)
+        self._records, self._by_doctor, self._by_patient = fresh._records, fresh._by_doctor, fresh._by_patient
+
+    def insert(self, appointment_id, patient_id, doctor_id, slot_start, slot_end, status):
+        if self._journal is not None and appointment_id > 0:
+            self._journal.append((appointment_id, (patient_id, doctor_id, slot_start, slot_end, status)))
+        self._records[appointment_id] = (patient_id, doctor_id, slot_start, slot_end, status)
+        self._by_doctor[doctor_id].add(slot_start, appointment_id, slot_end, status)
+        self._by_patient[patient_id].add(slot_start, appointment_id, slot_end, status)
+
+    def hold(self, patient_id, doctor_id, slot_start, slot_end) -> int:
+        """Index a booking that is not committed yet; returns its id for `remove`"""
+        hold_id = next(self._hold_ids)
+        self.insert(hold_id, patient_id, doctor_id, slot_start, slot_end, "SCHEDULED")
+        return hold_id
+
+    def add(self, appointment: Appointment):
+        """Index a committed appointment (insert or refresh)"""
+        self.remove(appointment.appointment_id)
+        self.insert(
+            appointment.appointment_id,
+            appointment.patient_id,
+            appointment.doctor_id,
+            appointment.slot_start,
+            appointment.slot_end,
+            appointment.status
+        )
+
+    update = add
+
+    def remove(self, appointment_id: int):
+        if self._journal is not None and appointment_id > 0:
+            self._journal.append((appointment_id, None))
+        record = self._records.pop(appointment_id, None)
+        if record is None:
+            return
+        patient_id, doctor_id, slot_start, _, _ = record
+        self._by_doctor[doctor_id].remove(slot_start, appointment_id)
+        self._by_patient[patient_id].remove(slot_start, appointment_id)
+
+    def doctor_slots(self, doctor_id: int, start: datetime, end: datetime, statuses: Iterable[str]) -> list:
+        """Committed (slot_start, appointment_id, slot_end, status) starting in [start, end)"""
+        if doctor_id not in self._by_doctor:
+            return []
+        entries = self._by_doctor[doctor_id].entries
+        lo = bisect_left(entries, (start,))
+        hi = bisect_left(entries, (end,))
+        return [entry for entry in entries[lo:hi] if entry[1] > 0 and entry[3] in statuses]
+
+    def doctor_conflict(self, doctor_id, slot_start, slot_end, statuses, exclude_id=None) -> Optional[int]:
+        if doctor_id not in self._by_doctor:
+            return None
+        return self._by_doctor[doctor_id].overlapping(slot_start, slot_end, statuses, exclude_id)
+
+    def patient_conflict(self, patient_id, slot_start, slot_end, statuses, exclude_id=None) -> Optional[int]:
+        if patient_id not in self._by_patient:
+            return None
+        return self._by_patient[patient_id].overlapping(slot_start, slot_end, statuses, exclude_id)
+
+    def check(self, db: Session) -> dict:
+        """Compare the index with the appointments table"""
+        fresh = ScheduleIndex()
+        fresh.build(db)
+        records = {key: record for key, record in self._records.items() if key > 0}
+
+        missing = sorted(set(fresh._records) - set(records))
+        unexpected = sorted(set(records) - set(fresh._records))
+        stale = sorted(
+            appointment_id for appointment_id, record in fresh._records.items()
+            if appointment_id in records and records[appointment_id] != record
+        )
+        return {
+            "consistent": not (missing or unexpected or stale),
+            "indexed": len(records),
+            "in_database": len(fresh._records),
+            "missing": missing,
+            "unexpected": unexpected,
+            "stale": stale
+        }
+
+    def stats(self) -> dict:
+        return {
+            "appointments": len(self._records),
+            "doctors": len(self._by_doctor),
+            "patients": len(self._by_patient)
+        }
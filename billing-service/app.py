@@ -1,16 +1,32 @@
 """
 Billing Service - Bill generation, tax calculation, cancellation handling
 """
-from fastapi import FastAPI, HTTPException, Depends, Query, Header
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+from datetime import date, datetime, timedelta
 from typing import List, Optional
+import asyncio
 import structlog
+import httpx
+import os
 from uuid import uuid4
 
-from database import get_db, init_db
-from models import Bill, BillCreate, BillUpdate, BillResponse
+from database import SessionLocal, get_db, init_db
+from models import (
+    Bill, BillCreate, BillUpdate, BillResponse,
+    BillBatchCreate, BillBatchResult, BillBatchResponse,
+    BillRevenueDaily, BillStatusTotal, PatientBalance, BillStatsResponse,
+    LedgerResponse, PaymentEvent, PaymentBatchEvent
+)
+from pagination import paginate
+from export import EXPORT_FORMATS, export_table
+from http_client import init_clients, get_client, close_clients, pool_stats
+from ledger import LedgerCache, build_ledger
+import rollups
 
 logger = structlog.get_logger()
 
@@ -29,13 +45,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 TAX_RATE = 0.05  # 5% tax
 
+MAX_STATS_DAYS = 366
+
+PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://localhost:8006")
+
+# Largest bill_ids list payment-service accepts per lookup
+PAYMENT_LOOKUP_SIZE = 1000
+
+ledger_cache = LedgerCache()
+
+def with_tax(amount: float) -> float:
+    # Rounded as Numeric(10, 2) stores it, so the rollups add up the stored amounts
+    return round(amount + amount * TAX_RATE, 2)
+
 @app.on_event("startup")
 async def startup():
     init_db()
+    db = SessionLocal()
+    try:
+        rollups.ensure_built(db)
+    finally:
+        db.close()
+    init_clients({"payment": PAYMENT_SERVICE_URL})
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_clients()
 
 @app.post("/v1/bills", response_model=BillResponse, status_code=201)
 def create_bill(
@@ -54,20 +94,24 @@ def create_bill(
         raise HTTPException(status_code=400, detail="Bill already exists for this appointment")
     
     # Calculate with tax
-    base_amount = bill.amount
-    tax = base_amount * TAX_RATE
-    total_amount = base_amount + tax
+    total_amount = with_tax(bill.amount)
     
     db_bill = Bill(
         patient_id=bill.patient_id,
         appointment_id=bill.appointment_id,
+        department=bill.department,
         amount=total_amount,
         status="OPEN"
     )
     
     db.add(db_bill)
+    db.flush()
+    delta = rollups.RollupDelta()
+    delta.created(db_bill)
+    delta.apply(db)
     db.commit()
     db.refresh(db_bill)
+    ledger_cache.invalidate(db_bill.patient_id)
     
     logger.info(
         "bill_created",
@@ -79,6 +123,81 @@ def create_bill(
     
     return db_bill
 
+@app.post("/v1/bills:batch", response_model=BillBatchResponse)
+def create_bills_batch(
+    batch: BillBatchCreate,
+    correlation_id: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Create many bills in one transaction, with a result per item"""
+    if not correlation_id:
+        correlation_id = str(uuid4())
+    
+    items = batch.items
+    errors = {}
+    
+    # One lookup for every appointment that already has a bill; those items get 409
+    # with the existing bill, so a retried request can tell it was already applied
+    existing = {
+        bill.appointment_id: BillResponse.model_validate(bill) for bill in
+        db.query(Bill).filter(Bill.appointment_id.in_({item.appointment_id for item in items}))
+    }
+    accepted = []
+    repeated = []
+    seen = set(existing)
+    for i, item in enumerate(items):
+        if item.appointment_id in seen:
+            repeated.append(i)
+        else:
+            seen.add(item.appointment_id)
+            accepted.append(i)
+    
+    created = {}
+    if accepted:
+        rows = [
+            {
+                "patient_id": items[i].patient_id,
+                "appointment_id": items[i].appointment_id,
+                "department": items[i].department,
+                "amount": with_tax(items[i].amount),
+                "status": "OPEN"
+            }
+            for i in accepted
+        ]
+        # RETURNING carries the server defaults; build responses before commit expires them
+        bills = {}
+        delta = rollups.RollupDelta()
+        for bill in db.scalars(insert(Bill).returning(Bill), rows):
+            bills[bill.appointment_id] = BillResponse.model_validate(bill)
+            delta.created(bill)
+        delta.apply(db)
+        created = {i: bills[items[i].appointment_id] for i in accepted}
+        db.commit()
+        for patient_id in {bill.patient_id for bill in bills.values()}:
+            ledger_cache.invalidate(patient_id)
+        existing.update(bills)
+    for i in repeated:
+        errors[i] = (409, "Bill already exists for this appointment")
+    
+    logger.info(
+        "bills_batch_created",
+        requested=len(items),
+        created=len(created),
+        failed=len(errors),
+        correlation_id=correlation_id
+    )
+    
+    results = []
+    for i in range(len(items)):
+        if i in created:
+            results.append(BillBatchResult(index=i, status_code=201, bill=created[i]))
+        else:
+            status_code, detail = errors[i]
+            bill = existing[items[i].appointment_id] if status_code == 409 else None
+            results.append(BillBatchResult(index=i, status_code=status_code, bill=bill, detail=detail))
+    
+    return BillBatchResponse(created=len(created), failed=len(errors), results=results)
+
 @app.post("/v1/bills/{bill_id}/void")
 def void_bill(
     bill_id: int,
@@ -97,16 +216,24 @@ def void_bill(
     if bill.status == "PAID":
         raise HTTPException(status_code=400, detail="Cannot void a paid bill")
     
+    old_status = bill.status
     bill.status = "VOID"
+    delta = rollups.RollupDelta()
+    delta.status_changed(bill, old_status)
+    delta.apply(db)
     db.commit()
+    ledger_cache.invalidate(bill.patient_id)
     
     logger.info("bill_voided", bill_id=bill_id, correlation_id=correlation_id)
     return bill
 
 @app.get("/v1/bills", response_model=List[BillResponse])
 def get_bills(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor; takes precedence over skip"),
+    include_total: bool = Query(False, description="Return the total match count in X-Total-Count"),
     patient_id: Optional[int] = None,
     status: Optional[str] = None,
     db: Session = Depends(get_db)
@@ -120,12 +247,73 @@ def get_bills(
     if status:
         query = query.filter(Bill.status == status)
     
-    total = query.count()
-    bills = query.order_by(Bill.created_at.desc()).offset(skip).limit(limit).all()
+    total = query.count() if include_total else None
+    bills, next_cursor = paginate(query, Bill.created_at, Bill.bill_id, limit, skip, cursor)
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
     
     logger.info("bills_retrieved", total=total, returned=len(bills))
     return bills
 
+@app.get("/v1/bills/stats", response_model=BillStatsResponse)
+def get_bill_stats(
+    from_date: Optional[date] = Query(None, alias="from", description="First day of revenue (default: 30 days ago)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day of revenue (default: today)"),
+    department: Optional[str] = None,
+    patient_id: Optional[int] = None,
+    top: int = Query(20, ge=1, le=100, description="Patients with the largest outstanding balance"),
+    db: Session = Depends(get_db)
+):
+    """Revenue per day and department, totals per status and outstanding balances, from the rollups"""
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=29)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if (to_date - from_date).days >= MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {MAX_STATS_DAYS} days")
+    
+    revenue = db.query(BillRevenueDaily).filter(
+        BillRevenueDaily.day >= from_date,
+        BillRevenueDaily.day <= to_date,
+        BillRevenueDaily.bills > 0
+    )
+    if department:
+        revenue = revenue.filter(BillRevenueDaily.department == department)
+    
+    balances = db.query(PatientBalance).filter(PatientBalance.outstanding > 0)
+    if patient_id:
+        balances = balances.filter(PatientBalance.patient_id == patient_id)
+    
+    stats = BillStatsResponse(
+        revenue=revenue.order_by(BillRevenueDaily.day, BillRevenueDaily.department).all(),
+        by_status={
+            total.status: {"bills": total.bills, "amount": total.amount}
+            for total in db.query(BillStatusTotal).filter(BillStatusTotal.bills > 0)
+        },
+        outstanding=balances.order_by(PatientBalance.outstanding.desc(), PatientBalance.patient_id).limit(top).all()
+    )
+    
+    logger.info("bill_stats_retrieved", days=(to_date - from_date).days + 1, revenue_rows=len(stats.revenue))
+    return stats
+
+@app.get("/v1/bills/export")
+def export_bills(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    updated_since: Optional[datetime] = Query(None, description="Only rows updated at or after this time (ISO 8601)")
+):
+    """Stream every bill (or those updated since a time) as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    return StreamingResponse(
+        export_table(Bill, format, updated_since),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=bills.{format}"}
+    )
+
 @app.get("/v1/bills/{bill_id}", response_model=BillResponse)
 def get_bill(bill_id: int, db: Session = Depends(get_db)):
     """Get bill by ID"""
@@ -136,13 +324,91 @@ def get_bill(bill_id: int, db: Session = Depends(get_db)):
     
     return bill
 
+async def fetch_payments(bill_ids: List[int]) -> List[dict]:
+    """Payments of `bill_ids` from payment-service, PAYMENT_LOOKUP_SIZE bills per call"""
+    client = get_client("payment")
+    
+    async def lookup(chunk: List[int]) -> List[dict]:
+        response = await client.post("/v1/payments:lookup", json={"bill_ids": chunk})
+        response.raise_for_status()
+        return response.json()
+    
+    chunks = await asyncio.gather(*(
+        lookup(bill_ids[i:i + PAYMENT_LOOKUP_SIZE]) for i in range(0, len(bill_ids), PAYMENT_LOOKUP_SIZE)
+    ))
+    return [payment for chunk in chunks for payment in chunk]
+
+@app.get("/v1/patients/{patient_id}/ledger", response_model=LedgerResponse)
+async def get_patient_ledger(patient_id: int, db: Session = Depends(get_db)):
+    """Bills, voids and payments of a patient in time order, with a running balance"""
+    body = ledger_cache.get(patient_id)
+    if body is None:
+        # Read before loading: a write during the load keeps this ledger out of the cache
+        generation = ledger_cache.generation
+        def patient_bills():
+            return db.query(Bill).filter(Bill.patient_id == patient_id).order_by(Bill.bill_id).all()
+        
+        # Sync Session query: keep it off the event loop
+        bills = await run_in_threadpool(patient_bills)
+        payments = []
+        if bills:
+            try:
+                payments = await fetch_payments([bill.bill_id for bill in bills])
+            except httpx.HTTPError as e:
+                logger.error("payment_lookup_failed", patient_id=patient_id, error=str(e))
+                raise HTTPException(status_code=503, detail="Payment service unavailable")
+        ledger = build_ledger(patient_id, bills, payments)
+        body = ledger_cache.put(patient_id, ledger, generation)
+        logger.info("ledger_built", patient_id=patient_id, bills=len(bills), payments=len(payments))
+    
+    return Response(content=body, media_type="application/json")
+
+def apply_payment_events(db: Session, payments: List[PaymentEvent]) -> set:
+    """Subtract payments from their patients' balances (once each) and drop the patients' cached ledgers"""
+    bill_patients = dict(
+        db.query(Bill.bill_id, Bill.patient_id).filter(Bill.bill_id.in_({payment.bill_id for payment in payments}))
+    )
+    patient_ids = rollups.record_payments(db, [
+        {**payment.model_dump(), "patient_id": bill_patients[payment.bill_id]}
+        for payment in payments if payment.bill_id in bill_patients
+    ])
+    db.commit()
+    for patient_id in patient_ids:
+        ledger_cache.invalidate(patient_id)
+    return patient_ids
+
+@app.post("/v1/events/payments", status_code=204)
+def on_payment_recorded(event: PaymentEvent, db: Session = Depends(get_db)):
+    """Payment-service notice of a new payment: update the patient's balance and drop the cached ledger"""
+    patient_ids = apply_payment_events(db, [event])
+    
+    logger.info("payment_event_received", payment_id=event.payment_id, bill_id=event.bill_id, applied=bool(patient_ids))
+    return Response(status_code=204)
+
+@app.post("/v1/events/payments:batch", status_code=204)
+def on_payments_recorded(event: PaymentBatchEvent, db: Session = Depends(get_db)):
+    """Payment-service notice of bulk-ingested payments: update the patients' balances and drop the cached ledgers"""
+    patient_ids = apply_payment_events(db, event.payments)
+    
+    logger.info("payment_batch_event_received", payments=len(event.payments), patients=len(patient_ids))
+    return Response(status_code=204)
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "billing-service"}
 
+@app.get("/v1/metrics/ledger-cache")
+def get_ledger_cache_stats():
+    """Patient ledger cache statistics"""
+    return ledger_cache.stats()
+
+@app.get("/v1/metrics/http-pools")
+def get_http_pool_stats():
+    """Connection pool statistics for inter-service clients"""
+    return pool_stats()
+
 if __name__ == "__main__":
     import uvicorn
-    import os
     port = int(os.getenv("PORT", 8003))
     uvicorn.run(app, host="0.0.0.0", port=port)
 
@@ -24,5 +24,7 @@ def get_db():
 
 def init_db():
     from models import Bill
+    from migrations import run_migrations
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine, Base.metadata)
 
@@ -0,0 +1,117 @@
+"""Per-patient ledger: bills, voids and payments in time order with a running balance
+
+Charges come from the bills table and payments from payment-service, one
+`POST /v1/payments:lookup` for all of the patient's bills. Built ledgers
+are kept as serialized response bodies per patient (LEDGER_CACHE_SIZE
+patients, LRU) and dropped by `invalidate` when one of the patient's bills
+is written here or payment-service reports a payment
+(`POST /v1/events/payments`); LEDGER_CACHE_TTL bounds how stale a ledger
+can get if such an event is lost.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+LEDGER_CACHE_TTL = float(os.getenv("LEDGER_CACHE_TTL", 60))
+LEDGER_CACHE_SIZE = int(os.getenv("LEDGER_CACHE_SIZE", 10000))
+
+# Same-instant entries: the charge first, then its reversal, then payments
+_ENTRY_ORDER = {"bill": 0, "void": 1, "payment": 2}
+
+def build_ledger(patient_id: int, bills: list, payments: List[dict]) -> dict:
+    """Ledger of `bills` (Bill rows) and `payments` (PaymentResponse dicts), oldest entry first"""
+    entries = []
+    for bill in bills:
+        amount = Decimal(str(bill.amount))
+        entries.append(("bill", bill.created_at, bill.bill_id, None, amount))
+        if bill.status == "VOID":
+            entries.append(("void", bill.updated_at or bill.created_at, bill.bill_id, None, -amount))
+    for payment in payments:
+        entries.append((
+            "payment", datetime.fromisoformat(payment["paid_at"]), payment["bill_id"], payment["payment_id"],
+            -Decimal(str(payment["amount"]))
+        ))
+    entries.sort(key=lambda entry: (entry[1].replace(tzinfo=None), _ENTRY_ORDER[entry[0]], entry[2], entry[3] or 0))
+
+    balance = billed = paid = Decimal(0)
+    rows = []
+    for kind, at, bill_id, payment_id, amount in entries:
+        balance += amount
+        if kind == "payment":
+            paid -= amount
+        else:
+            billed += amount
+        rows.append({
+            "type": kind,
+            "at": at.isoformat(),
+            "bill_id": bill_id,
+            "payment_id": payment_id,
+            "amount": str(amount),
+            "balance": str(balance)
+        })
+    return {"patient_id": patient_id, "billed": str(billed), "paid": str(paid), "balance": str(balance), "entries": rows}
+
+class LedgerCache:
+    """TTL + LRU cache of serialized ledgers keyed by patient_id"""
+
+    def __init__(self, capacity: int = LEDGER_CACHE_SIZE, ttl: float = LEDGER_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        # patient_id -> (body, monotonic time loaded)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a ledger built across one is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def get(self, patient_id: int) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[patient_id]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, patient_id: int, ledger: dict, generation: int) -> bytes:
+        """Serialize and cache a ledger built when `generation` was current"""
+        body = json.dumps(ledger).encode()
+        with self._lock:
+            if generation == self.generation:
+                self._entries[patient_id] = (body, time.monotonic())
+                self._entries.move_to_end(patient_id)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return body
+
+    def invalidate(self, patient_id: int):
+        with self._lock:
+            self._entries.pop(patient_id, None)
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,54 @@
+"""In-place schema migrations for existing databases
+
+`create_all` only creates missing tables, so columns and indexes added to a model
+after its table exists are created here, and indexes a model no longer declares
+are dropped. Added columns are nullable and may be backfilled from another
+column. Each step checks the live schema first, so running it repeatedly is safe.
+"""
+import structlog
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+logger = structlog.get_logger()
+
+# Indexes replaced by composite ones, per table
+OBSOLETE_INDEXES = {}
+
+# Columns added after the table existed, filled from another column on the way in
+BACKFILL_COLUMNS = {
+    ("bills", "updated_at"): "created_at",
+}
+
+def _add_missing_columns(engine: Engine, inspector, table):
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            source = BACKFILL_COLUMNS.get((table.name, column.name))
+            if source:
+                conn.exec_driver_sql(f"UPDATE {table.name} SET {column.name} = {source}")
+        logger.info("column_added", table=table.name, column=column.name)
+
+def run_migrations(engine: Engine, metadata):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        _add_missing_columns(engine, inspector, table)
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                logger.info("index_created", table=table.name, index=index.name)
+
+        for name in OBSOLETE_INDEXES.get(table.name, []):
+            if name in existing:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f"DROP INDEX {name}")
+                logger.info("index_dropped", table=table.name, index=name)
@@ -1,9 +1,9 @@
 """Database models and schemas"""
-from sqlalchemy import Column, Integer, String, Numeric, DateTime
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime
 from sqlalchemy.sql import func
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from datetime import date, datetime
 from decimal import Decimal
 
 from database import Base
@@ -14,14 +14,51 @@ class Bill(Base):
     bill_id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, nullable=False, index=True)
     appointment_id = Column(Integer, nullable=False, index=True)
+    department = Column(String, nullable=True)
     amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String, nullable=False, default="OPEN")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Client-side SQL default so rows inserted into a migrated table get it too
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
+
+class BillRevenueDaily(Base):
+    __tablename__ = "bill_revenue_daily"
+    
+    # Non-void bills per creation day and department
+    day = Column(Date, primary_key=True)
+    department = Column(String, primary_key=True)
+    bills = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+class BillStatusTotal(Base):
+    __tablename__ = "bill_status_totals"
+    
+    status = Column(String, primary_key=True)
+    bills = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+class PatientBalance(Base):
+    __tablename__ = "patient_balances"
+    
+    # Non-void bills less payments per patient, and the number of OPEN bills
+    patient_id = Column(Integer, primary_key=True)
+    open_bills = Column(Integer, nullable=False, default=0)
+    outstanding = Column(Numeric(14, 2), nullable=False, default=0, index=True)
+
+class BillPayment(Base):
+    __tablename__ = "bill_payments"
+    
+    # Payments reported by payment-service; the primary key applies each one once
+    payment_id = Column(Integer, primary_key=True)
+    bill_id = Column(Integer, nullable=False)
+    patient_id = Column(Integer, nullable=False, index=True)
+    amount = Column(Numeric(10, 2), nullable=False)
 
 class BillCreate(BaseModel):
     patient_id: int
     appointment_id: int
     amount: float
+    department: Optional[str] = None
 
 class BillUpdate(BaseModel):
     amount: Optional[float] = None
@@ -31,6 +68,7 @@ class BillResponse(BaseModel):
     bill_id: int
     patient_id: int
     appointment_id: int
+    department: Optional[str] = None
     amount: Decimal
     status: str
     created_at: datetime
@@ -38,3 +76,65 @@ class BillResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BillBatchCreate(BaseModel):
+    items: List[BillCreate] = Field(..., min_length=1, max_length=500)
+
+class BillBatchResult(BaseModel):
+    index: int
+    status_code: int
+    bill: Optional[BillResponse] = None
+    detail: Optional[str] = None
+
+class BillBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BillBatchResult]
+
+class RevenueRow(BaseModel):
+    day: date
+    department: str
+    bills: int
+    amount: Decimal
+    
+    class Config:
+        from_attributes = True
+
+class StatusTotal(BaseModel):
+    bills: int
+    amount: Decimal
+
+class PatientOutstanding(BaseModel):
+    patient_id: int
+    open_bills: int
+    outstanding: Decimal
+    
+    class Config:
+        from_attributes = True
+
+class BillStatsResponse(BaseModel):
+    revenue: List[RevenueRow]
+    by_status: Dict[str, StatusTotal]
+    outstanding: List[PatientOutstanding]
+
+class LedgerEntry(BaseModel):
+    type: str
+    at: datetime
+    bill_id: int
+    payment_id: Optional[int] = None
+    amount: Decimal
+    balance: Decimal
+
+class LedgerResponse(BaseModel):
+    patient_id: int
+    billed: Decimal
+    paid: Decimal
+    balance: Decimal
+    entries: List[LedgerEntry]
+
+class PaymentEvent(BaseModel):
+    payment_id: int
+    bill_id: int
+    amount: Decimal
+
+class PaymentBatchEvent(BaseModel):
+    payments: List[PaymentEvent] = Field(..., min_length=1, max_length=1000)
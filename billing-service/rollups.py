@@ -0,0 +1,178 @@
+"""Materialized billing aggregates behind `/v1/bills/stats`
+
+- `bill_revenue_daily`: non-void bills and their total per creation day and
+  department
+- `bill_status_totals`: bills and their total per status
+- `patient_balances`: OPEN bills and the outstanding balance per patient
+  (non-void bills less payments, the patient ledger's balance)
+
+Handlers record every bill they create or whose status they change with a
+`RollupDelta`, which adds the changes to the rollup rows with one upsert per
+table in the same transaction as the bill, so the stats never need a scan of
+`bills`. Payments reported by payment-service are kept in `bill_payments`;
+`record_payments` subtracts each one once. `rebuild` recomputes every rollup
+from the bills and bill_payments tables.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+import structlog
+from typing import List, Set
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Bill, BillPayment, BillRevenueDaily, BillStatusTotal, PatientBalance
+
+logger = structlog.get_logger()
+
+# Bills created without a department (before departments were recorded)
+UNKNOWN_DEPARTMENT = "UNKNOWN"
+
+def _day(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+class RollupDelta:
+    """Changes to the rollups from bills created or changed, or payments recorded, in one transaction"""
+
+    def __init__(self):
+        self.revenue = defaultdict(lambda: [0, Decimal(0)])
+        self.statuses = defaultdict(lambda: [0, Decimal(0)])
+        self.balances = defaultdict(lambda: [0, Decimal(0)])
+
+    def _count(self, bill, status: str, sign: int):
+        amount = Decimal(str(bill.amount)) * sign
+        keyed = [(self.statuses, status)]
+        if status != "VOID":
+            keyed.append((self.revenue, (_day(bill.created_at), bill.department or UNKNOWN_DEPARTMENT)))
+        for totals, key in keyed:
+            totals[key][0] += sign
+            totals[key][1] += amount
+        # Every non-void bill is owed (as in the ledger); open_bills counts OPEN ones
+        if status != "VOID":
+            self.balances[bill.patient_id][1] += amount
+        if status == "OPEN":
+            self.balances[bill.patient_id][0] += sign
+
+    def created(self, bill):
+        self._count(bill, bill.status, 1)
+
+    def status_changed(self, bill, old_status: str):
+        self._count(bill, old_status, -1)
+        self._count(bill, bill.status, 1)
+
+    def paid(self, patient_id: int, amount):
+        self.balances[patient_id][1] -= Decimal(str(amount))
+
+    def apply(self, db: Session):
+        """Add the changes to the rollup rows (one upsert per table); the caller commits"""
+        _upsert(db, BillRevenueDaily, ["day", "department"], [
+            {"day": day, "department": department, "bills": bills, "amount": amount}
+            for (day, department), (bills, amount) in self.revenue.items()
+        ])
+        _upsert(db, BillStatusTotal, ["status"], [
+            {"status": status, "bills": bills, "amount": amount}
+            for status, (bills, amount) in self.statuses.items()
+        ])
+        _upsert(db, PatientBalance, ["patient_id"], [
+            {"patient_id": patient_id, "open_bills": bills, "outstanding": amount}
+            for patient_id, (bills, amount) in self.balances.items()
+        ])
+
+# (dialect, table) -> upsert statement; ON CONFLICT statements are not in
+# SQLAlchemy's compiled cache, so at least build each one only once
+_upserts = {}
+
+def _upsert_statement(dialect_name: str, model, keys: list):
+    statement = _upserts.get((dialect_name, model))
+    if statement is None:
+        table = model.__table__
+        statement = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                column.name: column + statement.excluded[column.name]
+                for column in table.columns if column.name not in keys
+            }
+        )
+        _upserts[(dialect_name, model)] = statement
+    return statement
+
+def _upsert(db: Session, model, keys: list, rows: list):
+    """INSERT each row, adding its counters to the existing row on a key conflict"""
+    rows = [row for row in rows if any(row[column] for column in row if column not in keys)]
+    if not rows:
+        return
+    statement = _upsert_statement(db.bind.dialect.name, model, keys)
+    # Sorted keys keep lock order stable between concurrent transactions
+    db.connection().execute(statement, sorted(rows, key=lambda row: tuple(row[key] for key in keys)))
+
+def record_payments(db: Session, payments: List[dict]) -> Set[int]:
+    """Store payments not seen before and subtract them from the balances; returns their patients
+
+    Each payment is a dict with payment_id, bill_id, patient_id and amount.
+    A repeated event inserts nothing, so no payment is subtracted twice.
+    The caller commits.
+    """
+    if not payments:
+        return set()
+    delta = RollupDelta()
+    for payment in db.execute(_payment_insert(db.bind.dialect.name), payments):
+        delta.paid(payment.patient_id, payment.amount)
+    delta.apply(db)
+    return set(delta.balances)
+
+def _payment_insert(dialect_name: str):
+    statement = _upserts.get((dialect_name, BillPayment))
+    if statement is None:
+        table = BillPayment.__table__
+        statement = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+        statement = statement.on_conflict_do_nothing(index_elements=["payment_id"]).returning(
+            table.c.patient_id, table.c.amount
+        )
+        _upserts[(dialect_name, BillPayment)] = statement
+    return statement
+
+def rebuild(db: Session) -> dict:
+    """Recompute all rollups from the bills and bill_payments tables; returns the row count per table"""
+    day = func.date(Bill.created_at)
+    department = func.coalesce(Bill.department, UNKNOWN_DEPARTMENT)
+    count, total = func.count(Bill.bill_id), func.sum(Bill.amount)
+    paid = select(BillPayment.patient_id, func.sum(BillPayment.amount).label("amount")).group_by(
+        BillPayment.patient_id
+    ).subquery()
+    billed = select(
+        Bill.patient_id,
+        func.count(case((Bill.status == "OPEN", Bill.bill_id))).label("open_bills"),
+        func.coalesce(func.sum(case((Bill.status != "VOID", Bill.amount))), 0).label("amount")
+    ).group_by(Bill.patient_id).subquery()
+    tables = (
+        (BillRevenueDaily, ["day", "department", "bills", "amount"],
+         select(day, department, count, total).where(Bill.status != "VOID").group_by(day, department)),
+        (BillStatusTotal, ["status", "bills", "amount"],
+         select(Bill.status, count, total).group_by(Bill.status)),
+        # Payments only exist for bills, so every patient with payments has a billed row
+        (PatientBalance, ["patient_id", "open_bills", "outstanding"],
+         select(billed.c.patient_id, billed.c.open_bills, billed.c.amount - func.coalesce(paid.c.amount, 0))
+         .outerjoin_from(billed, paid, paid.c.patient_id == billed.c.patient_id))
+    )
+
+    # Aggregated inside the database: nothing per bill crosses into Python
+    counts = {}
+    for model, columns, aggregate in tables:
+        db.query(model).delete(synchronize_session=False)
+        counts[model.__tablename__] = db.execute(insert(model).from_select(columns, aggregate)).rowcount
+    db.commit()
+
+    logger.info("bill_rollups_rebuilt", **counts)
+    return counts
+
+def ensure_built(db: Session):
+    """Fill the rollups on first start against an existing bills table"""
+    if db.query(BillStatusTotal.status).first() is not None:
+        return
+    if db.query(Bill.bill_id).first() is None:
+        return
+    rebuild(db)
@@ -1,15 +1,28 @@
 """
 Doctor & Scheduling Service - Doctor listings, availability checks
 """
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from typing import List, Optional
 import structlog
+import httpx
+import json
+import os
 
 from database import get_db, init_db
-from models import Doctor, SlotAvailability, DoctorResponse, DoctorCreate
+from http_client import init_clients, close_clients, pool_stats
+from booked_slots import BookedSlotCache
+from doctor_directory import DoctorDirectory, conditional_response, lookup_response
+from slot_grid import SlotGrid
+from slot_search import search
+from models import (
+    Doctor, SlotAvailability, DoctorResponse, DoctorCreate, AppointmentEvent,
+    DoctorLookup, DoctorLookupResponse
+)
 
 logger = structlog.get_logger()
 
@@ -34,10 +47,30 @@ app.add_middleware(
 CLINIC_HOURS_START = 9  # 9 AM
 CLINIC_HOURS_END = 18   # 6 PM
 SLOT_DURATION_MINUTES = 30
+MIN_LEAD_TIME_HOURS = 2  # Same lead time the appointment service enforces
+MAX_SEARCH_DAYS = 90
+MAX_CALENDAR_DAYS = 90
+MAX_LOOKUP_IDS = 1000
+
+APPOINTMENT_SERVICE_URL = os.getenv("APPOINTMENT_SERVICE_URL", "http://localhost:8004")
+
+# Doctor records by id, invalidated on every write
+doctor_directory = DoctorDirectory()
+
+# Booked slots per doctor and day, kept fresh by appointment events
+booked_slots = BookedSlotCache()
+
+# Slot templates per date, shared by availability, calendar and search
+slot_grid = SlotGrid(CLINIC_HOURS_START, CLINIC_HOURS_END, SLOT_DURATION_MINUTES)
 
 @app.on_event("startup")
 async def startup():
     init_db()
+    init_clients({"appointment": APPOINTMENT_SERVICE_URL})
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_clients()
 
 @app.post("/v1/doctors", response_model=DoctorResponse, status_code=201)
 def create_doctor(doctor: DoctorCreate, db: Session = Depends(get_db)):
@@ -52,6 +85,7 @@ def create_doctor(doctor: DoctorCreate, db: Session = Depends(get_db)):
     db.add(db_doctor)
     db.commit()
     db.refresh(db_doctor)
+    doctor_directory.invalidate(db_doctor.doctor_id)
     
     logger.info("doctor_created", doctor_id=db_doctor.doctor_id, name=db_doctor.name)
     return db_doctor
@@ -79,32 +113,53 @@ def get_doctors(
     logger.info("doctors_retrieved", total=total, returned=len(doctors))
     return doctors
 
+@app.get("/v1/doctors:lookup", response_model=DoctorLookupResponse)
+def lookup_doctors_by_query(
+    ids: str = Query(..., description="Comma-separated doctor IDs"),
+    db: Session = Depends(get_db)
+):
+    """Get the doctors with the given IDs; unknown IDs are listed in `missing`"""
+    try:
+        doctor_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not doctor_ids or len(doctor_ids) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"ids must list 1 to {MAX_LOOKUP_IDS} doctor IDs")
+    return lookup_doctors(DoctorLookup(ids=doctor_ids), db)
+
+@app.post("/v1/doctors:lookup", response_model=DoctorLookupResponse)
+def lookup_doctors(lookup: DoctorLookup, db: Session = Depends(get_db)):
+    """Get the doctors with the given IDs in one query; unknown IDs are listed in `missing`"""
+    entries, missing = doctor_directory.get_many(db, lookup.ids)
+    
+    logger.info("doctors_looked_up", requested=len(lookup.ids), found=len(entries), missing=len(missing))
+    return lookup_response(entries, missing)
+
 @app.get("/v1/doctors/{doctor_id}", response_model=DoctorResponse)
-def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
-    """Get doctor by ID"""
-    doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+def get_doctor(doctor_id: int, request: Request, db: Session = Depends(get_db)):
+    """Get doctor by ID (cached, honours If-None-Match)"""
+    entry = doctor_directory.get(db, doctor_id)
     
-    if not doctor:
+    if not entry:
         logger.warning("doctor_not_found", doctor_id=doctor_id)
         raise HTTPException(status_code=404, detail="Doctor not found")
     
     logger.info("doctor_retrieved", doctor_id=doctor_id)
-    return doctor
+    return conditional_response(request, entry.doctor)
 
 @app.get("/v1/doctors/{doctor_id}/availability")
-def check_availability(
+async def check_availability(
     doctor_id: int,
     date: str = Query(..., description="Date in YYYY-MM-DD format"),
     db: Session = Depends(get_db)
 ):
     """Check availability for a doctor on a specific date"""
-    doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+    # A directory miss queries the database: keep it off the event loop
+    doctor = await run_in_threadpool(doctor_directory.get, db, doctor_id)
     
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
-    # Query appointment service to get booked slots
-    # For now, we'll return all available slots
     request_date = datetime.strptime(date, "%Y-%m-%d").date()
     
     # Get today's date
@@ -114,50 +169,170 @@ def check_availability(
     if request_date < today:
         raise HTTPException(status_code=400, detail="Cannot book in the past")
     
-    # Get existing appointments for this doctor on this date
-    # This would require cross-service communication with appointment service
-    # For now, we'll return all slots as available
+    # Get existing appointments for this doctor on this date (cached)
+    try:
+        bookings = (await booked_slots.get_days(doctor_id, [request_date]))[request_date]
+    except httpx.HTTPError as e:
+        logger.error("booked_slots_fetch_failed", doctor_id=doctor_id, error=str(e))
+        raise HTTPException(status_code=503, detail="Appointment service unavailable")
     
-    slots = generate_slots_for_date(request_date)
+    # A doctor at the daily cap has no bookable slots left
+    slots = [] if bookings.full else slot_grid.free_slots(request_date, bookings.mask(slot_grid.slot_bits))
     
     logger.info("availability_checked", doctor_id=doctor_id, date=date, slots_available=len(slots))
     return {
         "doctor_id": doctor_id,
         "date": date,
         "available_slots": slots,
+        "daily_cap_reached": bookings.full,
         "clinic_hours": {"start": f"{CLINIC_HOURS_START}:00", "end": f"{CLINIC_HOURS_END}:00"}
     }
 
+@app.get("/v1/doctors/{doctor_id}/calendar")
+async def get_calendar(
+    doctor_id: int,
+    from_date: str = Query(..., alias="from", description="First date in YYYY-MM-DD format"),
+    to_date: str = Query(..., alias="to", description="Last date in YYYY-MM-DD format"),
+    db: Session = Depends(get_db)
+):
+    """Available slots for every day in a date range, streamed day by day"""
+    # A directory miss queries the database: keep it off the event loop
+    if not await run_in_threadpool(doctor_directory.get, db, doctor_id):
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    
+    try:
+        first_day = datetime.strptime(from_date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be in YYYY-MM-DD format")
+    
+    if first_day < datetime.now().date():
+        raise HTTPException(status_code=400, detail="Cannot book in the past")
+    if last_day < first_day or (last_day - first_day).days >= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be 1 to {MAX_CALENDAR_DAYS} days")
+    
+    dates = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+    try:
+        bookings = await booked_slots.get_days(doctor_id, dates)
+    except httpx.HTTPError as e:
+        logger.error("booked_slots_fetch_failed", doctor_id=doctor_id, error=str(e))
+        raise HTTPException(status_code=503, detail="Appointment service unavailable")
+    
+    def body():
+        yield f'{{"doctor_id": {doctor_id}, "from": "{first_day.isoformat()}", "to": "{last_day.isoformat()}", "days": ['
+        for n, day in enumerate(dates):
+            entry = bookings[day]
+            slots = [] if entry.full else slot_grid.free_slots(day, entry.mask(slot_grid.slot_bits))
+            yield ("," if n else "") + json.dumps({
+                "date": day.isoformat(),
+                "available_slots": slots,
+                "daily_cap_reached": entry.full
+            })
+        yield "]}"
+    
+    logger.info("calendar_retrieved", doctor_id=doctor_id, days=len(dates))
+    return StreamingResponse(body(), media_type="application/json")
+
+@app.get("/v1/availability/search")
+async def search_availability(
+    department: Optional[str] = None,
+    specialization: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from", description="First date in YYYY-MM-DD format (default: today)"),
+    days: int = Query(14, ge=1, le=MAX_SEARCH_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Earliest free slots across all matching doctors"""
+    today = datetime.now().date()
+    try:
+        first_day = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else today
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from must be in YYYY-MM-DD format")
+    
+    if first_day < today:
+        raise HTTPException(status_code=400, detail="Cannot book in the past")
+    
+    def matching_doctors():
+        query = db.query(Doctor)
+        if department:
+            query = query.filter(Doctor.department == department)
+        if specialization:
+            query = query.filter(Doctor.specialization == specialization)
+        return {doctor.doctor_id: doctor for doctor in query.order_by(Doctor.doctor_id).all()}
+    
+    # Sync Session query: keep it off the event loop
+    doctors = await run_in_threadpool(matching_doctors)
+    
+    dates = [first_day + timedelta(days=n) for n in range(days)]
+    try:
+        bookings = await booked_slots.get_many(list(doctors), dates)
+    except httpx.HTTPError as e:
+        logger.error("booked_slots_fetch_failed", doctors=len(doctors), error=str(e))
+        raise HTTPException(status_code=503, detail="Appointment service unavailable")
+    
+    # Stays on the loop: it reads the booked-slot cache, which appointment events
+    # change on the loop, and costs a few milliseconds once the bitmaps are built
+    earliest = datetime.now() + timedelta(hours=MIN_LEAD_TIME_HOURS)
+    found = search(slot_grid, bookings, list(doctors), dates, earliest, limit)
+    
+    logger.info("availability_searched", department=department, specialization=specialization,
+                doctors=len(doctors), days=days, results=len(found))
+    return {
+        "from": dates[0].isoformat(),
+        "to": dates[-1].isoformat(),
+        "doctors_searched": len(doctors),
+        "results": [
+            {
+                "doctor_id": doctor_id,
+                "name": doctors[doctor_id].name,
+                "department": doctors[doctor_id].department,
+                "specialization": doctors[doctor_id].specialization,
+                "slot_start": slot_start.strftime("%Y-%m-%dT%H:%M:%S"),
+                "slot_end": slot_end.strftime("%Y-%m-%dT%H:%M:%S")
+            }
+            for doctor_id, slot_start, slot_end in found
+        ]
+    }
+
 @app.get("/v1/doctors/{doctor_id}/department")
-def get_doctor_department(doctor_id: int, db: Session = Depends(get_db)):
-    """Get doctor's department (for validation)"""
-    doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+def get_doctor_department(doctor_id: int, request: Request, db: Session = Depends(get_db)):
+    """Get doctor's department (for validation; cached, honours If-None-Match)"""
+    entry = doctor_directory.get(db, doctor_id)
     
-    if not doctor:
+    if not entry:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
-    return {"doctor_id": doctor_id, "department": doctor.department}
+    return conditional_response(request, entry.department)
+
+@app.post("/v1/events/appointments")
+async def receive_appointment_event(event: AppointmentEvent):
+    """Apply a booking, reschedule, cancel or no-show to the booked-slot cache"""
+    booked_slots.apply_event(event.appointment_id, event.doctor_id, event.slot_start, event.slot_end, event.status)
+    return {"applied": True}
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "doctor-service"}
 
-def generate_slots_for_date(date):
-    """Generate all possible slots for a given date"""
-    slots = []
-    start_time = datetime.combine(date, datetime.min.time().replace(hour=CLINIC_HOURS_START))
-    end_time = datetime.combine(date, datetime.min.time().replace(hour=CLINIC_HOURS_END))
-    
-    current = start_time
-    while current < end_time:
-        slot_end = current + timedelta(minutes=SLOT_DURATION_MINUTES)
-        slots.append({
-            "start": current.strftime("%Y-%m-%dT%H:%M:%S"),
-            "end": slot_end.strftime("%Y-%m-%dT%H:%M:%S")
-        })
-        current = slot_end
-    
-    return slots
+@app.get("/v1/metrics/doctor-cache")
+def get_doctor_cache_stats():
+    """Doctor directory cache size and hit/miss counters"""
+    return doctor_directory.stats()
+
+@app.get("/v1/metrics/slot-grid")
+def get_slot_grid_stats():
+    """Per-date slot template cache size and hit/miss counters"""
+    return slot_grid.stats()
+
+@app.get("/v1/metrics/booked-slots")
+def get_booked_slots_stats():
+    """Booked-slot cache size and hit/miss counters"""
+    return booked_slots.stats()
+
+@app.get("/v1/metrics/http-pools")
+def get_http_pool_stats():
+    """Connection pool statistics for inter-service clients"""
+    return pool_stats()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,189 @@
+"""Cache of booked slots per doctor and day, filled from the appointment service
+
+Missing days are fetched in range requests to `GET /v1/booked-slots` (up to
+BOOKED_SLOTS_FETCH_BATCH doctors each) and kept for at most BOOKED_SLOTS_TTL
+seconds. Appointment events (booked, rescheduled, cancelled, no-show) update
+cached days in place in between.
+The cache holds at most BOOKED_SLOTS_CACHE_SIZE doctor-days (LRU).
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from http_client import get_client
+
+BOOKED_SLOTS_TTL = float(os.getenv("BOOKED_SLOTS_TTL", 60))
+BOOKED_SLOTS_CACHE_SIZE = int(os.getenv("BOOKED_SLOTS_CACHE_SIZE", 50000))
+BOOKED_SLOTS_FETCH_BATCH = int(os.getenv("BOOKED_SLOTS_FETCH_BATCH", 100))
+
+# Statuses that occupy a slot and count toward the daily cap
+ACTIVE_STATUSES = ("SCHEDULED", "COMPLETED")
+
+class DayBookings:
+    """Active appointments of one doctor on one day"""
+    __slots__ = ("slots", "daily_cap", "loaded_at", "_mask")
+
+    def __init__(self, daily_cap: int, loaded_at: float):
+        # appointment_id -> (slot_start, slot_end)
+        self.slots = {}
+        self.daily_cap = daily_cap
+        self.loaded_at = loaded_at
+        self._mask = None
+
+    def add(self, appointment_id: int, slot_start: datetime, slot_end: datetime):
+        self.slots[appointment_id] = (slot_start, slot_end)
+        self._mask = None
+
+    def remove(self, appointment_id: int):
+        if self.slots.pop(appointment_id, None) is not None:
+            self._mask = None
+
+    def mask(self, slot_bits: Callable[[datetime, datetime], int]) -> int:
+        """Bitmap of booked grid slots, recomputed only after a change"""
+        if self._mask is None:
+            mask = 0
+            for slot_start, slot_end in self.slots.values():
+                mask |= slot_bits(slot_start, slot_end)
+            self._mask = mask
+        return self._mask
+
+    @property
+    def full(self) -> bool:
+        return len(self.slots) >= self.daily_cap
+
+    def is_free(self, slot_start: datetime, slot_end: datetime) -> bool:
+        return all(end <= slot_start or start >= slot_end for start, end in self.slots.values())
+
+class BookedSlotCache:
+    """TTL + LRU cache of DayBookings keyed by (doctor_id, day)"""
+
+    def __init__(self, capacity: int = BOOKED_SLOTS_CACHE_SIZE, ttl: float = BOOKED_SLOTS_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._days = OrderedDict()
+        self._doctor_days = defaultdict(set)
+        # Events applied per doctor; a fetch that overlaps an event is not cached
+        self._generation = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.fetches = 0
+        self.events = 0
+
+    def _get(self, key) -> Optional[DayBookings]:
+        entry = self._days.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl:
+            self._drop(key)
+            self.expired += 1
+            return None
+        self._days.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry: DayBookings):
+        self._days[key] = entry
+        self._days.move_to_end(key)
+        self._doctor_days[key[0]].add(key[1])
+        while len(self._days) > self.capacity:
+            self._drop(next(iter(self._days)))
+
+    def _drop(self, key):
+        del self._days[key]
+        days = self._doctor_days[key[0]]
+        days.discard(key[1])
+        if not days:
+            del self._doctor_days[key[0]]
+
+    async def get_days(self, doctor_id: int, days: List[date]) -> Dict[date, DayBookings]:
+        """Bookings of one doctor for each day"""
+        found = await self.get_many([doctor_id], days)
+        return {day: found[(doctor_id, day)] for day in days}
+
+    async def get_many(self, doctor_ids: List[int], days: List[date]) -> Dict[Tuple[int, date], DayBookings]:
+        """Bookings for every (doctor_id, day), fetching the missing ones in batches"""
+        result = {}
+        missing = set()
+        for doctor_id in doctor_ids:
+            for day in days:
+                entry = self._get((doctor_id, day))
+                if entry is None:
+                    self.misses += 1
+                    missing.add((doctor_id, day))
+                else:
+                    self.hits += 1
+                    result[(doctor_id, day)] = entry
+
+        if missing:
+            first = min(day for _, day in missing)
+            last = max(day for _, day in missing)
+            doctors = sorted({doctor_id for doctor_id, _ in missing})
+            batches = [
+                doctors[i:i + BOOKED_SLOTS_FETCH_BATCH]
+                for i in range(0, len(doctors), BOOKED_SLOTS_FETCH_BATCH)
+            ]
+            for fetched in await asyncio.gather(*(self._fetch(batch, first, last) for batch in batches)):
+                for key in missing.intersection(fetched):
+                    result[key] = fetched[key]
+        return result
+
+    async def _fetch(self, doctor_ids: List[int], first: date, last: date) -> Dict[Tuple[int, date], DayBookings]:
+        generations = {doctor_id: self._generation[doctor_id] for doctor_id in doctor_ids}
+        response = await get_client("appointment").get("/v1/booked-slots", params={
+            "doctor_id": doctor_ids,
+            "from": first.isoformat(),
+            "to": last.isoformat()
+        })
+        response.raise_for_status()
+        body = response.json()
+        self.fetches += 1
+
+        now = time.monotonic()
+        days = {
+            (doctor_id, first + timedelta(days=n)): DayBookings(body["daily_cap"], now)
+            for doctor_id in doctor_ids
+            for n in range((last - first).days + 1)
+        }
+        for appointment in body["appointments"]:
+            slot_start = datetime.fromisoformat(appointment["slot_start"])
+            slot_end = datetime.fromisoformat(appointment["slot_end"])
+            entry = days.get((appointment["doctor_id"], slot_start.date()))
+            if entry is not None:
+                entry.add(appointment["appointment_id"], slot_start, slot_end)
+
+        # The response may predate an event applied while it was in flight
+        for key, entry in days.items():
+            if self._generation[key[0]] == generations[key[0]]:
+                self._put(key, entry)
+        return days
+
+    def apply_event(self, appointment_id: int, doctor_id: int, slot_start: datetime, slot_end: datetime, status: str):
+        """Apply an appointment's current slot and status to the cached days"""
+        self.events += 1
+        self._generation[doctor_id] += 1
+
+        # A reschedule moves the appointment between days
+        for day in self._doctor_days.get(doctor_id, ()):
+            self._days[(doctor_id, day)].remove(appointment_id)
+
+        if status in ACTIVE_STATUSES:
+            entry = self._days.get((doctor_id, slot_start.date()))
+            if entry is not None:
+                entry.add(appointment_id, slot_start, slot_end)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._days),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "fetches": self.fetches,
+            "events": self.events
+        }
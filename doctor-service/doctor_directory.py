@@ -0,0 +1,144 @@
+"""Read-through cache of doctor records with strong ETags
+
+`get_doctor`, `get_doctor_department` and bulk lookups are served from the
+serialized response bodies kept here, so a repeated lookup costs no database
+round trip; a bulk lookup loads all of its misses with one IN query.
+Entries are dropped by `invalidate` whenever a doctor is written, and expire
+after DOCTOR_CACHE_TTL seconds so replicas that missed a write converge.
+The cache holds at most DOCTOR_CACHE_SIZE doctors (LRU).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from models import Doctor, DoctorResponse
+
+DOCTOR_CACHE_TTL = float(os.getenv("DOCTOR_CACHE_TTL", 300))
+DOCTOR_CACHE_SIZE = int(os.getenv("DOCTOR_CACHE_SIZE", 10000))
+
+class CachedBody:
+    """A JSON response body and its strong ETag"""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, payload: dict):
+        self.body = json.dumps(payload, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+class DirectoryEntry:
+    __slots__ = ("doctor", "department", "loaded_at")
+
+    def __init__(self, doctor: Doctor, loaded_at: float):
+        self.doctor = CachedBody(DoctorResponse.model_validate(doctor).model_dump(mode="json"))
+        self.department = CachedBody({"doctor_id": doctor.doctor_id, "department": doctor.department})
+        self.loaded_at = loaded_at
+
+class DoctorDirectory:
+    """TTL + LRU cache of DirectoryEntry keyed by doctor_id"""
+
+    def __init__(self, capacity: int = DOCTOR_CACHE_SIZE, ttl: float = DOCTOR_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Sync handlers run in the threadpool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def _lookup(self, doctor_id: int) -> Optional[DirectoryEntry]:
+        # Caller holds the lock
+        entry = self._entries.get(doctor_id)
+        if entry is not None and time.monotonic() - entry.loaded_at > self.ttl:
+            del self._entries[doctor_id]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(doctor_id)
+        self.hits += 1
+        return entry
+
+    def _store(self, doctors: List[Doctor]) -> Dict[int, DirectoryEntry]:
+        now = time.monotonic()
+        loaded = {doctor.doctor_id: DirectoryEntry(doctor, now) for doctor in doctors}
+        with self._lock:
+            for doctor_id, entry in loaded.items():
+                self._entries[doctor_id] = entry
+                self._entries.move_to_end(doctor_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return loaded
+
+    def get(self, db: Session, doctor_id: int) -> Optional[DirectoryEntry]:
+        """Cached entry for the doctor, loading it on a miss; None if the doctor does not exist"""
+        with self._lock:
+            entry = self._lookup(doctor_id)
+        if entry is not None:
+            return entry
+
+        doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+        if doctor is None:
+            return None
+        return self._store([doctor])[doctor_id]
+
+    def get_many(self, db: Session, doctor_ids: List[int]) -> Tuple[List[DirectoryEntry], List[int]]:
+        """Entries for the given ids in request order (duplicates dropped), and the ids that do not exist"""
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        with self._lock:
+            found = {doctor_id: self._lookup(doctor_id) for doctor_id in doctor_ids}
+
+        misses = [doctor_id for doctor_id, entry in found.items() if entry is None]
+        if misses:
+            found.update(self._store(db.query(Doctor).filter(Doctor.doctor_id.in_(misses)).all()))
+
+        entries = [found[doctor_id] for doctor_id in doctor_ids if found[doctor_id] is not None]
+        missing = [doctor_id for doctor_id in doctor_ids if found[doctor_id] is None]
+        return entries, missing
+
+    def invalidate(self, doctor_id: int):
+        """Drop a doctor after it was created or changed"""
+        with self._lock:
+            self._entries.pop(doctor_id, None)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "invalidations": self.invalidations
+        }
+
+def lookup_response(entries: List[DirectoryEntry], missing: List[int]) -> Response:
+    """`{"doctors": [...], "missing": [...]}` assembled from the cached bodies"""
+    body = b'{"doctors":[' + b",".join(entry.doctor.body for entry in entries) + b'],"missing":'
+    return Response(content=body + json.dumps(missing).encode() + b"}", media_type="application/json")
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+def conditional_response(request: Request, cached: CachedBody) -> Response:
+    """The cached body, or 304 Not Modified if the client already has it"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
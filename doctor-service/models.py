@@ -1,8 +1,8 @@
 """Database models and schemas"""
 from sqlalchemy import Column, Integer, String, DateTime
 from sqlalchemy.sql import func
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
 from datetime import datetime
 
 from database import Base
@@ -37,7 +37,21 @@ class DoctorResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DoctorLookup(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class DoctorLookupResponse(BaseModel):
+    doctors: List[DoctorResponse]
+    missing: List[int]
+
 class SlotAvailability(BaseModel):
     start: str
     end: str
 
+class AppointmentEvent(BaseModel):
+    """Current slot and status of an appointment, sent by the appointment service"""
+    appointment_id: int
+    doctor_id: int
+    slot_start: datetime
+    slot_end: datetime
+    status: str
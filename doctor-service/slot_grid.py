@@ -0,0 +1,91 @@
+"""The clinic's slot grid, compiled once
+
+Slot offsets and their "HH:MM:SS" start/end strings are computed when the
+grid is built; the slot list for a date only prefixes them with the date and
+is memoized for the last SLOT_GRID_CACHE_SIZE dates (LRU). Booked slots are
+matched against the grid as bitmaps (bit i is the slot starting i slot
+lengths after opening).
+"""
+import math
+import os
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+SLOT_GRID_CACHE_SIZE = int(os.getenv("SLOT_GRID_CACHE_SIZE", 366))
+
+# slot_bits only depends on the time of day and length; any day will do
+_REFERENCE_DAY = date(2000, 1, 1)
+
+class SlotGrid:
+    """Fixed-length slots between clinic opening and closing"""
+
+    def __init__(self, start_hour: int, end_hour: int, slot_minutes: int, cache_size: int = SLOT_GRID_CACHE_SIZE):
+        self.start_hour = start_hour
+        self.slot_minutes = slot_minutes
+        self.size = (end_hour - start_hour) * 60 // slot_minutes
+        self.full_mask = (1 << self.size) - 1
+        self.bit_values = np.left_shift(np.uint32(1), np.arange(self.size, dtype=np.uint32))
+
+        opening = datetime.combine(date.min, time(start_hour))
+        self._template = tuple(
+            (
+                (opening + timedelta(minutes=i * slot_minutes)).strftime("%H:%M:%S"),
+                (opening + timedelta(minutes=(i + 1) * slot_minutes)).strftime("%H:%M:%S")
+            )
+            for i in range(self.size)
+        )
+        self.slots_for = lru_cache(maxsize=cache_size)(self._slots_for)
+        # Bookings repeat the same few start times and lengths
+        self._bits_at = lru_cache(maxsize=1024)(self._bits_at)
+
+    def _slots_for(self, day: date) -> Tuple[dict, ...]:
+        prefix = day.isoformat() + "T"
+        return tuple({"start": prefix + start, "end": prefix + end} for start, end in self._template)
+
+    def free_slots(self, day: date, booked_mask: int) -> list:
+        """Slots of `day` whose bit is not set in `booked_mask`"""
+        return [slot for i, slot in enumerate(self.slots_for(day)) if not booked_mask >> i & 1]
+
+    def _offset(self, day: date, moment: datetime) -> float:
+        """Position of `moment` on `day`'s grid, in slots"""
+        minutes = (moment.toordinal() - day.toordinal()) * 1440 + moment.hour * 60 + moment.minute + moment.second / 60
+        return (minutes - self.start_hour * 60) / self.slot_minutes
+
+    def slot_bits(self, slot_start: datetime, slot_end: datetime) -> int:
+        """Bits of the grid slots that overlap [slot_start, slot_end)"""
+        return self._bits_at(slot_start.time(), slot_end - slot_start)
+
+    def _bits_at(self, start: time, length: timedelta) -> int:
+        slot_start = datetime.combine(_REFERENCE_DAY, start)
+        first = max(math.floor(self._offset(_REFERENCE_DAY, slot_start)), 0)
+        last = min(math.ceil(self._offset(_REFERENCE_DAY, slot_start + length)), self.size)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def starting_from(self, day: date, earliest: datetime) -> int:
+        """Bits of the slots on `day` that start at or after `earliest`"""
+        first = math.ceil(self._offset(day, earliest))
+        if first <= 0:
+            return self.full_mask
+        if first >= self.size:
+            return 0
+        return self.full_mask & ~((1 << first) - 1)
+
+    def slot_at(self, day: date, index: int) -> Tuple[datetime, datetime]:
+        start = datetime.combine(day, time(self.start_hour)) + timedelta(minutes=index * self.slot_minutes)
+        return start, start + timedelta(minutes=self.slot_minutes)
+
+    def stats(self) -> dict:
+        info = self.slots_for.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "size": info.currsize,
+            "capacity": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,95 @@
+"""Earliest free slot search across many doctors with per-day slot bitmaps
+
+Each doctor-day is a bitmap over the clinic's slot grid (bit i is the slot
+starting i slot lengths after opening). The bitmaps of all matching doctors
+form one (doctors, days) array; free slots, lead time and the daily cap are
+applied to the whole array at once and each doctor's earliest free slot is a
+single argmax over its flattened day-by-slot bits. Days are scanned in chunks
+that double from one day up to SEARCH_DAY_CHUNK, stopping once enough doctors
+have a free slot, so a search usually builds the bitmaps of its first days
+only; days at the daily cap get no bitmap at all.
+"""
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from booked_slots import DayBookings
+from slot_grid import SlotGrid
+
+SEARCH_DAY_CHUNK = 7
+
+def build_masks(
+    grid: SlotGrid,
+    bookings: Dict[Tuple[int, date], DayBookings],
+    doctor_ids: List[int],
+    days: List[date]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Booked-slot bitmaps and daily-cap flags, both shaped (doctors, days)"""
+    entries = [bookings[(doctor_id, day)] for doctor_id in doctor_ids for day in days]
+    shape = (len(doctor_ids), len(days))
+    # A day at the cap has no free slot whatever is booked: skip building its bitmap
+    booked = np.fromiter(
+        (0 if entry.full else entry.mask(grid.slot_bits) for entry in entries), dtype=np.uint32, count=len(entries)
+    )
+    full = np.fromiter((entry.full for entry in entries), dtype=bool, count=len(entries))
+    return booked.reshape(shape), full.reshape(shape)
+
+def earliest_free(
+    grid: SlotGrid,
+    booked: np.ndarray,
+    full: np.ndarray,
+    allowed: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per doctor: whether any slot is free, and the flat day * grid.size + slot of the first one
+
+    `allowed` holds one bitmap per day of the slots that may still be booked
+    (clinic hours and lead time).
+    """
+    free = ~booked & allowed[np.newaxis, :]
+    free[full] = 0
+    bits = (free[:, :, np.newaxis] & grid.bit_values) != 0
+    flat = bits.reshape(len(free), -1)
+    return flat.any(axis=1), flat.argmax(axis=1)
+
+def search(
+    grid: SlotGrid,
+    bookings: Dict[Tuple[int, date], DayBookings],
+    doctor_ids: List[int],
+    days: List[date],
+    earliest: datetime,
+    limit: int
+) -> List[Tuple[int, datetime, datetime]]:
+    """Up to `limit` (doctor_id, slot_start, slot_end), earliest slot first"""
+    ids = np.asarray(doctor_ids, dtype=np.int64)
+    pending = np.arange(len(ids))
+    found_rows, found_slots = [], []
+    offset, chunk_days = 0, 1
+    while offset < len(days):
+        # Any slot found in a later chunk is later than every slot found so far
+        if len(pending) == 0 or sum(map(len, found_rows)) >= limit:
+            break
+        chunk = days[offset:offset + chunk_days]
+        booked, full = build_masks(grid, bookings, [doctor_ids[row] for row in pending], chunk)
+        allowed = np.array([grid.starting_from(day, earliest) for day in chunk], dtype=np.uint32)
+        has_free, first = earliest_free(grid, booked, full, allowed)
+        found_rows.append(pending[has_free])
+        found_slots.append(first[has_free] + offset * grid.size)
+        pending = pending[~has_free]
+        offset += len(chunk)
+        chunk_days = min(chunk_days * 2, SEARCH_DAY_CHUNK)
+
+    if not found_rows:
+        return []
+    rows = np.concatenate(found_rows)
+    slots = np.concatenate(found_slots)
+
+    # Earliest slot first, then lowest doctor_id
+    order = np.lexsort((ids[rows], slots))[:limit]
+
+    results = []
+    for row, flat in zip(rows[order], slots[order]):
+        day_index, slot = divmod(int(flat), grid.size)
+        slot_start, slot_end = grid.slot_at(days[day_index], slot)
+        results.append((doctor_ids[row], slot_start, slot_end))
+    return results
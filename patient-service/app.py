@@ -1,15 +1,21 @@
 """
 Patient Service - CRUD operations for patients
 """
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import structlog
 from datetime import datetime
 from typing import List, Optional
-from database import get_db, init_db
-from models import Patient, PatientCreate, PatientUpdate, PatientResponse
+from database import SessionLocal, get_db, init_db
+from models import Patient, PatientCreate, PatientUpdate, PatientResponse, PatientExistsRequest, PatientExistsResponse
+from importer import FORMATS, import_patients, report_blocks
+from patient_ids import known_patients
+from search_index import search_patients
+from export import EXPORT_FORMATS, export_table
 from utils import mask_pii
 
 # Structured logging with PII masking
@@ -36,6 +42,12 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup():
     init_db()
+    db = SessionLocal()
+    try:
+        known_patients.load(db)
+    finally:
+        db.close()
+    logger.info("patient_ids_loaded", **known_patients.stats())
 
 @app.get("/v1/patients", response_model=List[PatientResponse])
 def get_patients(
@@ -45,15 +57,18 @@ def get_patients(
     phone: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get all patients with optional filtering"""
-    query = db.query(Patient)
-    
-    if name:
-        query = query.filter(Patient.name.ilike(f"%{name}%"))
-    
-    if phone:
-        query = query.filter(Patient.phone.ilike(f"%{phone}%"))
+    """Get all patients, or search by name/phone substring (ranked, prefix matches first)"""
+    if name or phone:
+        patients = search_patients(db, name, phone, skip, limit)
+        
+        logger.info(
+            "patients_searched",
+            returned=len(patients),
+            filters={"name": mask_pii("name", name), "phone": mask_pii("phone", phone)}
+        )
+        return patients
     
+    query = db.query(Patient)
     total = query.count()
     patients = query.offset(skip).limit(limit).all()
     
@@ -67,6 +82,21 @@ def get_patients(
     
     return patients
 
+@app.get("/v1/patients/export")
+def export_patients(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    updated_since: Optional[datetime] = Query(None, description="Only rows updated at or after this time (ISO 8601)")
+):
+    """Stream every patient (or those updated since a time) as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    return StreamingResponse(
+        export_table(Patient, format, updated_since),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=patients.{format}"}
+    )
+
 @app.get("/v1/patients/{patient_id}", response_model=PatientResponse)
 def get_patient(patient_id: int, db: Session = Depends(get_db)):
     """Get patient by ID"""
@@ -92,6 +122,7 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     db.add(db_patient)
     db.commit()
     db.refresh(db_patient)
+    known_patients.add([db_patient.patient_id])
     
     logger.info(
         "patient_created",
@@ -101,6 +132,17 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     
     return db_patient
 
+@app.post("/v1/patients:import")
+async def import_patients_stream(request: Request):
+    """Bulk import patients from streamed CSV or NDJSON; responds with one NDJSON result per row"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = FORMATS.get(content_type)
+    if not fmt:
+        raise HTTPException(status_code=415, detail="Body must be text/csv or application/x-ndjson")
+    
+    report = await import_patients(request.stream(), fmt)
+    return StreamingResponse(report_blocks(report), media_type="application/x-ndjson", background=BackgroundTask(report.close))
+
 @app.put("/v1/patients/{patient_id}", response_model=PatientResponse)
 def update_patient(
     patient_id: int,
@@ -134,6 +176,7 @@ def delete_patient(patient_id: int, db: Session = Depends(get_db)):
     # In a real system, you might want to check for active appointments
     db.delete(db_patient)
     db.commit()
+    known_patients.discard(patient_id)
     
     logger.info("patient_deleted", patient_id=patient_id)
     return None
@@ -141,7 +184,14 @@ def delete_patient(patient_id: int, db: Session = Depends(get_db)):
 @app.get("/v1/patients/{patient_id}/exists")
 def check_patient_exists(patient_id: int, db: Session = Depends(get_db)):
     """Check if patient exists"""
-    exists = db.query(Patient).filter(Patient.patient_id == patient_id).first() is not None
+    return {"exists": known_patients.exists(db, [patient_id])[patient_id]}
+
+@app.post("/v1/patients/exists", response_model=PatientExistsResponse)
+def check_patients_exist(request: PatientExistsRequest, db: Session = Depends(get_db)):
+    """Check many patients at once; returns a map of patient_id -> exists"""
+    exists = known_patients.exists(db, request.ids)
+    
+    logger.info("patients_exist_checked", requested=len(request.ids), found=sum(exists.values()))
     return {"exists": exists}
 
 @app.get("/health")
@@ -149,6 +199,11 @@ def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "patient-service"}
 
+@app.get("/v1/metrics/patient-ids")
+def get_patient_ids_stats():
+    """Existence-check bitmap size and hit counters"""
+    return known_patients.stats()
+
 if __name__ == "__main__":
     import uvicorn
     import os
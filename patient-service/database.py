@@ -26,5 +26,9 @@ def get_db():
 def init_db():
     """Initialize database"""
     from models import Patient
+    from migrations import run_migrations
+    from search_index import ensure_search_index
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine, Base.metadata)
+    ensure_search_index(engine)
 
@@ -0,0 +1,161 @@
+"""Bulk patient import from streamed NDJSON or CSV
+
+Rows are read from the request body as it arrives and handled in chunks of
+IMPORT_CHUNK_SIZE: each row is validated against PatientCreate, emails are
+deduplicated inside the chunk and checked against the database with one
+IN query, and the new rows are inserted with one executemany in their own
+transaction. Every input row gets one result line in the report, which is
+spooled (to disk past IMPORT_REPORT_MEMORY bytes) while the upload is read
+and streamed back once it is complete: reading the request while writing the
+response would stall clients that send their whole body before reading.
+
+CSV input uses the `hms_patients.csv` layout (header row; `patient_id` and
+`created_at` are ignored, new IDs are assigned). Quoted fields may not span
+lines.
+"""
+import csv
+import json
+import os
+import tempfile
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+import structlog
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Patient, PatientCreate
+from patient_ids import known_patients
+
+logger = structlog.get_logger()
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 1000))
+IMPORT_REPORT_MEMORY = int(os.getenv("IMPORT_REPORT_MEMORY", 1024 * 1024))
+
+FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decoded lines of a streamed body, without line endings"""
+    pending = b""
+    async for data in body:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+async def _records(body: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, dict or parse error message) per non-empty input row"""
+    header = None
+    line_number = 0
+    async for line in _lines(body):
+        line_number += 1
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            yield line_number, record if isinstance(record, dict) else "Row must be a JSON object"
+        elif header is None:
+            header = next(csv.reader([line]))
+        else:
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield line_number, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield line_number, dict(zip(header, values))
+
+def _validate(record) -> Tuple[Dict, str]:
+    if isinstance(record, str):
+        return None, record
+    try:
+        patient = PatientCreate.model_validate({key: record.get(key) for key in PatientCreate.model_fields})
+    except ValidationError as e:
+        error = e.errors()[0]
+        return None, f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+    return patient.model_dump(), None
+
+def import_chunk(rows: List[Tuple[int, object]]) -> List[dict]:
+    """Validate, deduplicate and insert one chunk; one result per row"""
+    results = {}
+    pending = {}
+    for line, record in rows:
+        values, error = _validate(record)
+        if error:
+            results[line] = {"line": line, "status": "invalid", "detail": error}
+        elif values["email"] in pending:
+            results[line] = {"line": line, "status": "duplicate", "detail": "Email repeated in import"}
+        else:
+            pending[values["email"]] = (line, values)
+
+    db = SessionLocal()
+    try:
+        for attempt in range(2):
+            existing = {
+                email for (email,) in
+                db.query(Patient.email).filter(Patient.email.in_(list(pending))).all()
+            } if pending else set()
+            for email in existing:
+                line, _ = pending.pop(email)
+                results[line] = {"line": line, "status": "exists", "detail": "Patient with this email already exists"}
+            if not pending:
+                break
+            try:
+                created = db.execute(
+                    insert(Patient).returning(Patient.patient_id, Patient.email),
+                    [values for _, values in pending.values()]
+                ).all()
+                db.commit()
+            except IntegrityError:
+                # An email was created concurrently after the check; check again
+                db.rollback()
+                if attempt:
+                    raise
+                continue
+            for patient_id, email in created:
+                line, _ = pending[email]
+                results[line] = {"line": line, "status": "created", "patient_id": patient_id}
+            known_patients.add(patient_id for patient_id, _ in created)
+            break
+    finally:
+        db.close()
+
+    return [results[line] for line, _ in rows]
+
+async def import_patients(body: AsyncIterator[bytes], fmt: str) -> tempfile.SpooledTemporaryFile:
+    """Import every row; returns the NDJSON report (one line per row, then a summary line), rewound"""
+    summary = {"created": 0, "exists": 0, "duplicate": 0, "invalid": 0}
+    report = tempfile.SpooledTemporaryFile(max_size=IMPORT_REPORT_MEMORY, mode="w+b")
+    chunk = []
+
+    async def flush():
+        for result in await run_in_threadpool(import_chunk, chunk):
+            summary[result["status"]] += 1
+            report.write(json.dumps(result).encode() + b"\n")
+        chunk.clear()
+
+    try:
+        async for row in _records(body, fmt):
+            chunk.append(row)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+    except BaseException:
+        report.close()
+        raise
+
+    logger.info("patients_imported", **summary)
+    report.write(json.dumps({"summary": summary}).encode() + b"\n")
+    report.seek(0)
+    return report
+
+def report_blocks(report: tempfile.SpooledTemporaryFile, block_size: int = 65536) -> Iterator[bytes]:
+    """The report in fixed-size blocks; iterating the file would send one line (and one threadpool hop) per row"""
+    return iter(lambda: report.read(block_size), b"")
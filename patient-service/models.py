@@ -1,8 +1,8 @@
 """Database models and schemas"""
 from sqlalchemy import Column, Integer, String, Date, DateTime
 from sqlalchemy.sql import func
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Optional
 from datetime import date, datetime
 
 # SQLAlchemy Model
@@ -17,6 +17,8 @@ class Patient(Base):
     phone = Column(String, nullable=False)
     dob = Column(Date, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Client-side SQL default so rows inserted into a migrated table get it too
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
 
 # Pydantic Schemas
 class PatientBase(BaseModel):
@@ -41,3 +43,8 @@ class PatientResponse(PatientBase):
     class Config:
         from_attributes = True
 
+class PatientExistsRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class PatientExistsResponse(BaseModel):
+    exists: Dict[int, bool]
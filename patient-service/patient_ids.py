@@ -0,0 +1,139 @@
+"""In-memory set of existing patient IDs for existence checks
+
+IDs are dense integers, so the set is a bitmap (one bit per ID: 125 KB per
+million patients) loaded with a key-only query at startup and reloaded every
+PATIENT_IDS_REFRESH seconds, by one request while the others keep using the
+current bitmap. Creates, imports and deletes in this process
+update it immediately. An ID missing from the bitmap may have been created
+by another replica, so misses are confirmed with one key-only IN query and
+absent IDs are remembered for PATIENT_IDS_NEGATIVE_TTL seconds.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Patient
+
+PATIENT_IDS_REFRESH = float(os.getenv("PATIENT_IDS_REFRESH", 300))
+PATIENT_IDS_NEGATIVE_TTL = float(os.getenv("PATIENT_IDS_NEGATIVE_TTL", 5))
+PATIENT_IDS_NEGATIVE_SIZE = int(os.getenv("PATIENT_IDS_NEGATIVE_SIZE", 100000))
+
+class PatientIds:
+    """Bitmap of existing patient IDs with a short-lived negative cache"""
+
+    def __init__(self, refresh: float = PATIENT_IDS_REFRESH, negative_ttl: float = PATIENT_IDS_NEGATIVE_TTL):
+        self.refresh = refresh
+        self.negative_ttl = negative_ttl
+        self._bits = bytearray()
+        self._count = 0
+        self._loaded_at = None
+        # patient_id -> monotonic time the miss expires
+        self._absent = {}
+        # Sync handlers run in the threadpool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.db_checks = 0
+        self.reloads = 0
+
+    def _has(self, patient_id: int) -> bool:
+        byte = patient_id >> 3
+        return 0 <= byte < len(self._bits) and bool(self._bits[byte] >> (patient_id & 7) & 1)
+
+    def _set(self, patient_id: int):
+        byte = patient_id >> 3
+        if byte >= len(self._bits):
+            # Grow with headroom so sequential creates do not resize every time
+            self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits) // 4)))
+        if not self._bits[byte] >> (patient_id & 7) & 1:
+            self._bits[byte] |= 1 << (patient_id & 7)
+            self._count += 1
+
+    def load(self, db: Session):
+        """Rebuild the bitmap from the patients table (key-only scan)"""
+        ids = db.execute(select(Patient.patient_id)).scalars().all()
+        with self._lock:
+            self._bits = bytearray()
+            self._count = 0
+            for patient_id in ids:
+                self._set(patient_id)
+            self._absent.clear()
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def add(self, patient_ids: Iterable[int]):
+        with self._lock:
+            for patient_id in patient_ids:
+                self._set(patient_id)
+                self._absent.pop(patient_id, None)
+
+    def discard(self, patient_id: int):
+        with self._lock:
+            byte = patient_id >> 3
+            if self._has(patient_id):
+                self._bits[byte] &= ~(1 << (patient_id & 7)) & 0xFF
+                self._count -= 1
+
+    def _claim_reload(self) -> bool:
+        """True for the one caller that should reload a stale bitmap"""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._loaded_at <= self.refresh:
+                return False
+            # Others keep using the current bitmap while this caller reloads it
+            self._loaded_at = now
+            return True
+
+    def exists(self, db: Session, patient_ids: List[int]) -> Dict[int, bool]:
+        """Existence of each ID, querying the database only for bitmap misses"""
+        if self._claim_reload():
+            self.load(db)
+
+        result = {}
+        unknown = []
+        now = time.monotonic()
+        with self._lock:
+            for patient_id in patient_ids:
+                if self._has(patient_id):
+                    self.hits += 1
+                    result[patient_id] = True
+                elif self._absent.get(patient_id, 0) > now:
+                    self.negative_hits += 1
+                    result[patient_id] = False
+                else:
+                    unknown.append(patient_id)
+
+        if unknown:
+            self.db_checks += 1
+            found = set(db.execute(
+                select(Patient.patient_id).where(Patient.patient_id.in_(unknown))
+            ).scalars())
+            with self._lock:
+                for patient_id in unknown:
+                    if patient_id in found:
+                        self._set(patient_id)
+                    else:
+                        if len(self._absent) >= PATIENT_IDS_NEGATIVE_SIZE:
+                            self._absent.clear()
+                        self._absent[patient_id] = now + self.negative_ttl
+                    result[patient_id] = patient_id in found
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "patients": self._count,
+            "bitmap_bytes": len(self._bits),
+            "negative_entries": len(self._absent),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "db_checks": self.db_checks,
+            "reloads": self.reloads,
+            "refresh_seconds": self.refresh
+        }
+
+# Shared by the handlers and the bulk importer
+known_patients = PatientIds()
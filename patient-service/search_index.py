@@ -0,0 +1,123 @@
+"""Substring search index over patient name and phone
+
+SQLite: an FTS5 table with the trigram tokenizer (`patients_fts`, external
+content on `patients`), kept in sync by insert/update/delete triggers so
+every writer, including bulk loads, updates it. PostgreSQL: pg_trgm GIN
+indexes, which serve the same `ILIKE '%term%'` filters.
+
+Trigram matching needs at least 3 characters; shorter terms fall back to a
+scan. Results are ranked: name (or phone) prefix first, then a word in the
+name starting with the term, then any other substring.
+"""
+from typing import List, Optional
+
+import structlog
+from sqlalchemy import case, column, literal_column, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models import Patient
+
+logger = structlog.get_logger()
+
+MIN_TRIGRAM_TERM = 3
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE patients_fts USING fts5(
+        name, phone, content='patients', content_rowid='patient_id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts(rowid, name, phone) VALUES (new.patient_id, new.name, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, name, phone) VALUES ('delete', old.patient_id, old.name, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE OF name, phone ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, name, phone) VALUES ('delete', old.patient_id, old.name, old.phone);
+        INSERT INTO patients_fts(rowid, name, phone) VALUES (new.patient_id, new.name, new.phone);
+    END""",
+    # Index the rows that existed before the table
+    "INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')"
+]
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_patients_name_trgm ON patients USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_patients_phone_trgm ON patients USING gin (phone gin_trgm_ops)"
+]
+
+patients_fts = table("patients_fts", column("rowid"))
+
+# Set by ensure_search_index: the FTS5 table exists and can be queried
+fts_enabled = False
+
+def ensure_search_index(engine: Engine):
+    """Create the index (and backfill it) if it does not exist yet"""
+    global fts_enabled
+    dialect = engine.dialect.name
+
+    if dialect == "sqlite":
+        with engine.connect() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+            )).first()
+        if not exists:
+            try:
+                with engine.begin() as conn:
+                    for statement in _SQLITE_DDL:
+                        conn.execute(text(statement))
+            except OperationalError as e:
+                # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+                logger.warning("patient_search_index_unavailable", error=str(e))
+                return
+            logger.info("patient_search_index_created", kind="fts5_trigram")
+        fts_enabled = True
+
+    elif dialect == "postgresql":
+        with engine.begin() as conn:
+            for statement in _POSTGRES_DDL:
+                conn.execute(text(statement))
+
+def _fts_phrase(column_name: str, term: str) -> str:
+    return f'{column_name} : "' + term.replace('"', '""') + '"'
+
+def _like_literal(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_patients(
+    db: Session,
+    name: Optional[str],
+    phone: Optional[str],
+    skip: int,
+    limit: int
+) -> List[Patient]:
+    """Patients whose name and phone contain the given terms, best matches first"""
+    query = db.query(Patient)
+
+    phrases = []
+    for field, term in (("name", name), ("phone", phone)):
+        if not term:
+            continue
+        if fts_enabled and len(term) >= MIN_TRIGRAM_TERM:
+            phrases.append(_fts_phrase(field, term))
+        else:
+            query = query.filter(getattr(Patient, field).ilike(f"%{term}%"))
+
+    if phrases:
+        matches = select(patients_fts.c.rowid).where(
+            literal_column("patients_fts").op("MATCH")(" AND ".join(phrases))
+        )
+        query = query.filter(Patient.patient_id.in_(matches))
+
+    if name:
+        literal = _like_literal(name)
+        rank = case(
+            (Patient.name.ilike(f"{literal}%", escape="\\"), 0),
+            (Patient.name.ilike(f"% {literal}%", escape="\\"), 1),
+            else_=2
+        )
+    else:
+        rank = case((Patient.phone.ilike(f"{_like_literal(phone)}%", escape="\\"), 0), else_=1)
+
+    return query.order_by(rank, Patient.patient_id).offset(skip).limit(limit).all()
@@ -1,14 +1,27 @@
 """
 Payment Service - Handle payments with idempotency
 """
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+from decimal import Decimal
+from typing import List, Tuple
 import structlog
+import httpx
+import json
+import os
 
-from database import get_db, init_db
-from models import Payment, PaymentCreate, PaymentResponse
+from database import engine, get_db, init_db
+from models import Payment, PaymentCreate, PaymentResponse, PaymentLookup
+from http_client import init_clients, get_client, close_clients, pool_stats
+from idempotency import IdempotencyCache, payment_insert
+from export import EXPORT_FORMATS, export_table
+from settlement import FORMATS, ingest_payments, report_blocks
+from reconciliation import PAYMENTS_QUERY, Reconciler, bill_export, database_rows, ndjson_chunks
 
 logger = structlog.get_logger()
 
@@ -29,28 +42,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+BILLING_SERVICE_URL = os.getenv("BILLING_SERVICE_URL", "http://localhost:8003")
+
+# Responses of recent Idempotency-Keys; concurrent duplicates wait for the first
+idempotency_cache = IdempotencyCache()
+
 @app.on_event("startup")
 async def startup():
     init_db()
+    init_clients({"billing": BILLING_SERVICE_URL})
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_clients()
+
+async def notify_billing(payment_id: int, bill_id: int, amount: Decimal):
+    """Tell billing a payment was recorded so it updates the patient's balance and cached ledger"""
+    try:
+        response = await get_client("billing").post(
+            "/v1/events/payments", json={"payment_id": payment_id, "bill_id": bill_id, "amount": str(amount)}
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        # The cached ledger expires on its own (LEDGER_CACHE_TTL)
+        logger.warning("billing_notify_failed", payment_id=payment_id, bill_id=bill_id, error=str(e))
+
+async def notify_billing_batch(payments: List[dict]):
+    """Tell billing about bulk-ingested payments (payment_id, bill_id, amount), 1000 per call"""
+    for i in range(0, len(payments), 1000):
+        chunk = payments[i:i + 1000]
+        try:
+            response = await get_client("billing").post("/v1/events/payments:batch", json={"payments": chunk})
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("billing_notify_failed", payments=len(chunk), error=str(e))
+
+def record_payment(db: Session, payment: PaymentCreate, idempotency_key: str) -> Tuple[PaymentResponse, bool]:
+    """Insert the payment unless its key is taken, in one statement; (payment, created)"""
+    row = db.execute(
+        payment_insert(db.bind.dialect.name),
+        {**payment.model_dump(), "reference": idempotency_key}
+    ).first()
+    created = row is not None
+    if created:
+        db.commit()
+    else:
+        # Recorded earlier (or by another process): return that payment
+        db.rollback()
+        row = db.query(Payment).filter(Payment.reference == idempotency_key).one()
+    return PaymentResponse.model_validate(row), created
 
 @app.post("/v1/payments", response_model=PaymentResponse, status_code=201)
-def create_payment(
+async def create_payment(
     payment: PaymentCreate,
+    background_tasks: BackgroundTasks,
     idempotency_key: str = Header(..., alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
     """Create a payment (idempotent operation)"""
-    # Check if payment with this idempotency key already exists
-    existing = db.query(Payment).filter(Payment.reference == idempotency_key).first()
-    if existing:
-        logger.info("payment_already_exists", idempotency_key=idempotency_key)
-        return existing
+    replay = await idempotency_cache.begin(idempotency_key)
+    if replay is not None:
+        logger.info("payment_already_exists", idempotency_key=idempotency_key, cached=True)
+        return replay
     
-    db_payment = Payment(**payment.dict())
-    db_payment.reference = idempotency_key
-    db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
+    try:
+        db_payment, created = await run_in_threadpool(record_payment, db, payment, idempotency_key)
+    except BaseException as e:
+        idempotency_cache.fail(idempotency_key, e)
+        raise
+    idempotency_cache.complete(idempotency_key, db_payment)
+    
+    if not created:
+        logger.info("payment_already_exists", idempotency_key=idempotency_key, cached=False)
+        return db_payment
+    
+    background_tasks.add_task(notify_billing, db_payment.payment_id, db_payment.bill_id, db_payment.amount)
     
     logger.info(
         "payment_created",
@@ -78,6 +144,60 @@ def get_payments(
     payments = query.offset(skip).limit(limit).all()
     return payments
 
+@app.post("/v1/payments:batch")
+async def ingest_payments_stream(request: Request):
+    """Bulk ingest a streamed settlement file (CSV or NDJSON); responds with one NDJSON result per row"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = FORMATS.get(content_type)
+    if not fmt:
+        raise HTTPException(status_code=415, detail="Body must be text/csv or application/x-ndjson")
+    
+    report = await ingest_payments(request.stream(), fmt, notify_billing_batch)
+    return StreamingResponse(report_blocks(report), media_type="application/x-ndjson", background=BackgroundTask(report.close))
+
+@app.post("/v1/payments:lookup", response_model=list[PaymentResponse])
+def lookup_payments(lookup: PaymentLookup, db: Session = Depends(get_db)):
+    """Payments of up to 1000 bills in one call, oldest first"""
+    payments = db.query(Payment).filter(
+        Payment.bill_id.in_(set(lookup.bill_ids))
+    ).order_by(Payment.paid_at, Payment.payment_id).all()
+    
+    logger.info("payments_looked_up", bills=len(lookup.bill_ids), returned=len(payments))
+    return payments
+
+@app.get("/v1/payments/export")
+def export_payments(format: str = Query("ndjson", description="ndjson or csv")):
+    """Stream every payment as NDJSON or CSV, sorted by bill_id (to merge with the bills export)"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    return StreamingResponse(
+        export_table(Payment, format, order_by=[Payment.bill_id, Payment.payment_id]),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=payments.{format}"}
+    )
+
+@app.get("/v1/payments/reconciliation")
+def reconcile_payments(
+    include_matched: bool = Query(False, description="Also report bills whose payments match")
+):
+    """Reconcile every bill with its payments; one NDJSON line per issue, then a summary line"""
+    try:
+        bills = bill_export(BILLING_SERVICE_URL)
+    except httpx.HTTPError as e:
+        logger.error("bill_export_failed", error=str(e))
+        raise HTTPException(status_code=503, detail="Billing service unavailable")
+    
+    reconciler = Reconciler(include_matched)
+    
+    def report():
+        yield from ndjson_chunks(reconciler.run(bills, database_rows(engine, PAYMENTS_QUERY)))
+        summary = reconciler.summary_json()
+        logger.info("payments_reconciled", **summary)
+        yield (json.dumps({"summary": summary}) + "\n").encode()
+    
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
 @app.get("/v1/payments/{payment_id}", response_model=PaymentResponse)
 def get_payment(payment_id: int, db: Session = Depends(get_db)):
     """Get payment by ID"""
@@ -92,6 +212,16 @@ def get_payment(payment_id: int, db: Session = Depends(get_db)):
 def health_check():
     return {"status": "healthy", "service": "payment-service"}
 
+@app.get("/v1/metrics/idempotency")
+def get_idempotency_stats():
+    """Idempotency cache statistics"""
+    return idempotency_cache.stats()
+
+@app.get("/v1/metrics/http-pools")
+def get_http_pool_stats():
+    """Connection pool statistics for inter-service clients"""
+    return pool_stats()
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,110 @@
+"""Recent Idempotency-Key responses (TTL + LRU) with in-flight request collapsing
+
+payments.reference stays the durable record of a key, written by
+`payment_insert` without a prior lookup; the cache only saves the lookup for
+retries of recent keys and makes concurrent duplicates wait for the first
+request instead of racing it to the unique index.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Payment
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", 3600))
+
+# dialect -> INSERT ... ON CONFLICT (reference) DO NOTHING RETURNING *; built
+# once, since ON CONFLICT statements are not in SQLAlchemy's compiled cache
+_payment_inserts = {}
+
+def payment_insert(dialect_name: str):
+    """Insert of payments whose reference is not taken yet; returns only the rows inserted"""
+    statement = _payment_inserts.get(dialect_name)
+    if statement is None:
+        table = Payment.__table__
+        statement = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+        statement = statement.on_conflict_do_nothing(index_elements=["reference"]).returning(*table.columns)
+        _payment_inserts[dialect_name] = statement
+    return statement
+
+class IdempotencyCache:
+    """Stored responses of recent keys, plus one future per key being processed
+
+    Usage per keyed request (all on the event loop, so no lock is needed):
+      replay = await cache.begin(key)  # stored response, or None if we own the key
+      cache.complete(key, response)  # once the payment is committed (or found)
+      cache.fail(key, exc)  # if the work raised
+    """
+
+    def __init__(self, capacity: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        # key -> (response, monotonic time stored)
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.collapsed = 0
+
+    def get(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            del self._cache[key]
+            self.expired += 1
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    async def begin(self, key: str):
+        """Return the response for a key, or None if the caller should do the work"""
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+
+        # Another request with this key is running: wait for its outcome
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.collapsed += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def complete(self, key: str, response):
+        """Cache the committed response and release waiting duplicates"""
+        self._cache[key] = (response, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_result(response)
+
+    def fail(self, key: str, exc: BaseException):
+        """Propagate a failure to waiting duplicates; the key stays unused"""
+        future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_exception(exc)
+            # Mark as retrieved so a failure nobody waited for is not logged
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "collapsed": self.collapsed
+        }
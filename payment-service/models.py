@@ -1,7 +1,8 @@
 """Database models and schemas"""
 from sqlalchemy import Column, Integer, String, Numeric, DateTime
 from sqlalchemy.sql import func
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
 
@@ -22,6 +23,11 @@ class PaymentCreate(BaseModel):
     amount: float
     method: str
 
+class PaymentBatchRow(PaymentCreate):
+    """One payment of a settlement file; `reference` is its idempotency key"""
+    reference: str = Field(..., min_length=1)
+    paid_at: Optional[datetime] = None
+
 class PaymentResponse(BaseModel):
     payment_id: int
     bill_id: int
@@ -33,3 +39,5 @@ class PaymentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class PaymentLookup(BaseModel):
+    bill_ids: List[int] = Field(..., min_length=1, max_length=1000)
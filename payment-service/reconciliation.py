@@ -0,0 +1,190 @@
+"""Bill-to-payment reconciliation by sort-merge join on bill_id
+
+Both sides are read as streams sorted by bill_id, either from the services'
+export endpoints (`ExportStream`) or straight from a database cursor
+(`database_rows`). `Reconciler` walks them in step, holding only the
+current bill and the payments made against it, so memory does not depend on
+the size of either table. Out-of-order input is an error, not a silent
+mismatch.
+
+Reported issues, one per bill (or per orphaned bill_id):
+- `orphaned_payment`: payments for a bill that does not exist
+- `paid_but_void`: payments against a VOID bill
+- `duplicate_paid`: several payments adding up to more than the bill
+- `overpaid`: one payment larger than the bill
+- `underpaid`: a PAID bill whose payments add up to less than its amount
+"""
+import json
+import os
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional, Tuple
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 10000))
+RECONCILE_TIMEOUT = float(os.getenv("RECONCILE_TIMEOUT", 60.0))
+
+ISSUES = ("underpaid", "overpaid", "duplicate_paid", "paid_but_void", "orphaned_payment")
+
+BILLS_QUERY = "SELECT bill_id, patient_id, amount, status FROM bills ORDER BY bill_id"
+PAYMENTS_QUERY = "SELECT payment_id, bill_id, amount FROM payments ORDER BY bill_id, payment_id"
+
+CENT = Decimal("0.01")
+
+def _amount(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENT)
+
+class ExportStream:
+    """Rows of an NDJSON export endpoint, as tuples of `columns`
+
+    The request is sent on construction, so an unreachable service fails
+    before anything has been streamed.
+    """
+
+    def __init__(self, base_url: str, path: str, columns: Tuple[str, ...], params: Optional[dict] = None):
+        self.columns = columns
+        self._client = httpx.Client(base_url=base_url, timeout=httpx.Timeout(RECONCILE_TIMEOUT, connect=2.0))
+        try:
+            self._response = self._client.send(self._client.build_request("GET", path, params=params), stream=True)
+            self._response.raise_for_status()
+        except BaseException:
+            self._client.close()
+            raise
+
+    def __iter__(self) -> Iterator[tuple]:
+        try:
+            for line in self._response.iter_lines():
+                if line:
+                    row = json.loads(line)
+                    yield tuple(row[column] for column in self.columns)
+        finally:
+            self.close()
+
+    def close(self):
+        self._response.close()
+        self._client.close()
+
+def bill_export(base_url: str) -> ExportStream:
+    return ExportStream(base_url, "/v1/bills/export", ("bill_id", "patient_id", "amount", "status"))
+
+def payment_export(base_url: str) -> ExportStream:
+    return ExportStream(base_url, "/v1/payments/export", ("payment_id", "bill_id", "amount"))
+
+def database_rows(engine: Engine, query: str) -> Iterator[tuple]:
+    """Rows of `query` through a server-side cursor, RECONCILE_BATCH_SIZE at a time"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(query))
+        for batch in result.partitions(RECONCILE_BATCH_SIZE):
+            yield from batch
+
+class Reconciler:
+    """Sort-merge of bills (bill_id, patient_id, amount, status) with payments (payment_id, bill_id, amount)"""
+
+    def __init__(self, include_matched: bool = False):
+        self.include_matched = include_matched
+        self.summary = {
+            "bills": 0,
+            "payments": 0,
+            "matched": 0,
+            **{issue: 0 for issue in ISSUES},
+            "billed_amount": Decimal(0),
+            "paid_amount": Decimal(0)
+        }
+
+    def _sorted_bills(self, bills: Iterable[tuple]) -> Iterator[tuple]:
+        last_bill_id = None
+        for bill in bills:
+            if last_bill_id is not None and bill[0] <= last_bill_id:
+                raise ValueError(f"Bills are not sorted by bill_id (bill {bill[0]} after {last_bill_id})")
+            last_bill_id = bill[0]
+            yield bill
+
+    def _payment_groups(self, payments: Iterable[tuple]) -> Iterator[Tuple[int, list, Decimal]]:
+        """(bill_id, payment IDs, total) per bill_id of a bill_id-sorted payment stream"""
+        bill_id, payment_ids, total = None, [], Decimal(0)
+        for payment_id, payment_bill_id, amount in payments:
+            if payment_bill_id != bill_id:
+                if bill_id is not None:
+                    if payment_bill_id < bill_id:
+                        raise ValueError(f"Payments are not sorted by bill_id (bill {payment_bill_id} after {bill_id})")
+                    yield bill_id, payment_ids, total
+                bill_id, payment_ids, total = payment_bill_id, [], Decimal(0)
+            payment_ids.append(payment_id)
+            total += _amount(amount)
+        if bill_id is not None:
+            yield bill_id, payment_ids, total
+
+    def _check(self, bill: Optional[tuple], bill_id: int, payment_ids: list, paid: Decimal) -> Optional[dict]:
+        summary = self.summary
+        summary["payments"] += len(payment_ids)
+        summary["paid_amount"] += paid
+        if bill is None:
+            issue, amount, status, patient_id = "orphaned_payment", None, None, None
+        else:
+            _, patient_id, amount, status = bill
+            amount = _amount(amount)
+            summary["bills"] += 1
+            summary["billed_amount"] += amount
+            if status == "VOID":
+                issue = "paid_but_void" if payment_ids else None
+            elif paid > amount:
+                issue = "duplicate_paid" if len(payment_ids) > 1 else "overpaid"
+            elif status == "PAID" and paid < amount:
+                issue = "underpaid"
+            else:
+                issue = None
+
+        if issue:
+            summary[issue] += 1
+        else:
+            summary["matched"] += 1
+            if not self.include_matched:
+                return None
+        return {
+            "issue": issue or "matched",
+            "bill_id": bill_id,
+            "patient_id": patient_id,
+            "status": status,
+            "bill_amount": str(amount) if amount is not None else None,
+            "paid_amount": str(paid),
+            "payment_ids": payment_ids
+        }
+
+    def run(self, bills: Iterable[tuple], payments: Iterable[tuple]) -> Iterator[dict]:
+        """Issues (and matched bills if requested) in bill_id order; totals are in `summary`"""
+        bills = self._sorted_bills(bills)
+        groups = self._payment_groups(payments)
+        bill = next(bills, None)
+        group = next(groups, None)
+
+        while bill is not None or group is not None:
+            if group is None or (bill is not None and bill[0] < group[0]):
+                result = self._check(bill, bill[0], [], Decimal(0))
+                bill = next(bills, None)
+            elif bill is None or group[0] < bill[0]:
+                result = self._check(None, *group)
+                group = next(groups, None)
+            else:
+                result = self._check(bill, *group)
+                bill = next(bills, None)
+                group = next(groups, None)
+            if result:
+                yield result
+
+    def summary_json(self) -> dict:
+        return {key: str(value) if isinstance(value, Decimal) else value for key, value in self.summary.items()}
+
+def ndjson_chunks(records: Iterable[dict], chunk_size: int = 65536) -> Iterator[bytes]:
+    """Records as NDJSON, joined into chunks of about `chunk_size` bytes"""
+    lines, size = [], 0
+    for record in records:
+        line = json.dumps(record) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(lines).encode()
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines).encode()
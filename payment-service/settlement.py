@@ -0,0 +1,176 @@
+"""Bulk payment ingestion from streamed settlement files (NDJSON or CSV)
+
+Rows are read from the request body as it arrives and handled in chunks of
+SETTLEMENT_CHUNK_SIZE: each row is validated against PaymentBatchRow,
+references (each row's idempotency key) are deduplicated inside the chunk
+and checked against the database with one IN query, and the new rows are
+inserted with one executemany in their own transaction. The insert is
+`payment_insert` (ON CONFLICT DO NOTHING), so a reference recorded
+concurrently after the check is reported as `exists`, not an error. Every
+input row gets one result line in the report, which is spooled (to disk past
+SETTLEMENT_REPORT_MEMORY bytes) while the upload is read and streamed back
+once it is complete, as for the patient import.
+
+CSV input uses the `hms_payments.csv` layout (header row; `payment_id` is
+ignored, new IDs are assigned; an empty `paid_at` means now). Quoted fields
+may not span lines.
+"""
+import csv
+import json
+import os
+import tempfile
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+import structlog
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from idempotency import payment_insert
+from models import Payment, PaymentBatchRow
+
+logger = structlog.get_logger()
+
+SETTLEMENT_CHUNK_SIZE = int(os.getenv("SETTLEMENT_CHUNK_SIZE", 1000))
+SETTLEMENT_REPORT_MEMORY = int(os.getenv("SETTLEMENT_REPORT_MEMORY", 1024 * 1024))
+
+FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decoded lines of a streamed body, without line endings"""
+    pending = b""
+    async for data in body:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+async def _records(body: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, dict or parse error message) per non-empty input row"""
+    header = None
+    line_number = 0
+    async for line in _lines(body):
+        line_number += 1
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            yield line_number, record if isinstance(record, dict) else "Row must be a JSON object"
+        elif header is None:
+            header = next(csv.reader([line]))
+        else:
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield line_number, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            # CSV has no null: an empty field is a missing one
+            yield line_number, {key: value for key, value in zip(header, values) if value != ""}
+
+def _validate(record) -> Tuple[Dict, str]:
+    if isinstance(record, str):
+        return None, record
+    try:
+        payment = PaymentBatchRow.model_validate({key: record.get(key) for key in PaymentBatchRow.model_fields})
+    except ValidationError as e:
+        error = e.errors()[0]
+        return None, f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+    # Without paid_at the column default applies
+    return payment.model_dump(exclude_none=True), None
+
+def ingest_chunk(rows: List[Tuple[int, object]]) -> Tuple[List[dict], List[dict]]:
+    """Validate, deduplicate and insert one chunk; (one result per row, the payments created)"""
+    results = {}
+    pending = {}
+    for line, record in rows:
+        values, error = _validate(record)
+        if error:
+            results[line] = {"line": line, "status": "invalid", "detail": error}
+        elif values["reference"] in pending:
+            results[line] = {"line": line, "status": "duplicate", "detail": "Reference repeated in file"}
+        else:
+            pending[values["reference"]] = (line, values)
+
+    db = SessionLocal()
+    try:
+        existing = dict(
+            db.query(Payment.reference, Payment.payment_id).filter(Payment.reference.in_(list(pending))).all()
+        ) if pending else {}
+
+        created = {}
+        new = [values for reference, (_, values) in pending.items() if reference not in existing]
+        if new:
+            statement = payment_insert(db.bind.dialect.name)
+            # executemany needs the same columns in every row
+            for group in ([v for v in new if "paid_at" in v], [v for v in new if "paid_at" not in v]):
+                if group:
+                    for payment in db.execute(statement, group):
+                        created[payment.reference] = payment
+            db.commit()
+
+            # Recorded concurrently after the check
+            lost = [values["reference"] for values in new if values["reference"] not in created]
+            if lost:
+                existing.update(db.query(Payment.reference, Payment.payment_id).filter(Payment.reference.in_(lost)).all())
+    finally:
+        db.close()
+
+    for reference, (line, _) in pending.items():
+        if reference in created:
+            results[line] = {"line": line, "status": "created", "payment_id": created[reference].payment_id}
+        else:
+            results[line] = {
+                "line": line,
+                "status": "exists",
+                "payment_id": existing[reference],
+                "detail": "Payment with this reference already exists"
+            }
+
+    return [results[line] for line, _ in rows], [
+        {"payment_id": payment.payment_id, "bill_id": payment.bill_id, "amount": str(payment.amount)}
+        for payment in created.values()
+    ]
+
+async def ingest_payments(
+    body: AsyncIterator[bytes],
+    fmt: str,
+    on_created: Callable[[List[dict]], Awaitable[None]]
+) -> tempfile.SpooledTemporaryFile:
+    """Ingest every row, calling `on_created` with each chunk's new payments; returns the NDJSON report, rewound"""
+    summary = {"created": 0, "exists": 0, "duplicate": 0, "invalid": 0}
+    report = tempfile.SpooledTemporaryFile(max_size=SETTLEMENT_REPORT_MEMORY, mode="w+b")
+    chunk = []
+
+    async def flush():
+        results, payments = await run_in_threadpool(ingest_chunk, chunk)
+        for result in results:
+            summary[result["status"]] += 1
+            report.write(json.dumps(result).encode() + b"\n")
+        chunk.clear()
+        if payments:
+            await on_created(payments)
+
+    try:
+        async for row in _records(body, fmt):
+            chunk.append(row)
+            if len(chunk) >= SETTLEMENT_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+    except BaseException:
+        report.close()
+        raise
+
+    logger.info("payments_ingested", **summary)
+    report.write(json.dumps({"summary": summary}).encode() + b"\n")
+    report.seek(0)
+    return report
+
+def report_blocks(report: tempfile.SpooledTemporaryFile, block_size: int = 65536) -> Iterator[bytes]:
+    """The report in fixed-size blocks; iterating the file would send one line (and one threadpool hop) per row"""
+    return iter(lambda: report.read(block_size), b"")
@@ -1,7 +1,7 @@
 """
 Prescription Service - Create and read prescriptions
 """
-from fastapi import FastAPI, HTTPException, Depends, Query, Header
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import datetime
@@ -12,7 +12,9 @@ import os
 from uuid import uuid4
 
 from database import get_db, init_db
+from http_client import init_clients, get_client, close_clients, pool_stats
 from models import Prescription, PrescriptionCreate, PrescriptionResponse
+from pagination import paginate
 
 logger = structlog.get_logger()
 
@@ -31,6 +33,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 APPOINTMENT_SERVICE_URL = os.getenv("APPOINTMENT_SERVICE_URL", "http://localhost:8004")
@@ -39,53 +42,59 @@ NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://localho
 @app.on_event("startup")
 async def startup():
     init_db()
+    init_clients({
+        "appointment": APPOINTMENT_SERVICE_URL,
+        "notification": NOTIFICATION_SERVICE_URL
+    })
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_clients()
 
 async def verify_appointment(appointment_id: int, patient_id: int, doctor_id: int) -> dict:
     """Verify appointment exists and is completed"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{APPOINTMENT_SERVICE_URL}/v1/appointments/{appointment_id}")
-            if response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Appointment not found")
-            
-            appointment = response.json()
-            
-            # Verify appointment is completed
-            if appointment.get("status") != "COMPLETED":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Appointment must be COMPLETED to create prescription. Current status: {appointment.get('status')}"
-                )
-            
-            # Verify patient and doctor match
-            if appointment.get("patient_id") != patient_id:
-                raise HTTPException(status_code=400, detail="Patient ID does not match appointment")
-            
-            if appointment.get("doctor_id") != doctor_id:
-                raise HTTPException(status_code=400, detail="Doctor ID does not match appointment")
-            
-            return appointment
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Appointment not found")
-            raise HTTPException(status_code=503, detail="Appointment service unavailable")
-        except Exception as e:
-            if isinstance(e, HTTPException):
-                raise
-            raise HTTPException(status_code=503, detail="Failed to verify appointment")
+    try:
+        response = await get_client("appointment").get(f"/v1/appointments/{appointment_id}")
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        
+        appointment = response.json()
+        
+        # Verify appointment is completed
+        if appointment.get("status") != "COMPLETED":
+            raise HTTPException(
+                status_code=400,
+                detail=f"Appointment must be COMPLETED to create prescription. Current status: {appointment.get('status')}"
+            )
+        
+        # Verify patient and doctor match
+        if appointment.get("patient_id") != patient_id:
+            raise HTTPException(status_code=400, detail="Patient ID does not match appointment")
+        
+        if appointment.get("doctor_id") != doctor_id:
+            raise HTTPException(status_code=400, detail="Doctor ID does not match appointment")
+        
+        return appointment
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        raise HTTPException(status_code=503, detail="Appointment service unavailable")
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=503, detail="Failed to verify appointment")
 
 async def notify_service(event_type: str, data: dict):
     """Send notification to notification service"""
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{NOTIFICATION_SERVICE_URL}/v1/notifications",
-                json={"event_type": event_type, "data": data},
-                timeout=5.0
-            )
-            logger.info("notification_sent", event_type=event_type)
-        except Exception as e:
-            logger.warning("notification_service_unavailable", event_type=event_type, error=str(e))
+    try:
+        await get_client("notification").post(
+            "/v1/notifications",
+            json={"event_type": event_type, "data": data},
+            timeout=5.0
+        )
+        logger.info("notification_sent", event_type=event_type)
+    except Exception as e:
+        logger.warning("notification_service_unavailable", event_type=event_type, error=str(e))
 
 @app.post("/v1/prescriptions", response_model=PrescriptionResponse, status_code=201)
 async def create_prescription(
@@ -131,8 +140,11 @@ async def create_prescription(
 
 @app.get("/v1/prescriptions", response_model=List[PrescriptionResponse])
 def get_prescriptions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor; takes precedence over skip"),
+    include_total: bool = Query(False, description="Return the total match count in X-Total-Count"),
     patient_id: Optional[int] = None,
     appointment_id: Optional[int] = None,
     db: Session = Depends(get_db)
@@ -146,8 +158,15 @@ def get_prescriptions(
     if appointment_id:
         query = query.filter(Prescription.appointment_id == appointment_id)
     
-    total = query.count()
-    prescriptions = query.order_by(Prescription.issued_at.desc()).offset(skip).limit(limit).all()
+    total = query.count() if include_total else None
+    prescriptions, next_cursor = paginate(
+        query, Prescription.issued_at, Prescription.prescription_id, limit, skip, cursor
+    )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
     
     logger.info("prescriptions_retrieved", total=total, returned=len(prescriptions))
     return prescriptions
@@ -166,6 +185,11 @@ def get_prescription(prescription_id: int, db: Session = Depends(get_db)):
 def health_check():
     return {"status": "healthy", "service": "prescription-service"}
 
+@app.get("/v1/metrics/http-pools")
+def get_http_pool_stats():
+    """Connection pool statistics for inter-service clients"""
+    return pool_stats()
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,76 @@
+"""Pooled HTTP clients for inter-service calls"""
+import httpx
+import os
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30.0))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 5.0))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2.0))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# One long-lived client per target service
+_clients = {}
+_counters = {}
+
+def _make_hooks(name: str) -> dict:
+    """Event hooks that keep per-client request counters"""
+    counters = _counters[name]
+
+    async def on_request(request):
+        counters["requests"] += 1
+
+    async def on_response(response):
+        if response.status_code >= 500:
+            counters["server_errors"] += 1
+
+    return {"request": [on_request], "response": [on_response]}
+
+def init_clients(services: dict):
+    """Create one pooled client per target service ({name: base_url})"""
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+    for name, base_url in services.items():
+        _counters[name] = {"requests": 0, "server_errors": 0}
+        _clients[name] = httpx.AsyncClient(
+            base_url=base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=HTTP2_ENABLED,
+            event_hooks=_make_hooks(name)
+        )
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Get the shared client for a target service"""
+    return _clients[name]
+
+async def close_clients():
+    """Close all clients and release pooled connections"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+def pool_stats() -> dict:
+    """Connection pool statistics per target service"""
+    stats = {}
+    for name, client in _clients.items():
+        # httpx does not expose the pool publicly; read it from the transport
+        pool = getattr(client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        stats[name] = {
+            "base_url": str(client.base_url),
+            "http2": HTTP2_ENABLED,
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            **_counters[name]
+        }
+    return stats
@@ -0,0 +1,53 @@
+"""Keyset (cursor) pagination helpers"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+
+def encode_cursor(sort_value: Optional[datetime], pk: int) -> str:
+    """Opaque cursor for the row (sort_value, pk)"""
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(value) if value else None), int(pk)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _cursor_key(sort_column, value: Optional[datetime], dialect_name: str):
+    """The cursor's sort value, bound in the format the column stores it in"""
+    if value is None or dialect_name != "sqlite":
+        return literal(value, sort_column.type)
+    # SQLite keeps datetimes as text and compares them as strings: values written
+    # from Python carry microseconds, SQL defaults (CURRENT_TIMESTAMP) do not
+    column = sort_column.property.columns[0]
+    sql_default = column.server_default is not None or (
+        column.default is not None and column.default.is_clause_element
+    )
+    return literal(value.strftime("%Y-%m-%d %H:%M:%S" if sql_default else "%Y-%m-%d %H:%M:%S.%f"))
+
+def paginate(query, sort_column, pk_column, limit: int, skip: int = 0, cursor: Optional[str] = None):
+    """One page ordered by (sort_column DESC, pk DESC) plus the cursor for the next page
+
+    With a cursor the page starts right after the cursor row (no OFFSET scan);
+    otherwise `skip` is applied as before.
+    """
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        key = _cursor_key(sort_column, value, query.session.get_bind().dialect.name)
+        query = query.filter(tuple_(sort_column, pk_column) < tuple_(key, pk))
+        skip = 0
+
+    rows = query.order_by(sort_column.desc(), pk_column.desc()).offset(skip).limit(limit).all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, pk_column.key))
+    return rows, next_cursor
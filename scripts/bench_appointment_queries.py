@@ -0,0 +1,190 @@
+"""
+Benchmark appointment-service queries before and after the composite indexes
+
+Loads synthetic appointments into a scratch SQLite database with the original
+single-column indexes, reports the query plan and timing of every query the
+service issues, then applies the in-place migration and reports them again.
+
+Usage: python bench_appointment_queries.py [--rows 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "appointment-service"
+
+DOCTORS = 500
+STATUSES = ["SCHEDULED"] * 3 + ["COMPLETED"] * 5 + ["CANCELLED", "NO_SHOW"]
+COMPOSITE_INDEXES = [
+    "ix_appointments_doctor_status_slot",
+    "ix_appointments_patient_status_slot",
+    "ix_appointments_doctor_slot",
+    "ix_appointments_patient_slot",
+]
+
+def load_rows(engine, table, rows: int):
+    """Insert synthetic appointments on the 30-minute clinic grid"""
+    rng = random.Random(42)
+    start_day = datetime(2024, 1, 1)
+    patients = max(rows // 5, 1)
+    chunk = []
+    with engine.begin() as conn:
+        for _ in range(rows):
+            slot_start = start_day + timedelta(
+                days=rng.randrange(730), hours=9, minutes=30 * rng.randrange(18)
+            )
+            chunk.append({
+                "patient_id": rng.randrange(1, patients + 1),
+                "doctor_id": rng.randrange(1, DOCTORS + 1),
+                "department": "Cardiology",
+                "slot_start": slot_start,
+                "slot_end": slot_start + timedelta(minutes=30),
+                "status": rng.choice(STATUSES),
+                "reschedule_count": 0,
+                "created_at": slot_start - timedelta(days=rng.randrange(1, 30)),
+            })
+            if len(chunk) == 50000:
+                conn.execute(table.insert(), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(table.insert(), chunk)
+
+def app_queries(db, Appointment, rows: int):
+    """The queries app.py issues, with representative parameters"""
+    from sqlalchemy import and_, func
+    from pagination import paginate, encode_cursor
+
+    day = datetime(2024, 6, 3)
+    slot_start = day.replace(hour=10)
+    slot_end = slot_start + timedelta(minutes=30)
+    ids = list(range(1, rows + 1, max(rows // 100, 1)))[:100]
+
+    def page(**filters):
+        query = db.query(Appointment)
+        for column, value in filters.items():
+            query = query.filter(getattr(Appointment, column) == value)
+        return lambda: paginate(query, Appointment.slot_start, Appointment.appointment_id, 100)
+
+    def keyset_page():
+        query = db.query(Appointment).filter(Appointment.doctor_id == 7)
+        cursor = encode_cursor(datetime(2025, 1, 1), rows)
+        return paginate(query, Appointment.slot_start, Appointment.appointment_id, 100, cursor=cursor)
+
+    return {
+        "get_appointment (by id)": lambda: db.query(Appointment).filter(
+            Appointment.appointment_id == rows // 2).first(),
+        "list: unfiltered": page(),
+        "list: patient_id": page(patient_id=123),
+        "list: doctor_id": page(doctor_id=7),
+        "list: status": page(status="NO_SHOW"),
+        "list: doctor_id + status": page(doctor_id=7, status="SCHEDULED"),
+        "list: patient_id + status": page(patient_id=123, status="SCHEDULED"),
+        "list: doctor_id keyset page": keyset_page,
+        "list: include_total count (doctor_id)": lambda: db.query(Appointment).filter(
+            Appointment.doctor_id == 7).count(),
+        "conflict: doctor overlap": lambda: db.query(Appointment).filter(and_(
+            Appointment.doctor_id == 7,
+            Appointment.status.in_(["SCHEDULED", "COMPLETED"]),
+            Appointment.slot_start < slot_end,
+            Appointment.slot_end > slot_start)).first(),
+        "conflict: patient overlap": lambda: db.query(Appointment).filter(and_(
+            Appointment.patient_id == 123,
+            Appointment.status == "SCHEDULED",
+            Appointment.slot_start < slot_end,
+            Appointment.slot_end > slot_start)).first(),
+        "cap: doctor daily count": lambda: db.query(func.count(Appointment.appointment_id)).filter(and_(
+            Appointment.doctor_id == 7,
+            Appointment.slot_start >= day,
+            Appointment.slot_start < day + timedelta(days=1))).scalar(),
+        "batch: reload created ids (IN)": lambda: db.query(Appointment).filter(
+            Appointment.appointment_id.in_(ids)).all(),
+    }
+
+def explain(db, fn) -> str:
+    """EXPLAIN QUERY PLAN of the last statement fn executes"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    statement, parameters = statements[-1]
+    plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return "; ".join(row[-1] for row in plan)
+
+def measure(db, queries: dict, repeat: int) -> dict:
+    results = {}
+    for name, fn in queries.items():
+        fn()  # warm up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (statistics.median(timings), explain(db, fn))
+        db.rollback()
+    return results
+
+def report(title: str, results: dict):
+    print(f"\n== {title} ==")
+    for name, (median_ms, plan) in results.items():
+        print(f"{name:<42}{median_ms:>10.3f} ms   {plan}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/appointment.db"
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    from database import Base, SessionLocal, engine
+    from migrations import run_migrations
+    from models import Appointment
+
+    # Recreate the original schema: single-column indexes only
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in COMPOSITE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX {name}")
+        conn.exec_driver_sql("CREATE INDEX ix_appointments_patient_id ON appointments (patient_id)")
+        conn.exec_driver_sql("CREATE INDEX ix_appointments_doctor_id ON appointments (doctor_id)")
+
+    started = time.perf_counter()
+    load_rows(engine, Appointment.__table__, args.rows)
+    print(f"Loaded {args.rows} appointments in {time.perf_counter() - started:.1f}s")
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    db = SessionLocal()
+    report("before (single-column indexes)", measure(db, app_queries(db, Appointment, args.rows), args.repeat))
+    db.close()
+
+    started = time.perf_counter()
+    run_migrations(engine, Base.metadata)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    print(f"\nMigration applied in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    report("after (composite indexes)", measure(db, app_queries(db, Appointment, args.rows), args.repeat))
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark the doctor service's availability search: slot bitmaps vs a per-slot loop
+
+Fills the booked-slot cache with random bookings for --doctors doctors over
+--days days, then finds the earliest free slot across all doctors with the
+vectorized bitmap search and with a loop over every doctor, day and slot,
+checks both agree and reports their latency. "typical" leaves 10% of doctor-days at the daily cap, "busy" 90%.
+"cold" rebuilds every day's bitmap; "warm" reuses the cached ones, as the
+service does between appointment events.
+
+Usage: python bench_availability_search.py [--doctors 500] [--days 60] [--fill 0.6] [--runs 20]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "doctor-service"
+
+DAILY_CAP = 8
+
+def fill_cache(grid, doctors: int, days, fill: float, full_share: float, seed: int):
+    """Random bookings per doctor-day: up to `fill` * cap appointments, `full_share` of days full"""
+    from booked_slots import DayBookings
+
+    rng = random.Random(seed)
+    bookings = {}
+    appointment_id = 0
+    for doctor_id in range(1, doctors + 1):
+        for day in days:
+            entry = DayBookings(DAILY_CAP, time.monotonic())
+            count = DAILY_CAP if rng.random() < full_share else rng.randint(0, int(DAILY_CAP * fill))
+            for slot in rng.sample(range(grid.size), count):
+                appointment_id += 1
+                entry.add(appointment_id, *grid.slot_at(day, slot))
+            bookings[(doctor_id, day)] = entry
+    return bookings
+
+def naive_search(grid, bookings, doctor_ids, days, earliest, limit):
+    """Earliest free slot per doctor by checking every slot against every booking"""
+    found = []
+    for doctor_id in doctor_ids:
+        for day in days:
+            entry = bookings[(doctor_id, day)]
+            if entry.full:
+                continue
+            slots = (grid.slot_at(day, i) for i in range(grid.size))
+            slot = next((
+                (slot_start, slot_end) for slot_start, slot_end in slots
+                if slot_start >= earliest and entry.is_free(slot_start, slot_end)
+            ), None)
+            if slot:
+                found.append((doctor_id, *slot))
+                break
+    found.sort(key=lambda item: (item[1], item[0]))
+    return found[:limit]
+
+def timed(fn, runs: int, before=None):
+    latencies = []
+    result = None
+    for _ in range(runs):
+        if before:
+            before()
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return result, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--fill", type=float, default=0.6, help="Typical share of the daily cap booked")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVICE_DIR))
+    from app import CLINIC_HOURS_START, CLINIC_HOURS_END, SLOT_DURATION_MINUTES, MIN_LEAD_TIME_HOURS
+    from slot_grid import SlotGrid
+    from slot_search import search
+
+    grid = SlotGrid(CLINIC_HOURS_START, CLINIC_HOURS_END, SLOT_DURATION_MINUTES)
+    today = datetime.now().date()
+    days = [today + timedelta(days=n) for n in range(args.days)]
+    doctor_ids = list(range(1, args.doctors + 1))
+    earliest = datetime.now() + timedelta(hours=MIN_LEAD_TIME_HOURS)
+
+    def reset_masks():
+        for entry in bookings.values():
+            entry._mask = None
+
+    print(f"{args.doctors} doctors x {args.days} days, limit {args.limit}")
+    print(f"{'scenario':<10}{'method':<8}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, full_share in (("typical", 0.1), ("busy", 0.9)):
+        bookings = fill_cache(grid, args.doctors, days, args.fill, full_share, args.seed)
+
+        expected, loop = timed(
+            lambda: naive_search(grid, bookings, doctor_ids, days, earliest, args.limit), args.runs
+        )
+        cold_result, cold = timed(lambda: search(grid, bookings, doctor_ids, days, earliest, args.limit), args.runs, reset_masks)
+        warm_result, warm = timed(lambda: search(grid, bookings, doctor_ids, days, earliest, args.limit), args.runs)
+        if not (expected == cold_result == warm_result):
+            print(f"Mismatch in {label}: {expected[:3]} vs {warm_result[:3]}")
+            return 1
+        for method, latencies in (("loop", loop), ("cold", cold), ("warm", warm)):
+            print(f"{label:<10}{method:<8}{statistics.median(latencies):>10.2f}"
+                  f"{sorted(latencies)[max(int(len(latencies) * 0.95) - 1, 0)]:>10.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Benchmark billing stats: GROUP BY scans of the bills table vs the rollup tables
+
+Loads --bills synthetic bills into a scratch SQLite database through the
+billing service's schema, rebuilds the rollups (the rebuild job), then
+answers the dashboard's questions (revenue per day and department over
+--days days, totals per status, top 20 outstanding balances) both ways,
+checks they agree and reports latency. Also reports the cost the rollups
+add to each bill creation.
+
+Usage: python bench_bill_stats.py [--bills 5000000] [--patients 500000] [--days 30] [--runs 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "billing-service"
+
+DEPARTMENTS = ["Cardiology", "Orthopedics", "Pediatrics", "Neurology", "Dermatology", "Oncology", "ENT", "General"]
+
+def load_bills(engine, count: int, patients: int, first_day: datetime, span_days: int, seed: int):
+    """Insert synthetic bills in batches: 70% OPEN, 25% PAID, 5% VOID"""
+    rng = random.Random(seed)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for offset in range(0, count, 100000):
+            rows = []
+            for i in range(offset, min(offset + 100000, count)):
+                created = first_day + timedelta(seconds=int(span_days * 86400 * i / count))
+                status = rng.choices(("OPEN", "PAID", "VOID"), (70, 25, 5))[0]
+                rows.append((
+                    rng.randint(1, patients), i + 1, rng.choice(DEPARTMENTS),
+                    rng.choice((262.5, 525.0, 787.5)), status,
+                    created.strftime("%Y-%m-%d %H:%M:%S")
+                ))
+            cursor.executemany(
+                "INSERT INTO bills (patient_id, appointment_id, department, amount, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [row + (row[-1],) for row in rows]
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+def timed(fn, runs: int):
+    latencies = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return result, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bills", type=int, default=5000000)
+    parser.add_argument("--patients", type=int, default=500000)
+    parser.add_argument("--history-days", type=int, default=730)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--creates", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_bill_stats_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/billing.db"
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    from sqlalchemy import case, func
+    from database import SessionLocal, engine, init_db
+    from models import Bill, BillRevenueDaily, BillStatusTotal, PatientBalance
+    import rollups
+
+    init_db()
+    last_day = datetime(2025, 12, 31)
+    first_day = last_day - timedelta(days=args.history_days - 1)
+    print(f"Loading {args.bills} bills over {args.history_days} days...")
+    start = time.perf_counter()
+    load_bills(engine, args.bills, args.patients, first_day, args.history_days, args.seed)
+    print(f"  {time.perf_counter() - start:.1f}s")
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        counts = rollups.rebuild(db)
+        print(f"Rebuild job: {time.perf_counter() - start:.1f}s ({', '.join(f'{t} {n}' for t, n in counts.items())})")
+
+        from_day = (last_day - timedelta(days=args.days - 1)).date()
+        since = from_day.isoformat()
+
+        def scan():
+            day = func.date(Bill.created_at)
+            revenue = db.query(day, Bill.department, func.count(Bill.bill_id), func.sum(Bill.amount)).filter(
+                Bill.status != "VOID", day >= since
+            ).group_by(day, Bill.department).order_by(day, Bill.department).all()
+            statuses = db.query(Bill.status, func.count(Bill.bill_id), func.sum(Bill.amount)).group_by(Bill.status).all()
+            # Outstanding = non-void bills less payments; the synthetic data has no payments
+            owed = func.sum(Bill.amount)
+            open_bills = func.count(case((Bill.status == "OPEN", Bill.bill_id)))
+            balances = db.query(Bill.patient_id, open_bills, owed).filter(
+                Bill.status != "VOID"
+            ).group_by(Bill.patient_id).order_by(owed.desc(), Bill.patient_id).limit(20).all()
+            return (
+                [(str(d), dept, n, Decimal(str(a)).quantize(Decimal("0.01"))) for d, dept, n, a in revenue],
+                sorted((s, n, Decimal(str(a)).quantize(Decimal("0.01"))) for s, n, a in statuses),
+                [(p, n, Decimal(str(a)).quantize(Decimal("0.01"))) for p, n, a in balances]
+            )
+
+        def rolled_up():
+            revenue = db.query(BillRevenueDaily).filter(
+                BillRevenueDaily.day >= from_day, BillRevenueDaily.bills > 0
+            ).order_by(BillRevenueDaily.day, BillRevenueDaily.department).all()
+            statuses = db.query(BillStatusTotal).filter(BillStatusTotal.bills > 0).all()
+            balances = db.query(PatientBalance).filter(PatientBalance.outstanding > 0).order_by(
+                PatientBalance.outstanding.desc(), PatientBalance.patient_id
+            ).limit(20).all()
+            return (
+                [(str(r.day), r.department, r.bills, r.amount) for r in revenue],
+                sorted((r.status, r.bills, r.amount) for r in statuses),
+                [(r.patient_id, r.open_bills, r.outstanding) for r in balances]
+            )
+
+        expected, scan_ms = timed(scan, args.runs)
+        found, rollup_ms = timed(rolled_up, args.runs)
+        if found != expected:
+            print("Rollups disagree with the scan")
+            return 1
+        scan_p50, rollup_p50 = statistics.median(scan_ms), statistics.median(rollup_ms)
+        print(f"{'stats':<18}{'scan p50 ms':>14}{'rollup p50 ms':>15}{'speedup':>10}")
+        print(f"{'dashboard':<18}{scan_p50:>14.1f}{rollup_p50:>15.2f}{scan_p50 / rollup_p50:>9.0f}x")
+
+        def create(with_rollups: bool):
+            rng = random.Random(args.seed)
+            start = time.perf_counter()
+            for i in range(args.creates):
+                bill = Bill(
+                    patient_id=rng.randint(1, args.patients), appointment_id=args.bills + i + 1,
+                    department=rng.choice(DEPARTMENTS), amount=525.0, status="OPEN"
+                )
+                db.add(bill)
+                db.flush()
+                if with_rollups:
+                    delta = rollups.RollupDelta()
+                    delta.created(bill)
+                    delta.apply(db)
+                db.commit()
+            return (time.perf_counter() - start) * 1000 / args.creates
+
+        plain = create(False)
+        db.query(Bill).filter(Bill.appointment_id > args.bills).delete(synchronize_session=False)
+        db.commit()
+        with_rollups = create(True)
+        print(f"Bill creation: {plain:.3f} ms without rollups, {with_rollups:.3f} ms with ({with_rollups - plain:+.3f} ms)")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
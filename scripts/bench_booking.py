@@ -0,0 +1,111 @@
+"""
+Benchmark booking pre-validation: sequential vs concurrent remote checks
+
+Patient and doctor services are stubbed with a fixed latency, so the numbers
+show the cost of the orchestration rather than of the remote services.
+
+Usage: python bench_booking.py [--latency-ms 20] [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "appointment-service"
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, int(round(pct / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+def install_stub_clients(http_client, httpx, latency):
+    """Replace the pooled clients with stubs that answer after a fixed delay"""
+    async def handler(request):
+        await asyncio.sleep(latency)
+        if request.url.path.endswith("/exists"):
+            return httpx.Response(200, json={"exists": True})
+        if request.url.path.endswith("/department"):
+            return httpx.Response(200, json={"doctor_id": 1, "department": "Cardiology"})
+        return httpx.Response(201, json={})
+
+    for name in ("patient", "doctor", "billing", "notification"):
+        http_client._clients[name] = httpx.AsyncClient(
+            base_url=f"http://{name}.stub",
+            transport=httpx.MockTransport(handler)
+        )
+
+async def run(latency_ms: float, requests: int):
+    import httpx
+    import http_client
+    from app import (
+        verify_patient, verify_doctor, verify_participants,
+        validate_slot, check_booking_conflicts
+    )
+    from database import init_db
+    from models import AppointmentCreate
+
+    init_db()
+    install_stub_clients(http_client, httpx, latency_ms / 1000)
+
+    slot_start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time()).replace(hour=10)
+    appointment = AppointmentCreate(
+        patient_id=1,
+        doctor_id=1,
+        department="Cardiology",
+        slot_start=slot_start,
+        slot_end=slot_start + timedelta(minutes=30)
+    )
+
+    async def sequential():
+        # Order used before the pipeline: remote, remote, then local checks
+        await verify_patient(appointment.patient_id)
+        await verify_doctor(appointment.doctor_id, appointment.department)
+        validate_slot(appointment.slot_start, appointment.slot_end)
+        check_booking_conflicts(appointment)
+
+    async def pipeline():
+        validate_slot(appointment.slot_start, appointment.slot_end)
+        await verify_participants(appointment.patient_id, appointment.doctor_id, appointment.department)
+        check_booking_conflicts(appointment)
+
+    results = {}
+    for name, fn in (("sequential", sequential), ("pipeline", pipeline)):
+        await fn()  # warm up
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = timings
+
+    await http_client.close_clients()
+
+    print(f"Stub latency: {latency_ms:.1f} ms per remote call, {requests} requests")
+    print(f"{'mode':<12}{'p50 (ms)':>12}{'p99 (ms)':>12}{'mean (ms)':>12}")
+    for name, timings in results.items():
+        print(
+            f"{name:<12}{percentile(timings, 50):>12.2f}"
+            f"{percentile(timings, 99):>12.2f}{statistics.mean(timings):>12.2f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/appointment.db"
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    asyncio.run(run(args.latency_ms, args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark patient name/phone search: leading-wildcard ILIKE scan vs the trigram index
+
+Loads --patients synthetic patients into a scratch SQLite database through
+the patient service's schema (so the FTS5 triggers index every row), then
+runs the same searches the old way (ILIKE '%term%' with the row count the
+endpoint computed) and through search_patients, checks that every indexed
+result also matches the scan, and reports latency per term.
+
+Usage: python bench_patient_search.py [--patients 1000000] [--runs 5] [--limit 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "patient-service"
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Meera", "Arjun", "Kavya", "Rahul", "Sneha",
+    "Wei", "Li", "Chen", "Mei", "Hiro", "Yuki", "Omar", "Fatima", "Ali", "Layla",
+    "Lucas", "Sofia", "Mateo", "Valentina", "Noah", "Emma", "Liam", "Olivia", "Ethan", "Ava"
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Sharma", "Patel", "Reddy", "Iyer", "Nair", "Gupta", "Singh", "Kumar", "Rao", "Menon",
+    "Wang", "Zhang", "Liu", "Tanaka", "Sato", "Khan", "Haddad", "Rossi", "Silva", "Novak",
+    "Thompson", "White", "Harris", "Clark", "Lewis", "Robinson", "Walker", "Young", "Allen", "King"
+]
+
+def load_patients(engine, count: int, seed: int):
+    """Insert synthetic patients in batches; returns one generated (name, phone) to look up"""
+    rng = random.Random(seed)
+    raw = engine.raw_connection()
+    sample = None
+    try:
+        cursor = raw.cursor()
+        for offset in range(0, count, 50000):
+            rows = []
+            for i in range(offset, min(offset + 50000, count)):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                phone = f"9{rng.randrange(10 ** 9):09d}"
+                dob = date(1940, 1, 1) + timedelta(days=rng.randrange(25000))
+                rows.append((name, f"patient{i}@example.com", phone, dob.isoformat()))
+            cursor.executemany("INSERT INTO patients (name, email, phone, dob) VALUES (?, ?, ?, ?)", rows)
+            sample = sample or rows[len(rows) // 2]
+        raw.commit()
+    finally:
+        raw.close()
+    return sample[0], sample[2]
+
+def timed(fn, runs: int):
+    latencies = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return result, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_patient_search_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/patient.db"
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    from database import SessionLocal, engine, init_db
+    from models import Patient
+    from search_index import search_patients
+
+    init_db()
+    print(f"Loading {args.patients} patients (FTS5 triggers on)...")
+    start = time.perf_counter()
+    sample_name, sample_phone = load_patients(engine, args.patients, args.seed)
+    print(f"  {time.perf_counter() - start:.1f}s, database {os.path.getsize(f'{workdir}/patient.db') / 2 ** 20:.0f} MiB")
+
+    searches = [
+        ("name prefix", {"name": "Pri"}),
+        ("surname", {"name": "Thompson"}),
+        ("full name", {"name": sample_name}),
+        ("word prefix", {"name": "Tha"}),
+        ("phone 7 digits", {"phone": sample_phone[2:9]}),
+        ("phone 4 digits", {"phone": sample_phone[-4:]}),
+        ("name + phone", {"name": sample_name.split()[1], "phone": sample_phone[-5:]}),
+        ("2 chars (scan)", {"name": "Li"})
+    ]
+
+    db = SessionLocal()
+    try:
+        def scan(filters):
+            query = db.query(Patient)
+            for field, term in filters.items():
+                query = query.filter(getattr(Patient, field).ilike(f"%{term}%"))
+            query.count()
+            return query.offset(0).limit(args.limit).all()
+
+        print(f"{'search':<18}{'scan p50 ms':>14}{'index p50 ms':>14}{'speedup':>10}")
+        for label, filters in searches:
+            _, scan_ms = timed(lambda: scan(filters), args.runs)
+            found, index_ms = timed(
+                lambda: search_patients(db, filters.get("name"), filters.get("phone"), 0, args.limit), args.runs
+            )
+            for patient in found:
+                for field, term in filters.items():
+                    if term.lower() not in getattr(patient, field).lower():
+                        print(f"Wrong match for {label}: {patient.patient_id}")
+                        return 1
+            scan_p50, index_p50 = statistics.median(scan_ms), statistics.median(index_ms)
+            print(f"{label:<18}{scan_p50:>14.2f}{index_p50:>14.2f}{scan_p50 / index_p50:>9.1f}x")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
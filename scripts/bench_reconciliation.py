@@ -0,0 +1,140 @@
+"""
+Benchmark bill-to-payment reconciliation: streaming sort-merge vs an in-memory hash join
+
+Scales the bundled hms_bills.csv / hms_payments.csv up to --bills bills by
+repeating them with shifted IDs (so every copy carries the same mix of
+issues), loads the two sides into separate scratch SQLite databases with
+the services' layout, then reconciles them through database cursors. The
+summary must be the bundled files' summary times the number of copies.
+Reports throughput and peak memory, then the same for a hash join that
+loads every payment first.
+
+Usage: python bench_reconciliation.py [--bills 10000000] [--skip-hash-join]
+"""
+import argparse
+import csv
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "payment-service"
+
+BILLS_DDL = [
+    "CREATE TABLE bills (bill_id INTEGER PRIMARY KEY, patient_id INTEGER NOT NULL, appointment_id INTEGER NOT NULL, "
+    "amount NUMERIC(10, 2) NOT NULL, status VARCHAR NOT NULL, created_at DATETIME)"
+]
+PAYMENTS_DDL = [
+    "CREATE TABLE payments (payment_id INTEGER PRIMARY KEY, bill_id INTEGER NOT NULL, amount NUMERIC(10, 2) NOT NULL, "
+    "method VARCHAR NOT NULL, reference VARCHAR, paid_at DATETIME)",
+    "CREATE INDEX ix_payments_bill_id ON payments (bill_id)"
+]
+
+def read_csv(name: str) -> list:
+    with open(PROJECT_ROOT / name, newline="") as f:
+        return list(csv.DictReader(f))
+
+def load(path: str, ddl: list, insert: str, rows_for_copy, copies: int):
+    conn = sqlite3.connect(path)
+    try:
+        for statement in ddl:
+            conn.execute(statement)
+        for copy in range(copies):
+            conn.executemany(insert, rows_for_copy(copy))
+        conn.commit()
+    finally:
+        conn.close()
+
+def max_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bills", type=int, default=10000000)
+    parser.add_argument("--skip-hash-join", action="store_true")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVICE_DIR))
+    from sqlalchemy import create_engine
+    from reconciliation import BILLS_QUERY, PAYMENTS_QUERY, Reconciler, database_rows
+
+    bills = read_csv("hms_bills.csv")
+    payments = read_csv("hms_payments.csv")
+    bill_stride = max(int(bill["bill_id"]) for bill in bills)
+    payment_stride = max(int(payment["payment_id"]) for payment in payments)
+    copies = max(args.bills // len(bills), 1)
+
+    # Expected: the bundled files' summary, times the number of copies
+    base = Reconciler()
+    list(base.run(
+        sorted((int(b["bill_id"]), int(b["patient_id"]), b["amount"], b["status"]) for b in bills),
+        sorted(((int(p["payment_id"]), int(p["bill_id"]), p["amount"]) for p in payments), key=lambda p: (p[1], p[0]))
+    ))
+    expected = {key: value * copies for key, value in base.summary.items()}
+    print("Bundled CSVs: " + ", ".join(f"{key} {value}" for key, value in base.summary_json().items()))
+
+    workdir = tempfile.mkdtemp(prefix="bench_reconciliation_")
+    print(f"Loading {copies * len(bills)} bills and {copies * len(payments)} payments ({copies} copies)...")
+    start = time.perf_counter()
+    load(
+        f"{workdir}/billing.db", BILLS_DDL, "INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?)",
+        lambda copy: [
+            (int(b["bill_id"]) + copy * bill_stride, b["patient_id"], b["appointment_id"], float(b["amount"]),
+             b["status"], b["created_at"])
+            for b in bills
+        ],
+        copies
+    )
+    # Payments keep the CSV's order (by payment_id), so bill_id order comes from the index
+    load(
+        f"{workdir}/payment.db", PAYMENTS_DDL, "INSERT INTO payments VALUES (?, ?, ?, ?, ?, ?)",
+        lambda copy: [
+            (int(p["payment_id"]) + copy * payment_stride, int(p["bill_id"]) + copy * bill_stride,
+             float(p["amount"]), p["method"], f"{p['reference']}-{copy}", p["paid_at"])
+            for p in payments
+        ],
+        copies
+    )
+    print(f"  {time.perf_counter() - start:.1f}s")
+
+    billing = create_engine(f"sqlite:///{workdir}/billing.db")
+    payment = create_engine(f"sqlite:///{workdir}/payment.db")
+    rows = expected["bills"] + expected["payments"]
+
+    before = max_rss_mib()
+    reconciler = Reconciler()
+    start = time.perf_counter()
+    issues = sum(1 for _ in reconciler.run(database_rows(billing, BILLS_QUERY), database_rows(payment, PAYMENTS_QUERY)))
+    elapsed = time.perf_counter() - start
+    if reconciler.summary != expected:
+        print(f"Summary mismatch: {reconciler.summary_json()}")
+        return 1
+    print(f"{'method':<14}{'seconds':>10}{'rows/s':>12}{'peak RSS growth MiB':>22}")
+    print(f"{'sort-merge':<14}{elapsed:>10.1f}{rows / elapsed:>12.0f}{max_rss_mib() - before:>22.0f}   ({issues} issues)")
+
+    if not args.skip_hash_join:
+        before = max_rss_mib()
+        start = time.perf_counter()
+        paid = defaultdict(lambda: [0, Decimal(0)])
+        for _, bill_id, amount in database_rows(payment, PAYMENTS_QUERY.replace(" ORDER BY bill_id, payment_id", "")):
+            paid[bill_id][0] += 1
+            paid[bill_id][1] += Decimal(str(amount))
+        found = 0
+        for bill_id, _, amount, status in database_rows(billing, BILLS_QUERY.replace(" ORDER BY bill_id", "")):
+            count, total = paid.pop(bill_id, (0, Decimal(0)))
+            amount = Decimal(str(amount))
+            found += (status == "VOID" and count > 0) or (status != "VOID" and total > amount) or (
+                status == "PAID" and total < amount
+            )
+        found += len(paid)
+        elapsed = time.perf_counter() - start
+        print(f"{'hash join':<14}{elapsed:>10.1f}{rows / elapsed:>12.0f}{max_rss_mib() - before:>22.0f}   ({found} issues)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Check the appointment service's in-memory conflict index against its database
+
+Usage: python check_schedule_index.py [--url http://localhost:8004] [--repair]
+"""
+import argparse
+import sys
+
+import requests
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the appointment schedule index")
+    parser.add_argument("--url", default="http://localhost:8004")
+    parser.add_argument("--repair", action="store_true", help="Rebuild the index if it is inconsistent")
+    args = parser.parse_args()
+
+    response = requests.post(
+        f"{args.url}/v1/admin/schedule-index/check",
+        params={"repair": str(args.repair).lower()},
+        timeout=60
+    )
+    response.raise_for_status()
+    result = response.json()
+
+    print(f"Indexed: {result['indexed']}  In database: {result['in_database']}")
+    for field in ("missing", "unexpected", "stale"):
+        if result[field]:
+            print(f"{field}: {result[field][:20]}{' ...' if len(result[field]) > 20 else ''}")
+
+    if result["consistent"]:
+        print("Schedule index is consistent")
+        return 0
+    print("Schedule index repaired" if result.get("repaired") else "Schedule index is INCONSISTENT")
+    return 0 if result.get("repaired") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
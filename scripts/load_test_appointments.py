@@ -0,0 +1,241 @@
+"""
+Load test appointment booking throughput at increasing concurrency
+
+Starts the appointment service (uvicorn, scratch SQLite database) against a
+stub patient/doctor/billing/notification service that answers after a fixed
+delay, then books and cancels appointments with 1, 4, 16 and 64 concurrent
+clients and reports throughput and latency for each level.
+
+SQLite on local disk answers in microseconds, which hides what a blocking
+session costs against a networked database. --db-latency-ms adds a fixed
+delay to every SQL statement, in whichever thread executes it (the event
+loop for a synchronous session, the driver thread for aiosqlite). SQLite
+still admits one writer at a time, so use --database-url with an empty
+PostgreSQL database to see throughput scale with the connection pool.
+
+Pass --baseline-ref to run the same workload against an older revision
+(checked out into a temporary git worktree), e.g. the commit before the
+async database engine, to compare against the blocking session path.
+
+Usage: python load_test_appointments.py [--requests 400] [--latency-ms 5] [--db-latency-ms 2]
+                                        [--concurrency 1 4 16 64] [--baseline-ref REF]
+                                        [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "appointment-service"
+
+# Loaded by the service interpreter via PYTHONPATH
+SITECUSTOMIZE = """
+import os, sqlite3, sqlite3.dbapi2, time
+
+_latency = float(os.environ.get("LOAD_TEST_DB_LATENCY_MS", 0)) / 1000
+_connect = sqlite3.connect
+
+def _connect_with_latency(*args, **kwargs):
+    conn = _connect(*args, **kwargs)
+    conn.set_trace_callback(lambda statement: time.sleep(_latency))
+    return conn
+
+if _latency:
+    # pysqlite connects through dbapi2, aiosqlite through the package
+    sqlite3.connect = sqlite3.dbapi2.connect = _connect_with_latency
+"""
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, int(round(pct / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_services(port: int, latency: float):
+    """Serve every downstream service the appointment service calls"""
+    import uvicorn
+    from fastapi import Body, FastAPI
+
+    stub = FastAPI()
+
+    @stub.get("/v1/patients/{patient_id}/exists")
+    async def patient_exists(patient_id: int):
+        await asyncio.sleep(latency)
+        return {"exists": True}
+
+    @stub.get("/v1/doctors/{doctor_id}/department")
+    async def doctor_department(doctor_id: int):
+        await asyncio.sleep(latency)
+        return {"doctor_id": doctor_id, "department": "Cardiology"}
+
+    @stub.post("/v1/bills", status_code=201)
+    @stub.post("/v1/notifications", status_code=201)
+    @stub.post("/v1/events/appointments")
+    async def accept():
+        await asyncio.sleep(latency)
+        return {}
+
+    @stub.post("/v1/bills:batch")
+    async def accept_bills(batch: dict = Body(...)):
+        await asyncio.sleep(latency)
+        items = batch["items"]
+        return {
+            "created": len(items),
+            "failed": 0,
+            "results": [{"index": i, "status_code": 201} for i in range(len(items))]
+        }
+
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+def start_service(service_dir: Path, port: int, stub_url: str, workdir: str, args):
+    hooks = Path(workdir) / "hooks"
+    hooks.mkdir(exist_ok=True)
+    (hooks / "sitecustomize.py").write_text(SITECUSTOMIZE)
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(hooks),
+        LOAD_TEST_DB_LATENCY_MS=str(args.db_latency_ms),
+        PORT=str(port),
+        DATABASE_URL=args.database_url or f"sqlite:///{workdir}/appointment-{port}.db",
+        PATIENT_SERVICE_URL=stub_url,
+        DOCTOR_SERVICE_URL=stub_url,
+        BILLING_SERVICE_URL=stub_url,
+        NOTIFICATION_SERVICE_URL=stub_url
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "error"],
+        cwd=service_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"appointment service in {service_dir} did not start")
+
+async def run_level(base_url: str, concurrency: int, requests: int, first_id: int):
+    """Book then cancel `requests` appointments with `concurrency` clients"""
+    day = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    queue = asyncio.Queue()
+    for n in range(first_id, first_id + requests):
+        queue.put_nowait(n)
+    timings, errors = [], 0
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            n = queue.get_nowait()
+            # Distinct doctor and patient per request: no conflicts or daily caps
+            slot_start = day.replace(hour=9 + n % 9)
+            started = time.perf_counter()
+            response = await client.post("/v1/appointments", json={
+                "patient_id": n,
+                "doctor_id": n,
+                "department": "Cardiology",
+                "slot_start": slot_start.isoformat(),
+                "slot_end": (slot_start + timedelta(minutes=30)).isoformat()
+            })
+            if response.status_code == 201:
+                appointment_id = response.json()["appointment_id"]
+                response = await client.post(f"/v1/appointments/{appointment_id}/cancel")
+            if response.status_code != 200:
+                errors += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, timings, errors
+
+def run_service(label: str, service_dir: Path, args, stub_url: str, workdir: str) -> dict:
+    port = free_port()
+    process = start_service(service_dir, port, stub_url, workdir, args)
+    results = {}
+    try:
+        first_id = 1
+        for concurrency in args.concurrency:
+            results[concurrency] = asyncio.run(
+                run_level(f"http://127.0.0.1:{port}", concurrency, args.requests, first_id)
+            )
+            first_id += args.requests
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    print(f"\n== {label} ==")
+    print(f"{'clients':>8}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'mean (ms)':>12}{'errors':>8}")
+    for concurrency, (throughput, timings, errors) in results.items():
+        print(
+            f"{concurrency:>8}{throughput:>10.1f}{percentile(timings, 50):>12.2f}"
+            f"{percentile(timings, 99):>12.2f}{statistics.mean(timings):>12.2f}{errors:>8}"
+        )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400, help="book+cancel pairs per level")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stub service latency")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="added to every SQL statement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--baseline-ref", help="git revision to compare against")
+    parser.add_argument("--database-url", help="use this database instead of a scratch SQLite file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hms-load-")
+    stub_port = free_port()
+    server, thread = start_stub_services(stub_port, args.latency_ms / 1000)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    print(
+        f"Stub latency: {args.latency_ms:.1f} ms per remote call, "
+        f"DB latency: {args.db_latency_ms:.1f} ms per statement, {args.requests} bookings per level"
+    )
+
+    try:
+        if args.baseline_ref:
+            worktree = Path(workdir) / "baseline"
+            subprocess.run(
+                ["git", "worktree", "add", "--detach", str(worktree), args.baseline_ref],
+                cwd=PROJECT_ROOT, check=True, stdout=subprocess.DEVNULL
+            )
+            try:
+                run_service(f"baseline ({args.baseline_ref})", worktree / "appointment-service", args, stub_url, workdir)
+            finally:
+                subprocess.run(
+                    ["git", "worktree", "remove", "--force", str(worktree)],
+                    cwd=PROJECT_ROOT, check=False
+                )
+        run_service("current", SERVICE_DIR, args, stub_url, workdir)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+if __name__ == "__main__":
+    main()
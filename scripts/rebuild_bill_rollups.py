@@ -0,0 +1,42 @@
+"""
+Recompute the billing service's rollup tables (revenue per day/department, totals per status, patient balances) from its bills
+
+Runs directly against the service database (DATABASE_URL, default: the
+billing service's SQLite file) in one transaction.
+
+Usage: python rebuild_bill_rollups.py [--database-url sqlite:///./billing.db]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "billing-service"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL", f"sqlite:///{SERVICE_DIR / 'billing.db'}")
+    )
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    from database import SessionLocal, init_db
+    from rollups import rebuild
+
+    init_db()
+    db = SessionLocal()
+    try:
+        counts = rebuild(db)
+    finally:
+        db.close()
+
+    print("Rebuilt bill rollups: " + ", ".join(f"{table} {rows} rows" for table, rows in counts.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Recompute the appointment service's doctor_day_load counters from its appointments
+
+Runs directly against the service database (DATABASE_URL, default: the
+appointment service's SQLite file) in one transaction.
+
+Usage: python rebuild_doctor_day_load.py [--database-url sqlite:///./appointment.db]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "appointment-service"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL", f"sqlite:///{SERVICE_DIR / 'appointment.db'}")
+    )
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, str(SERVICE_DIR))
+
+    from capacity import rebuild
+    from database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        rows = rebuild(db)
+    finally:
+        db.close()
+
+    print(f"Rebuilt doctor_day_load: {rows} doctor-days")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Reconcile bills with payments by streaming both sides sorted by bill_id
+
+Each side is read from its service's export endpoint (--billing-url,
+--payment-url) or straight from its database (--billing-database-url,
+--payment-database-url). Writes one NDJSON line per issue (underpaid,
+overpaid, duplicate_paid, paid_but_void, orphaned_payment) to --output and
+prints the summary. Memory use does not depend on the number of rows.
+
+Usage: python reconcile_payments.py [--billing-url http://localhost:8003 | --billing-database-url URL]
+                                    [--payment-url http://localhost:8006 | --payment-database-url URL]
+                                    [--output issues.ndjson] [--include-matched]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "payment-service"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    bills = parser.add_mutually_exclusive_group()
+    bills.add_argument("--billing-url", default="http://localhost:8003")
+    bills.add_argument("--billing-database-url")
+    payments = parser.add_mutually_exclusive_group()
+    payments.add_argument("--payment-url", default="http://localhost:8006")
+    payments.add_argument("--payment-database-url")
+    parser.add_argument("--output", help="Issues file (default: stdout)")
+    parser.add_argument("--include-matched", action="store_true")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVICE_DIR))
+    from sqlalchemy import create_engine
+    from reconciliation import (
+        BILLS_QUERY, ISSUES, PAYMENTS_QUERY, Reconciler, bill_export, database_rows, ndjson_chunks, payment_export
+    )
+
+    if args.billing_database_url:
+        bill_rows = database_rows(create_engine(args.billing_database_url), BILLS_QUERY)
+    else:
+        bill_rows = bill_export(args.billing_url)
+    if args.payment_database_url:
+        payment_rows = database_rows(create_engine(args.payment_database_url), PAYMENTS_QUERY)
+    else:
+        payment_rows = payment_export(args.payment_url)
+
+    reconciler = Reconciler(args.include_matched)
+    start = time.perf_counter()
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in ndjson_chunks(reconciler.run(bill_rows, payment_rows)):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+    summary = reconciler.summary_json()
+    print(json.dumps({"summary": summary, "seconds": round(time.perf_counter() - start, 1)}), file=sys.stderr)
+    return 1 if any(summary[issue] for issue in ISSUES) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
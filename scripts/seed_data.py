@@ -2,6 +2,7 @@
 Seed data script to load CSV data into microservices
 """
 import csv
+import json
 import requests
 from datetime import datetime
 import time
@@ -16,24 +17,22 @@ BASE_URLS = {
 }
 
 def load_patients():
-    """Load patients from CSV"""
+    """Load patients from CSV with one streamed bulk import"""
     print("Loading patients...")
-    with open('../hms_patients.csv', 'r') as f:
-        reader = csv.DictReader(f)
-        count = 0
-        for row in reader:
-            try:
-                data = {
-                    'name': row['name'],
-                    'email': row['email'],
-                    'phone': row['phone'],
-                    'dob': row['dob']
-                }
-                response = requests.post(f"{BASE_URLS['patient']}/v1/patients", json=data)
-                if response.status_code in [200, 201]:
-                    count += 1
-            except Exception as e:
-                print(f"Error loading patient: {e}")
+    with open('../hms_patients.csv', 'rb') as f:
+        response = requests.post(
+            f"{BASE_URLS['patient']}/v1/patients:import",
+            data=f,
+            headers={'Content-Type': 'text/csv'},
+            stream=True
+        )
+    count = 0
+    for line in response.iter_lines():
+        result = json.loads(line)
+        if 'summary' in result:
+            count = result['summary']['created']
+        elif result['status'] != 'created':
+            print(f"Error loading patient on line {result['line']}: {result['detail']}")
     print(f"Loaded {count} patients")
 
 def load_doctors():
@@ -0,0 +1,170 @@
+"""
+Stress test payment idempotency with concurrent duplicate requests
+
+Starts the payment service (uvicorn, scratch SQLite database) against a stub
+billing service, then for each of --keys Idempotency-Keys fires --duplicates
+identical POST /v1/payments at once. Every duplicate must succeed and return
+the same payment, and each key must end up as exactly one payments row.
+
+Pass --baseline-ref to run the same workload against an older revision
+(checked out into a temporary git worktree), e.g. the commit before the
+idempotency cache, where concurrent duplicates race to the unique index.
+
+Usage: python stress_payment_idempotency.py [--duplicates 1000] [--keys 5] [--baseline-ref REF]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVICE_DIR = PROJECT_ROOT / "payment-service"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_billing(port: int):
+    """Accept the payment service's payment events"""
+    import uvicorn
+    from fastapi import FastAPI, Response
+
+    stub = FastAPI()
+
+    @stub.post("/v1/events/payments")
+    async def payment_recorded():
+        return Response(status_code=204)
+
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+def start_service(service_dir: Path, port: int, stub_url: str, workdir: str):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        DATABASE_URL=f"sqlite:///{workdir}/payment-{port}.db",
+        BILLING_SERVICE_URL=stub_url
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "error"],
+        cwd=service_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"payment service in {service_dir} did not start")
+
+async def fire(client: httpx.AsyncClient, key: str, bill_id: int, duplicates: int):
+    """Send `duplicates` identical payments at once; (status counts, payment IDs, seconds)"""
+    async def send():
+        try:
+            response = await client.post(
+                "/v1/payments",
+                json={"bill_id": bill_id, "amount": 105.0, "method": "CARD"},
+                headers={"Idempotency-Key": key}
+            )
+        except httpx.HTTPError as e:
+            return type(e).__name__, None
+        payment_id = response.json()["payment_id"] if response.status_code == 201 else None
+        return response.status_code, payment_id
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send() for _ in range(duplicates)))
+    elapsed = time.perf_counter() - started
+    return Counter(status for status, _ in results), {p for _, p in results if p is not None}, elapsed
+
+async def run_keys(base_url: str, args) -> bool:
+    limits = httpx.Limits(max_connections=args.duplicates, max_keepalive_connections=args.duplicates)
+    ok = True
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        print(f"{'key':>6}{'seconds':>10}{'201':>7}{'other':>7}{'payment IDs':>13}{'rows':>6}")
+        for n in range(1, args.keys + 1):
+            # Fresh connections per key: idle keep-alive connections the server has
+            # closed meanwhile would fail as ReadError, which is not what is tested
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as burst:
+                statuses, payment_ids, elapsed = await fire(burst, f"stress-{n}", n, args.duplicates)
+            try:
+                rows = len((await client.get("/v1/payments", params={"bill_id": n})).json())
+            except httpx.HTTPError:
+                rows = "?"
+            other = sum(count for status, count in statuses.items() if status != 201)
+            print(f"{n:>6}{elapsed:>10.2f}{statuses[201]:>7}{other:>7}{len(payment_ids):>13}{rows:>6}")
+            if other:
+                print(f"        non-201 responses: {dict((s, c) for s, c in statuses.items() if s != 201)}")
+            ok = ok and not other and len(payment_ids) == 1 and rows == 1
+        try:
+            stats = await client.get("/v1/metrics/idempotency")
+            if stats.status_code == 200:
+                print(f"idempotency cache: {stats.json()}")
+        except httpx.HTTPError:
+            pass
+    return ok
+
+def run_service(label: str, service_dir: Path, args, stub_url: str, workdir: str) -> bool:
+    port = free_port()
+    process = start_service(service_dir, port, stub_url, workdir)
+    print(f"\n== {label} ==")
+    try:
+        ok = asyncio.run(run_keys(f"http://127.0.0.1:{port}", args))
+    finally:
+        process.kill()
+        process.wait()
+    print("PASS" if ok else "FAIL")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duplicates", type=int, default=1000, help="concurrent requests per key")
+    parser.add_argument("--keys", type=int, default=5)
+    parser.add_argument("--baseline-ref", help="git revision to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hms-idempotency-")
+    stub_port = free_port()
+    server, thread = start_stub_billing(stub_port)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    print(f"{args.duplicates} concurrent duplicates per key, {args.keys} keys")
+
+    try:
+        if args.baseline_ref:
+            worktree = Path(workdir) / "baseline"
+            subprocess.run(
+                ["git", "worktree", "add", "--detach", str(worktree), args.baseline_ref],
+                cwd=PROJECT_ROOT, check=True, stdout=subprocess.DEVNULL
+            )
+            try:
+                run_service(f"baseline ({args.baseline_ref})", worktree / "payment-service", args, stub_url, workdir)
+            finally:
+                subprocess.run(
+                    ["git", "worktree", "remove", "--force", str(worktree)],
+                    cwd=PROJECT_ROOT, check=False
+                )
+        ok = run_service("current", SERVICE_DIR, args, stub_url, workdir)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())